@@ -9,23 +9,24 @@ from datetime import datetime, timedelta
 import sqlalchemy
 from jinja2 import Template
 import jinja2.sandbox
-from flask import Flask, request, render_template, session, send_file, g
+from flask import Flask, request, render_template, session, send_file, g, Response
 from flask_cors import CORS
 from icmplib import ping, traceroute
-from flask.json.provider import DefaultJSONProvider
 from itertools import islice
 
-from sqlalchemy import RowMapping
-
 from modules.Utilities import (
     RegexMatch, StringToBoolean,
     ValidateIPAddressesWithRange, ValidateDNSAddress,
-    GenerateWireguardPublicKey, GenerateWireguardPrivateKey,
+    GenerateWireguardPublicKey, GenerateWireguardPrivateKey, GenerateWireguardKeyPairs,
     IsIPInSubnet
 )
 from packaging import version
 from modules.Email import EmailSender
 from modules.DashboardLogger import DashboardLogger
+from modules.DashboardEvents import DashboardEvents
+from modules.DashboardJSONProvider import DashboardJSONProvider
+from modules.ResponseCompression import ResponseCompression
+from modules.TrackingTableExport import TrackingTableExport
 from modules.PeerJob import PeerJob
 from modules.SystemStatus import SystemStatus
 from modules.PeerShareLinks import PeerShareLinks
@@ -33,6 +34,7 @@ from modules.PeerJobs import PeerJobs
 from modules.DashboardConfig import DashboardConfig
 from modules.WireguardConfiguration import WireguardConfiguration
 from modules.AmneziaWireguardConfiguration import AmneziaWireguardConfiguration
+from modules.ConfigurationRegistry import ConfigurationRegistry
 
 from client import createClientBlueprint
 
@@ -43,21 +45,6 @@ from modules.DashboardPlugins import DashboardPlugins
 from modules.DashboardWebHooks import DashboardWebHooks
 from modules.NewConfigurationTemplates import NewConfigurationTemplates
 
-class CustomJsonEncoder(DefaultJSONProvider):
-    def __init__(self, app):
-        super().__init__(app)
-
-    def default(self, o):
-        if callable(getattr(o, "toJson", None)):
-            return o.toJson()
-        if type(o) is RowMapping:
-            return dict(o)
-        if type(o) is datetime:
-            return o.strftime("%Y-%m-%d %H:%M:%S")
-        return super().default(o)
-
-
-
 '''
 Response Object
 '''
@@ -71,6 +58,25 @@ def ResponseObject(status=True, message=None, data=None, status_code = 200) -> F
     response.content_type = "application/json"
     return response
 
+# Changes every start, so tags issued by a previous process never match
+ETAG_SALT = uuid4().hex[:8]
+
+def ConditionalResponseObject(tag: str, build) -> Flask.response_class:
+    """
+    Answer 304 Not Modified when the client already holds this version, otherwise build the response
+    @param tag: Changes whenever the response would change, e.g. built from configuration versions
+    @param build: Callable returning the full response
+    """
+    etag = f"{ETAG_SALT}-{hashlib.sha1(tag.encode()).hexdigest()[:16]}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag, weak=True)
+    # Let browsers keep the body but revalidate it on every poll
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 '''
 Flask App
 '''
@@ -90,19 +96,35 @@ def peerInformationBackgroundThread():
             try:
                 with _wireguard_config_lock:
                     curKeys = list(WireguardConfigurations.keys())
-                    configs_snapshot = {k: v for k, v in WireguardConfigurations.items() if v is not None}
+                interfaces = psutil.net_if_addrs().keys()
+                configs_snapshot = {}
+                for name in curKeys:
+                    # A stopped configuration nobody opened yet has no traffic to record
+                    if name in interfaces or WireguardConfigurations.isLoaded(name):
+                        c = WireguardConfigurations.get(name)
+                        if c is not None:
+                            configs_snapshot[name] = c
                 for name in curKeys:
                     if name in configs_snapshot:
                         c = configs_snapshot.get(name)
                         if c.getStatus():
-                            c.updatePeersData()
-                            c.getPeers()
+                            version = c.Version
+                            transitions = c.updatePeersData()
+                            if transitions:
+                                DashboardEvents.publish("peerStatus", {
+                                    "configuration": name, "peers": transitions
+                                }, configuration=name)
+                            changes = c.getPeerChanges(version)
+                            if changes and changes["peers"]:
+                                AllPeerJobs.runPeerJobs(name, [p.id for p in changes["peers"]])
+                            if c.configurationFileChanged(update=False):
+                                c.getPeers()
                             if delay == 6:
                                 if c.configurationInfo.PeerTrafficTracking:
                                     c.logPeersTraffic()
+                                    c.rollupPeersTraffic()
                                 if c.configurationInfo.PeerHistoricalEndpointTracking:
                                     c.logPeersHistoryEndpoint()
-                            c.getRestrictedPeersList()
             except Exception as e:
                 app.logger.exception(f"[WGDashboard] Background Thread #1 Error")
 
@@ -117,12 +139,18 @@ def peerJobScheduleBackgroundThread():
         app.logger.info(f"Background Thread #2 Started")
         app.logger.info(f"Background Thread #2 PID:" + str(threading.get_native_id()))
         _app_stop_event.wait(10)
+        nextFullScan = 0
         while not _app_stop_event.is_set():
             try:
-                AllPeerJobs.runJob()
-                _app_stop_event.wait(180)
+                if time.time() >= nextFullScan:
+                    AllPeerJobs.runJob()
+                    nextFullScan = time.time() + AllPeerJobs.FULL_SCAN_SECONDS
+                else:
+                    AllPeerJobs.runDueJobs()
+                AllPeerJobs.waitForNextJob(nextFullScan - time.time())
             except Exception as e:
                 app.logger.exception("Background Thread #2 Error")
+                _app_stop_event.wait(10)
 
 def gunicornConfig():
     _, app_ip = DashboardConfig.GetConfig("Server", "app_ip")
@@ -138,41 +166,55 @@ def ProtocolsEnabled() -> list[str]:
         protocols.append("wg")
     return protocols
 
+def ConfigurationLoader(name: str, configurationClass, startup: bool = False):
+    """
+    Build the function WireguardConfigurations calls to construct a configuration on first lookup
+    @param name: Configuration name
+    @param configurationClass: WireguardConfiguration or AmneziaWireguardConfiguration
+    @param startup: Bring the configuration up if it is set to autostart
+    """
+    def load():
+        try:
+            with app.app_context():
+                return configurationClass(DashboardConfig, AllPeerJobs, AllPeerShareLinks, DashboardWebHooks, name, startup=startup)
+        except WireguardConfiguration.InvalidConfigurationFileException as e:
+            app.logger.error(f"{name} have an invalid configuration file.")
+            return None
+    return load
+
 def InitWireguardConfigurationsList(startup: bool = False, force: bool = False):
+    """
+    Register every configuration file, they are constructed when first looked up.
+    At startup, configurations that are running or set to autostart are constructed right away in a thread pool.
+    """
     global _last_reload_time
     if not startup and not force:
         if time.time() - _last_reload_time < _reload_interval:
             return
     _last_reload_time = time.time()
+    protocols = []
     if os.path.exists(DashboardConfig.GetConfig("Server", "wg_conf_path")[1]):
-        confs = os.listdir(DashboardConfig.GetConfig("Server", "wg_conf_path")[1])
-        confs.sort()
-        for i in confs:
-            if RegexMatch("^(.{1,}).(conf)$", i):
-                i = i.replace('.conf', '')
-                try:
-                    with _wireguard_config_lock:
-                        needs_reload = i not in WireguardConfigurations or WireguardConfigurations[i].configurationFileChanged()
-                        if needs_reload:
-                            with app.app_context():
-                                WireguardConfigurations[i] = WireguardConfiguration(DashboardConfig, AllPeerJobs, AllPeerShareLinks, DashboardWebHooks, i, startup=startup)
-                except WireguardConfiguration.InvalidConfigurationFileException as e:
-                    app.logger.error(f"{i} have an invalid configuration file.")
-
+        protocols.append(("wg_conf_path", WireguardConfiguration))
     if "awg" in ProtocolsEnabled():
-        confs = os.listdir(DashboardConfig.GetConfig("Server", "awg_conf_path")[1])
+        protocols.append(("awg_conf_path", AmneziaWireguardConfiguration))
+    for path, configurationClass in protocols:
+        confPath = DashboardConfig.GetConfig("Server", path)[1]
+        confs = os.listdir(confPath)
         confs.sort()
         for i in confs:
             if RegexMatch("^(.{1,}).(conf)$", i):
+                modifiedTime = os.path.getmtime(os.path.join(confPath, i))
                 i = i.replace('.conf', '')
-                try:
-                    with _wireguard_config_lock:
-                        needs_reload = i not in WireguardConfigurations or WireguardConfigurations[i].configurationFileChanged()
-                        if needs_reload:
-                            with app.app_context():
-                                WireguardConfigurations[i] = AmneziaWireguardConfiguration(DashboardConfig, AllPeerJobs, AllPeerShareLinks, DashboardWebHooks, i, startup=startup)
-                except WireguardConfiguration.InvalidConfigurationFileException as e:
-                    app.logger.error(f"{i} have an invalid configuration file.")
+                with _wireguard_config_lock:
+                    needs_reload = i not in WireguardConfigurations or (
+                            WireguardConfigurations.isLoaded(i) and WireguardConfigurations[i].configurationFileChanged())
+                    if needs_reload:
+                        # A file that failed to load is only tried again once it changes
+                        WireguardConfigurations.setLoader(i, ConfigurationLoader(i, configurationClass, startup), modifiedTime)
+    if startup:
+        _, autostart = DashboardConfig.GetConfig("WireGuardConfiguration", "autostart")
+        interfaces = psutil.net_if_addrs().keys()
+        WireguardConfigurations.load([i for i in WireguardConfigurations.keys() if i in autostart or i in interfaces])
 
 def startPeerPanelThread():
     _, peer_panel_enable = DashboardConfig.GetConfig("PeerPanel", "peer_panel_enable")
@@ -193,7 +235,8 @@ def startPeerPanelThread():
         # Ensure peer_app has necessary context
         peer_app.config['WGD'] = WireguardConfigurations
         peer_app.config['AllPeerJobs'] = AllPeerJobs
-        peer_app.json = CustomJsonEncoder(peer_app)
+        peer_app.json = DashboardJSONProvider(peer_app)
+        ResponseCompression(peer_app)
         if 'peer_panel' not in peer_app.blueprints:
             peer_app.register_blueprint(peer_panel)
         peer_app.run(host=peer_panel_bind_address, port=int(peer_panel_port), debug=False, use_reloader=False)
@@ -219,7 +262,7 @@ dictConfig({
 })
 
 
-WireguardConfigurations: dict[str, WireguardConfiguration] = {}
+WireguardConfigurations: ConfigurationRegistry = ConfigurationRegistry()
 _wireguard_config_lock = threading.RLock()
 _app_stop_event = threading.Event()
 _last_reload_time = 0
@@ -227,7 +270,16 @@ _reload_interval = 5
 
 def _on_app_shutdown():
     _app_stop_event.set()
+    if 'AllPeerJobs' in globals():
+        globals()['AllPeerJobs'].stop()
     flush_usage_on_shutdown()
+    try:
+        if not isinstance(globals()['DashboardLogger'], type):
+            globals()['DashboardLogger'].stop()
+        if 'AllPeerJobs' in globals():
+            globals()['AllPeerJobs'].JobLogger.stop()
+    except Exception as e:
+        app.logger.error(f"Error flushing logs: {e}")
     try:
         from modules.SystemStatus import SystemStatus as SSClass
         if 'SystemStatus' in globals() and not isinstance(globals()['SystemStatus'], type):
@@ -244,7 +296,7 @@ def flush_usage_on_shutdown():
     with _wireguard_config_lock:
         # Create a copy of keys to avoid modification during iteration
         for name in list(WireguardConfigurations.keys()):
-            config = WireguardConfigurations[name]
+            config = WireguardConfigurations.get(name)
             if config and config.getStatus():
                 try:
                     config.updatePeersData()
@@ -262,7 +314,8 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 5206928
 with app.app_context():
     DashboardConfig = DashboardConfig()
 app.secret_key = DashboardConfig.GetConfig("Server", "secret_key")[1]
-app.json = CustomJsonEncoder(app)
+app.json = DashboardJSONProvider(app)
+ResponseCompression(app)
 app.config['WGD'] = WireguardConfigurations
 with app.app_context():
     SystemStatus = SystemStatus()
@@ -270,6 +323,7 @@ with app.app_context():
     AllPeerShareLinks: PeerShareLinks = PeerShareLinks(DashboardConfig, WireguardConfigurations)
     AllPeerJobs: PeerJobs = PeerJobs(DashboardConfig, WireguardConfigurations, AllPeerShareLinks)
     DashboardLogger: DashboardLogger = DashboardLogger()
+    DashboardEvents: DashboardEvents = DashboardEvents(dumps=app.json.dumps)
     DashboardPlugins: DashboardPlugins = DashboardPlugins(app, WireguardConfigurations)
     DashboardWebHooks: DashboardWebHooks = DashboardWebHooks(DashboardConfig)
     NewConfigurationTemplates: NewConfigurationTemplates = NewConfigurationTemplates()
@@ -305,14 +359,14 @@ def auth_req():
         return ResponseObject(True)        
 
     g.api_accessed = False    
-    authenticationRequired = DashboardConfig.GetConfig("Server", "auth_req")[1]
-    if authenticationRequired:
+    config = DashboardConfig.Snapshot
+    if config.AuthRequired:
         headers = request.headers
         apiKey = headers.get('wg-dashboard-apikey')
-        apiKeyEnabled = DashboardConfig.GetConfig("Server", "dashboard_api_key")[1]
+        apiKeyEnabled = config.APIKeyEnabled
         
         if apiKey and apiKeyEnabled:
-            apiKeyExist = any(x.Key == apiKey for x in DashboardConfig.DashboardAPIKeys)
+            apiKeyExist = DashboardConfig.verifyAPIKey(apiKey)
             DashboardLogger.log(str(request.url), str(request.remote_addr), Message=f"API Key Access: {('true' if apiKeyExist else 'false')} - Key: {apiKey}")
             if not apiKeyExist:
                 response = ResponseObject(False, "API Key does not exist", status_code=401)
@@ -354,7 +408,7 @@ def API_Handshake():
 @app.get(f'{APP_PREFIX}/api/validateAuthentication')
 def API_ValidateAuthentication():
     token = request.cookies.get("authToken")
-    if DashboardConfig.GetConfig("Server", "auth_req")[1]:
+    if DashboardConfig.Snapshot.AuthRequired:
         if token is None or token == "" or "username" not in session or session["username"] != token:
             return ResponseObject(False, "Invalid authentication.")
     return ResponseObject(True)
@@ -414,7 +468,8 @@ def API_getWireguardConfigurations():
     InitWireguardConfigurationsList()
     with _wireguard_config_lock:
         data = [wc for wc in WireguardConfigurations.values()]
-    return ResponseObject(data=data)
+    tag = ";".join(f"{wc.Name}:{wc.Epoch}:{wc.Version}:{wc.getStatus()}" for wc in data)
+    return ConditionalResponseObject(tag, lambda: ResponseObject(data=data))
 
 @app.get(f'{APP_PREFIX}/api/newConfigurationTemplates')
 def API_NewConfigurationTemplates():
@@ -522,11 +577,11 @@ def API_addWireguardConfiguration():
 @app.get(f'{APP_PREFIX}/api/toggleWireguardConfiguration')
 def API_toggleWireguardConfiguration():
     configurationName = request.args.get('configurationName')
-    if configurationName is None or len(
-            configurationName) == 0 or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Please provide a valid configuration name", status_code=404)
-    toggleStatus, msg = WireguardConfigurations[configurationName].toggleConfiguration()
-    return ResponseObject(toggleStatus, msg, WireguardConfigurations[configurationName].Status)
+    toggleStatus, msg = configuration.toggleConfiguration()
+    return ResponseObject(toggleStatus, msg, configuration.Status)
 
 @app.post(f'{APP_PREFIX}/api/updateWireguardConfiguration')
 def API_updateWireguardConfiguration():
@@ -536,12 +591,13 @@ def API_updateWireguardConfiguration():
         if i not in data.keys():
             return ResponseObject(False, "Please provide these following field: " + ", ".join(requiredKeys))
     name = data.get("Name")
-    if name not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(name)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     
-    status, msg = WireguardConfigurations[name].updateConfigurationSettings(data)
+    status, msg = configuration.updateConfigurationSettings(data)
     
-    return ResponseObject(status, message=msg, data=WireguardConfigurations[name])
+    return ResponseObject(status, message=msg, data=configuration)
 
 @app.post(f'{APP_PREFIX}/api/updateWireguardConfigurationInfo')
 def API_updateWireguardConfigurationInfo():
@@ -551,23 +607,24 @@ def API_updateWireguardConfigurationInfo():
     value = data.get('Value')
     if not all([data, key, name]):
         return ResponseObject(status=False, message="Please provide configuration name, key and value")
-    if name not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(name)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     
-    status, msg, key = WireguardConfigurations[name].updateConfigurationInfo(key, value)
+    status, msg, key = configuration.updateConfigurationInfo(key, value)
     
     return ResponseObject(status=status, message=msg, data=key)
 
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationRawFile')
 def API_GetWireguardConfigurationRawFile():
     configurationName = request.args.get('configurationName')
-    if configurationName is None or len(
-            configurationName) == 0 or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Please provide a valid configuration name", status_code=404)
     
     return ResponseObject(data={
-        "path": WireguardConfigurations[configurationName].configPath,
-        "content": WireguardConfigurations[configurationName].getRawConfigurationFile()
+        "path": configuration.configPath,
+        "content": configuration.getRawConfigurationFile()
     })
 
 @app.post(f'{APP_PREFIX}/api/updateWireguardConfigurationRawFile')
@@ -575,13 +632,13 @@ def API_UpdateWireguardConfigurationRawFile():
     data = request.get_json()
     configurationName = data.get('configurationName')
     rawConfiguration = data.get('rawConfiguration')
-    if configurationName is None or len(
-            configurationName) == 0 or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Please provide a valid configuration name")
     if rawConfiguration is None or len(rawConfiguration) == 0:
         return ResponseObject(False, "Please provide content")
     
-    status, err = WireguardConfigurations[configurationName].updateRawConfigurationFile(rawConfiguration)
+    status, err = configuration.updateRawConfigurationFile(rawConfiguration)
 
     return ResponseObject(status=status, message=err)
 
@@ -630,16 +687,18 @@ def API_renameWireguardConfiguration():
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationRealtimeTraffic')
 def API_getWireguardConfigurationRealtimeTraffic():
     configurationName = request.args.get('configurationName')
-    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
-    return ResponseObject(data=WireguardConfigurations[configurationName].getRealtimeTrafficUsage())
+    return ResponseObject(data=configuration.getRealtimeTrafficUsage())
 
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackup')
 def API_getWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
-    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist",  status_code=404)
-    return ResponseObject(data=WireguardConfigurations[configurationName].getBackups())
+    return ResponseObject(data=configuration.getBackups())
 
 @app.get(f'{APP_PREFIX}/api/getAllWireguardConfigurationBackup')
 def API_getAllWireguardConfigurationBackup():
@@ -650,9 +709,12 @@ def API_getAllWireguardConfigurationBackup():
     with _wireguard_config_lock:
         existingConfiguration = list(WireguardConfigurations.keys())
         for i in existingConfiguration:
-            b = WireguardConfigurations[i].getBackups(True)
+            configuration = WireguardConfigurations.get(i)
+            if configuration is None:
+                continue
+            b = configuration.getBackups(True)
             if len(b) > 0:
-                data['ExistingConfigurations'][i] = WireguardConfigurations[i].getBackups(True)
+                data['ExistingConfigurations'][i] = b
             
     for protocol in ProtocolsEnabled():
         directory = os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup')
@@ -691,10 +753,11 @@ def API_getAllWireguardConfigurationBackup():
 @app.get(f'{APP_PREFIX}/api/createWireguardConfigurationBackup')
 def API_createWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
-    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist",  status_code=404)
-    return ResponseObject(status=WireguardConfigurations[configurationName].backupConfigurationFile()[0], 
-                          data=WireguardConfigurations[configurationName].getBackups())
+    return ResponseObject(status=configuration.backupConfigurationFile()[0], 
+                          data=configuration.getBackups())
 
 @app.post(f'{APP_PREFIX}/api/deleteWireguardConfigurationBackup')
 def API_deleteWireguardConfigurationBackup():
@@ -707,10 +770,11 @@ def API_deleteWireguardConfigurationBackup():
         "Please provide configurationName and backupFileName in body",  status_code=400)
     configurationName = data['ConfigurationName']
     backupFileName = data['BackupFileName']
-    if configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     
-    status = WireguardConfigurations[configurationName].deleteBackup(backupFileName)
+    status = configuration.deleteBackup(backupFileName)
     return ResponseObject(status=status, message=(None if status else 'Backup file does not exist'), 
                           status_code = (200 if status else 404))
 
@@ -718,9 +782,10 @@ def API_deleteWireguardConfigurationBackup():
 def API_downloadWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
     backupFileName = request.args.get('backupFileName')
-    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
-    status, zip = WireguardConfigurations[configurationName].downloadBackup(backupFileName)
+    status, zip = configuration.downloadBackup(backupFileName)
     return ResponseObject(status, data=zip, status_code=(200 if status else 404))
 
 @app.post(f'{APP_PREFIX}/api/restoreWireguardConfigurationBackup')
@@ -734,10 +799,11 @@ def API_restoreWireguardConfigurationBackup():
                               "Please provide ConfigurationName and BackupFileName in body", status_code=400)
     configurationName = data['ConfigurationName']
     backupFileName = data['BackupFileName']
-    if configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     
-    status = WireguardConfigurations[configurationName].restoreBackup(backupFileName)
+    status = configuration.restoreBackup(backupFileName)
     return ResponseObject(status=status, message=(None if status else 'Restore backup failed'))
     
 @app.get(f'{APP_PREFIX}/api/getDashboardConfiguration')
@@ -785,7 +851,7 @@ def API_newDashboardAPIKey():
 def API_deleteDashboardAPIKey():
     data = request.get_json()
     if DashboardConfig.GetConfig('Server', 'dashboard_api_key'):
-        if len(data['Key']) > 0 and len(list(filter(lambda x : x.Key == data['Key'], DashboardConfig.DashboardAPIKeys))) > 0:
+        if len(data['Key']) > 0 and DashboardConfig.verifyAPIKey(data['Key']):
             DashboardConfig.deleteAPIKey(data['Key'])
             return ResponseObject(True, data=DashboardConfig.DashboardAPIKeys)
         else:
@@ -796,7 +862,8 @@ def API_deleteDashboardAPIKey():
 def API_updatePeerSettings(configName):
     data = request.get_json()
     id = data['id']
-    if len(id) > 0 and configName in WireguardConfigurations.keys():
+    wireguardConfig = WireguardConfigurations.get(configName)
+    if len(id) > 0 and wireguardConfig is not None:
         name = data['name']
         private_key = data['private_key']
         dns_addresses = data['DNS']
@@ -805,7 +872,6 @@ def API_updatePeerSettings(configName):
         preshared_key = data['preshared_key']
         mtu = data['mtu']
         keepalive = data['keepalive']
-        wireguardConfig = WireguardConfigurations[configName]
         foundPeer, peer = wireguardConfig.searchPeer(id)
         if foundPeer:
             if wireguardConfig.Protocol == 'wg':
@@ -828,9 +894,9 @@ def API_resetPeerData(configName):
     data = request.get_json()
     id = data['id']
     type = data['type']
-    if len(id) == 0 or configName not in WireguardConfigurations.keys():
-        return ResponseObject(False, "Configuration/Peer does not exist")
     wgc = WireguardConfigurations.get(configName)
+    if len(id) == 0 or wgc is None:
+        return ResponseObject(False, "Configuration/Peer does not exist")
     foundPeer, peer = wgc.searchPeer(id)
     if not foundPeer:
         return ResponseObject(False, "Configuration/Peer does not exist")
@@ -846,10 +912,10 @@ def API_resetPeerData(configName):
 def API_deletePeers(configName: str) -> ResponseObject:
     data = request.get_json()
     peers = data['peers']
-    if configName in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is not None:
         if len(peers) == 0:
             return ResponseObject(False, "Please specify one or more peers", status_code=400)
-        configuration = WireguardConfigurations.get(configName)
         status, msg = configuration.deletePeers(peers, AllPeerJobs, AllPeerShareLinks)
         
         # Delete Assignment
@@ -867,10 +933,10 @@ def API_deletePeers(configName: str) -> ResponseObject:
 def API_restrictPeers(configName: str) -> ResponseObject:
     data = request.get_json()
     peers = data['peers']
-    if configName in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is not None:
         if len(peers) == 0:
             return ResponseObject(False, "Please specify one or more peers")
-        configuration = WireguardConfigurations.get(configName)
         status, msg = configuration.restrictPeers(peers)
         return ResponseObject(status, msg)
     return ResponseObject(False, "Configuration does not exist", status_code=404)
@@ -921,9 +987,9 @@ def API_sharePeer_get():
     if len(link) == 0:
         return ResponseObject(False, "This link is either expired to invalid")
     l = link[0]
-    if l.Configuration not in WireguardConfigurations.keys():
-        return ResponseObject(False, "The peer you're looking for does not exist")
     c = WireguardConfigurations.get(l.Configuration)
+    if c is None:
+        return ResponseObject(False, "The peer you're looking for does not exist")
     fp, p = c.searchPeer(l.Peer)
     if not fp:
         return ResponseObject(False, "The peer you're looking for does not exist")
@@ -934,17 +1000,18 @@ def API_sharePeer_get():
 def API_allowAccessPeers(configName: str) -> ResponseObject:
     data = request.get_json()
     peers = data['peers']
-    if configName in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is not None:
         if len(peers) == 0:
             return ResponseObject(False, "Please specify one or more peers")
-        configuration = WireguardConfigurations.get(configName)
         status, msg = configuration.allowAccessPeers(peers)
         return ResponseObject(status, msg)
     return ResponseObject(False, "Configuration does not exist")
 
 @app.post(f'{APP_PREFIX}/api/addPeers/<configName>')
 def API_addPeers(configName):
-    if configName in WireguardConfigurations.keys():
+    config = WireguardConfigurations.get(configName)
+    if config is not None:
         data: dict = request.get_json()
         try:
             
@@ -984,7 +1051,6 @@ def API_addPeers(configName):
                 else:
                     keep_alive = 0
             
-            config = WireguardConfigurations.get(configName)
             if not config.getStatus():
                 config.toggleConfiguration()
             ipStatus, availableIps = config.getAvailableIP(-1)
@@ -1004,13 +1070,16 @@ def API_addPeers(configName):
                             f"The maximum number of peers can add is {sum(list(numberOfAvailableIPs.values()))}")
                 keyPairs = []
                 addedCount = 0
+                keyStatus, generatedKeys = GenerateWireguardKeyPairs(bulkAddAmount)
+                if not keyStatus:
+                    return ResponseObject(False, "Generating key pairs by bulk failed")
                 for subnet in availableIps.keys():
                     for ip in availableIps[subnet]:
-                        newPrivateKey = GenerateWireguardPrivateKey()[1]
+                        newPrivateKey, newPublicKey = generatedKeys[addedCount]
                         addedCount += 1
                         keyPairs.append({
                             "private_key": newPrivateKey,
-                            "id": GenerateWireguardPublicKey(newPrivateKey)[1],
+                            "id": newPublicKey,
                             "preshared_key": (GenerateWireguardPrivateKey()[1] if preshared_key_bulkAdd else ""),
                             "allowed_ip": ip,
                             "name": f"BulkPeer_{(addedCount + 1)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
@@ -1092,9 +1161,9 @@ def API_addPeers(configName):
 @app.get(f"{APP_PREFIX}/api/downloadPeer/<configName>")
 def API_downloadPeer(configName):
     data = request.args
-    if configName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist")
-    configuration = WireguardConfigurations[configName]
     peerFound, peer = configuration.searchPeer(data['id'])
     if len(data['id']) == 0 or not peerFound:
         return ResponseObject(False, "Peer does not exist")
@@ -1102,9 +1171,9 @@ def API_downloadPeer(configName):
 
 @app.get(f"{APP_PREFIX}/api/downloadAllPeers/<configName>")
 def API_downloadAllPeers(configName):
-    if configName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist")
-    configuration = WireguardConfigurations[configName]
     peerData = []
     untitledPeer = 0
     for i in configuration.Peers:
@@ -1117,16 +1186,18 @@ def API_downloadAllPeers(configName):
 
 @app.get(f"{APP_PREFIX}/api/getAvailableIPs/<configName>")
 def API_getAvailableIPs(configName):
-    if configName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist")
-    status, ips = WireguardConfigurations.get(configName).getAvailableIP()
+    status, ips = configuration.getAvailableIP()
     return ResponseObject(status=status, data=ips)
 
 @app.get(f"{APP_PREFIX}/api/getNumberOfAvailableIPs/<configName>")
 def API_getNumberOfAvailableIPs(configName):
-    if configName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configName)
+    if configuration is None:
         return ResponseObject(False, "Configuration does not exist")
-    status, ips = WireguardConfigurations.get(configName).getNumberOfAvailableIP()
+    status, ips = configuration.getNumberOfAvailableIP()
     return ResponseObject(status=status, data=ips)
 
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationInfo')
@@ -1134,30 +1205,85 @@ def API_getConfigurationInfo():
     configurationName = request.args.get("configurationName")
     limit = request.args.get("limit", type=int)
     offset = request.args.get("offset", type=int, default=0)
+    search = request.args.get("search")
+    sort = request.args.get("sort")
+    status = request.args.get("status")
+    cursor = request.args.get("cursor")
+    descending = request.args.get("order", "asc") == "desc"
     
-    if not configurationName or configurationName not in WireguardConfigurations.keys():
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
         return ResponseObject(False, "Please provide configuration name")
-    
-    peers = WireguardConfigurations[configurationName].getPeersList()
-    restricted_peers = WireguardConfigurations[configurationName].getRestrictedPeersList()
-    
-    if limit is not None:
-        # Apply pagination if limit is provided
-        paged_peers = peers[offset:offset+limit]
-        # Only return restricted peers if we haven't exhausted the limit yet
-        # (This is a simplified approach to keep API compatibility)
-        paged_restricted = restricted_peers[max(0, offset-len(peers)) : max(0, offset+limit-len(peers))]
-    else:
-        # Backward compatibility: return full lists if no limit provided
-        paged_peers = peers
-        paged_restricted = restricted_peers
+    return ConditionalResponseObject(
+        f"{configuration.Name}:{configuration.Epoch}:{configuration.Version}:{configuration.handshakeAgeBucket()}:"
+        f"{configuration.getStatus()}:{request.query_string.decode()}",
+        lambda: ConfigurationInfoResponse(configuration, limit, offset, search, sort, descending, status, cursor)
+    )
+
+def ConfigurationInfoResponse(configuration: WireguardConfiguration, limit: int | None, offset: int,
+                              search: str | None, sort: str | None, descending: bool,
+                              status: str | None, cursor: str | None) -> Flask.response_class:
+    if limit is None and not any([search, sort, status, cursor]):
+        # Backward compatibility: return full lists if no limit, filter or sort is provided
+        peers = configuration.getPeersList()
+        restricted_peers = configuration.getRestrictedPeersList()
+        return ResponseObject(data={
+            "configurationInfo": configuration,
+            "configurationPeers": peers,
+            "configurationRestrictedPeers": restricted_peers,
+            "totalPeers": len(peers),
+            "totalRestrictedPeers": len(restricted_peers)
+        })
+
+    if limit is None or limit < 1:
+        limit = 50
+    try:
+        result = configuration.queryPeers(
+            search=search, status=status, sort=sort or "name",
+            descending=descending,
+            limit=min(limit, 1000), cursor=cursor, offset=max(offset, 0)
+        )
+    except ValueError as e:
+        return ResponseObject(False, str(e))
+
+    return ResponseObject(data={
+        "configurationInfo": configuration,
+        "configurationPeers": result["peers"],
+        "configurationRestrictedPeers": result["restrictedPeers"],
+        "totalPeers": result["totalPeers"],
+        "totalRestrictedPeers": result["totalRestrictedPeers"],
+        "nextCursor": result["nextCursor"]
+    })
 
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationInfo/changes')
+def API_getConfigurationInfoChanges():
+    configurationName = request.args.get("configurationName")
+    since = request.args.get("since", "")
+    configuration = WireguardConfigurations.get(configurationName) if configurationName else None
+    if configuration is None:
+        return ResponseObject(False, "Please provide configuration name")
+    version = configuration.Version
+    changes = None
+    # Cursors look like <epoch>.<version>, ones from another instance of the configuration need a full sync
+    epoch, _, sinceVersion = since.partition(".")
+    if epoch == configuration.Epoch and sinceVersion.isdigit():
+        changes = configuration.getPeerChanges(int(sinceVersion))
+    if changes is None:
+        return ResponseObject(data={
+            "cursor": f"{configuration.Epoch}.{version}",
+            "full": True,
+            "configurationInfo": configuration,
+            "configurationPeers": configuration.getPeersList(),
+            "configurationRestrictedPeers": list(configuration.RestrictedPeerIndex.values()),
+            "removedPeers": []
+        })
     return ResponseObject(data={
-        "configurationInfo": WireguardConfigurations[configurationName],
-        "configurationPeers": paged_peers,
-        "configurationRestrictedPeers": paged_restricted,
-        "totalPeers": len(peers),
-        "totalRestrictedPeers": len(restricted_peers)
+        "cursor": f"{configuration.Epoch}.{version}",
+        "full": False,
+        "configurationInfo": configuration,
+        "configurationPeers": changes["peers"],
+        "configurationRestrictedPeers": changes["restrictedPeers"],
+        "removedPeers": changes["removedPeers"]
     })
 
 @app.get(f'{APP_PREFIX}/api/getPeerHistoricalEndpoints')
@@ -1166,7 +1292,10 @@ def API_GetPeerHistoricalEndpoints():
     id = request.args.get('id')
     if not configurationName or not id:
         return ResponseObject(False, "Please provide configurationName and id")
-    fp, p = WireguardConfigurations.get(configurationName).searchPeer(id)
+    configuration = WireguardConfigurations.get(configurationName)
+    if configuration is None:
+        return ResponseObject(False, "Configuration does not exist")
+    fp, p = configuration.searchPeer(id)
     if fp:
         result = p.getEndpoints()
         geo = {}
@@ -1205,7 +1334,10 @@ def API_GetPeerSessions():
         return ResponseObject(False, "Dates are invalid")
     if not configurationName or not id:
         return ResponseObject(False, "Please provide configurationName and id")
-    fp, p = WireguardConfigurations.get(configurationName).searchPeer(id)
+    configuration = WireguardConfigurations.get(configurationName)
+    if configuration is None:
+        return ResponseObject(False, "Configuration does not exist")
+    fp, p = configuration.searchPeer(id)
     if fp:
         return ResponseObject(data=p.getSessions(startDate, endDate))
     return ResponseObject(False, "Peer does not exist")
@@ -1234,7 +1366,10 @@ def API_GetPeerTraffics():
         return ResponseObject(False, f"Dates are invalid: {str(e)}")
     if not configurationName or not id:
         return ResponseObject(False, "Please provide configurationName and id")
-    fp, p = WireguardConfigurations.get(configurationName).searchPeer(id)
+    configuration = WireguardConfigurations.get(configurationName)
+    if configuration is None:
+        return ResponseObject(False, "Configuration does not exist")
+    fp, p = configuration.searchPeer(id)
     if fp:
         return ResponseObject(data=p.getTraffics(interval, startDate, endDate))
     return ResponseObject(False, "Peer does not exist")
@@ -1242,9 +1377,9 @@ def API_GetPeerTraffics():
 @app.get(f'{APP_PREFIX}/api/getPeerTrackingTableCounts')
 def API_GetPeerTrackingTableCounts():
     configurationName = request.args.get("configurationName")
-    if configurationName not in WireguardConfigurations.keys():
+    c = WireguardConfigurations.get(configurationName) if configurationName else None
+    if c is None:
         return ResponseObject(False, "Configuration does not exist")
-    c = WireguardConfigurations.get(configurationName)
     return ResponseObject(data={
         "TrafficTrackingTableSize": c.getTransferTableSize(),
         "HistoricalTrackingTableSize": c.getHistoricalEndpointTableSize()
@@ -1254,25 +1389,51 @@ def API_GetPeerTrackingTableCounts():
 def API_DownloadPeerTackingTable():
     configurationName = request.args.get("configurationName")
     table = request.args.get('table')
-    if configurationName not in WireguardConfigurations.keys():
+    c = WireguardConfigurations.get(configurationName) if configurationName else None
+    if c is None:
         return ResponseObject(False, "Configuration does not exist")
     if table not in ['TrafficTrackingTable', 'HistoricalTrackingTable']:
         return ResponseObject(False, "Table does not exist")
-    c = WireguardConfigurations.get(configurationName)
-    return ResponseObject(
-        data=c.downloadTransferTable() if table == 'TrafficTrackingTable' 
-        else c.downloadHistoricalEndpointTable())
+    exportFormat = request.args.get('format')
+    if not exportFormat:
+        return ResponseObject(
+            data=c.downloadTransferTable() if table == 'TrafficTrackingTable'
+            else c.downloadHistoricalEndpointTable())
+
+    try:
+        startDate = request.args.get('startDate')
+        endDate = request.args.get('endDate')
+        startDate = datetime.strptime(startDate, "%Y-%m-%d") if startDate else None
+        # The end date is inclusive
+        endDate = datetime.strptime(endDate, "%Y-%m-%d") + timedelta(days=1) if endDate else None
+    except ValueError as e:
+        return ResponseObject(False, f"Dates are invalid: {str(e)}")
+    peerIds = request.args.getlist('id')
+    if table == 'TrafficTrackingTable':
+        columns = c.peersTransferTable.columns.keys()
+        rows = c.streamTransferTable(peerIds, startDate, endDate)
+    else:
+        columns = c.peersHistoryEndpointTable.columns.keys()
+        rows = c.streamHistoricalEndpointTable(peerIds, startDate, endDate)
+    try:
+        export = TrackingTableExport(columns, rows, exportFormat,
+                                     compress=request.args.get('compress') == 'gzip', dumps=app.json.dumps)
+    except ValueError as e:
+        return ResponseObject(False, str(e))
+    return Response(export, mimetype=export.mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{export.filename(f"{configurationName}_{table}")}"'
+    })
 
 @app.post(f'{APP_PREFIX}/api/deletePeerTrackingTable')
 def API_DeletePeerTrackingTable():
     data = request.get_json()
     configurationName = data.get('configurationName')
     table = data.get('table')
-    if not configurationName or configurationName not in WireguardConfigurations.keys():
+    c = WireguardConfigurations.get(configurationName) if configurationName else None
+    if c is None:
         return ResponseObject(False, "Configuration does not exist")
     if not table or table not in ['TrafficTrackingTable', 'HistoricalTrackingTable']:
         return ResponseObject(False, "Table does not exist")
-    c = WireguardConfigurations.get(configurationName)
     return ResponseObject(
         status=c.deleteTransferTable() if table == 'TrafficTrackingTable'
         else c.deleteHistoryEndpointTable())
@@ -1614,11 +1775,10 @@ def API_Email_PreviewBody():
     subject = data.get('Subject', '')
     body = data.get('Body', '')
     
-    if ("ConfigurationName" not in data.keys() 
-            or "Peer" not in data.keys() or data.get('ConfigurationName') not in WireguardConfigurations.keys()):
+    configuration = WireguardConfigurations.get(data.get('ConfigurationName')) if data.get('ConfigurationName') else None
+    if "Peer" not in data.keys() or configuration is None:
         return ResponseObject(False, "Please specify configuration and peer")
     
-    configuration = WireguardConfigurations.get(data.get('ConfigurationName'))
     fp, p = configuration.searchPeer(data.get('Peer'))
     if not fp:
         return ResponseObject(False, "Peer does not exist")
@@ -1641,6 +1801,32 @@ def API_SystemStatus():
         app.logger.error(f"SystemStatus API error: {e}", exc_info=True)
         return ResponseObject(False, f"Error retrieving system status: {e}", status_code=500)
 
+def PublishSystemStatus(status: dict):
+    if not DashboardEvents.hasSubscribers():
+        return
+    DashboardEvents.publish("systemStatus", status)
+    interfaces = status.get("NetworkInterfaces", {})
+    for name in list(WireguardConfigurations.keys()):
+        if name in interfaces:
+            DashboardEvents.publish("realtimeTraffic", {
+                "configuration": name, **interfaces[name].get("realtime", {})
+            }, configuration=name)
+
+SystemStatus.addListener(PublishSystemStatus)
+
+@app.get(f'{APP_PREFIX}/api/events')
+def API_Events():
+    configurations = request.args.get("configurations")
+    subscription = DashboardEvents.subscribe(
+        set(configurations.split(",")) if configurations else None
+    )
+    if subscription is None:
+        return ResponseObject(False, "Too many open event streams", status_code=503)
+    return Response(DashboardEvents.stream(subscription, _app_stop_event), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.get(f'{APP_PREFIX}/api/protocolsEnabled')
 def API_ProtocolsEnabled():
     return ResponseObject(data=ProtocolsEnabled())
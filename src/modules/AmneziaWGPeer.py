@@ -11,9 +11,9 @@ from .Utilities import ValidateIPAddressesWithRange, ValidateDNSAddress, Generat
 
 
 class AmneziaWGPeer(Peer):
-    def __init__(self, tableData, configuration):
+    def loadTableData(self, tableData):
         self.advanced_security = tableData["advanced_security"]
-        super().__init__(tableData, configuration)
+        super().loadTableData(tableData)
 
 
     def updatePeer(self, name: str, private_key: str,
@@ -9,6 +9,7 @@ from .PeerShareLinks import PeerShareLinks
 from .Utilities import RegexMatch
 from .WireguardConfiguration import WireguardConfiguration
 from .DashboardWebHooks import DashboardWebHooks
+from .DatabaseMigrations import DatabaseMigrations
 from .WireguardCLI import WireguardCLI
 
 
@@ -69,71 +70,6 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
         if dbName is None:
             dbName = self.Name
 
-        # Check if we need to migrate from Float (GB) to BigInteger (Bytes)
-        inspector = sqlalchemy.inspect(self.engine)
-        needs_migration = False
-        migration_id = f'float_to_bigint_v1_{dbName}'
-        migration_applied = False
-
-        if inspector.has_table('wgd_migrations'):
-            with self.engine.connect() as conn:
-                res = conn.execute(sqlalchemy.text("SELECT id FROM wgd_migrations WHERE id = :id"), {"id": migration_id}).fetchone()
-                if res:
-                    migration_applied = True
-
-        if not migration_applied and inspector.has_table(dbName):
-            columns = inspector.get_columns(dbName)
-            for col in columns:
-                if col['name'] == 'total_receive' and isinstance(col['type'], sqlalchemy.Float):
-                    needs_migration = True
-                    break
-        
-        if needs_migration:
-            current_app.logger.info(f"Migrating database {dbName} from Float (GB) to BigInteger (Bytes)")
-            GB_TO_BYTES = 1024**3
-            tables_to_migrate = [dbName, f'{dbName}_restrict_access', f'{dbName}_transfer', f'{dbName}_deleted']
-            with self.engine.begin() as conn:
-                for t in tables_to_migrate:
-                    if inspector.has_table(t):
-                        # Use CASE to avoid re-multiplying if data already looks like bytes (> 1M GB is unlikely)
-                        conn.execute(sqlalchemy.text(f"""
-                            UPDATE "{t}" SET 
-                                total_receive = CAST(CASE WHEN total_receive < 1000000 THEN total_receive * {GB_TO_BYTES} ELSE total_receive END AS INTEGER),
-                                total_sent = CAST(CASE WHEN total_sent < 1000000 THEN total_sent * {GB_TO_BYTES} ELSE total_sent END AS INTEGER),
-                                total_data = CAST(CASE WHEN total_data < 1000000 THEN total_data * {GB_TO_BYTES} ELSE total_data END AS INTEGER),
-                                cumu_receive = CAST(CASE WHEN cumu_receive < 1000000 THEN cumu_receive * {GB_TO_BYTES} ELSE cumu_receive END AS INTEGER),
-                                cumu_sent = CAST(CASE WHEN cumu_sent < 1000000 THEN cumu_sent * {GB_TO_BYTES} ELSE cumu_sent END AS INTEGER),
-                                cumu_data = CAST(CASE WHEN cumu_data < 1000000 THEN cumu_data * {GB_TO_BYTES} ELSE cumu_data END AS INTEGER)
-                        """))
-
-        # Normalize potentially corrupted data (Task 2)
-        if not migration_applied and inspector.has_table(dbName):
-            current_app.logger.info(f"Checking for corrupted data in {dbName}")
-            THRESHOLD = 1024**5 # 1 PB
-            GB_TO_BYTES = 1024**3
-            cols_to_fix = ['total_receive', 'total_sent', 'total_data', 'cumu_receive', 'cumu_sent', 'cumu_data']
-            tables_to_check = [dbName, f'{dbName}_restrict_access', f'{dbName}_transfer', f'{dbName}_deleted']
-            with self.engine.begin() as conn:
-                for t in tables_to_check:
-                    if inspector.has_table(t):
-                        rows = conn.execute(sqlalchemy.text(f'SELECT * FROM "{t}"')).mappings().fetchall()
-                        for row in rows:
-                            updates = {}
-                            for col in cols_to_fix:
-                                if col in row and row[col] is not None and row[col] > THRESHOLD:
-                                    val = row[col]
-                                    while val > THRESHOLD:
-                                        val //= GB_TO_BYTES
-                                    updates[col] = val
-                            if updates:
-                                if 'id' in row:
-                                    where_clause = 'id = :row_id'
-                                    params = {**updates, "row_id": row['id']}
-                                    if t.endswith('_transfer') and 'time' in row:
-                                        where_clause += ' AND time = :row_time'
-                                        params['row_time'] = row['time']
-                                    conn.execute(sqlalchemy.text(f'UPDATE "{t}" SET ' + ', '.join([f'{k} = :{k}' for k in updates.keys()]) + f' WHERE {where_clause}'), params)
-
         self.peersTable = sqlalchemy.Table(
             dbName, self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False, primary_key=True),
@@ -156,6 +92,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
         self.peersRestrictedTable = sqlalchemy.Table(
@@ -180,6 +117,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
         self.peersTransferTable = sqlalchemy.Table(
@@ -217,6 +155,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
 
@@ -236,6 +175,8 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             extend_existing=True
         )
 
+        self._createTransferRollupTables(dbName)
+
         self.migrationsTable = sqlalchemy.Table(
             'wgd_migrations', self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), primary_key=True),
@@ -243,11 +184,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             extend_existing=True
         )
 
-        self.metadata.create_all(self.engine)
-
-        if not migration_applied:
-            with self.engine.begin() as conn:
-                conn.execute(self.migrationsTable.insert().values(id=migration_id))
+        DatabaseMigrations.forEngine(self.engine).migrate(self, dbName)
 
 
     def getPeers(self):
@@ -260,6 +197,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                 try:
                     if "[Peer]" not in content:
                         current_app.logger.info(f"{self.Name} config has no [Peer] section")
+                        self._indexPeers(self.Peers)
                         return
 
                     peerStarts = content.index("[Peer]")
@@ -280,6 +218,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                             split = re.split(r'\s*=\s*', i, 1)
                             if len(split) == 2:
                                 p[pCounter]["name"] = split[1]
+                    config = self.DashboardConfig.Snapshot
                     with self.engine.begin() as conn:
                         for i in p:
                             if "PublicKey" in i.keys():
@@ -291,9 +230,8 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                                         "id": i['PublicKey'],
                                         "advanced_security": i.get('AdvancedSecurity', 'off'),
                                         "private_key": "",
-                                        "DNS": self.DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
-                                        "endpoint_allowed_ip": self.DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
-                                            1],
+                                        "DNS": config.PeerGlobalDNS,
+                                        "endpoint_allowed_ip": config.PeerEndpointAllowedIP,
                                         "name": i.get("name"),
                                         "total_receive": 0,
                                         "total_sent": 0,
@@ -305,9 +243,9 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                                         "cumu_receive": 0,
                                         "cumu_sent": 0,
                                         "cumu_data": 0,
-                                        "mtu": self.DashboardConfig.GetConfig("Peers", "peer_mtu")[1],
-                                        "keepalive": self.DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1],
-                                        "remote_endpoint": self.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                                        "mtu": config.PeerMTU,
+                                        "keepalive": config.PeerKeepAlive,
+                                        "remote_endpoint": config.PeerRemoteEndpoint,
                                         "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
                                     }
                                     conn.execute(
@@ -321,20 +259,23 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                                             self.peersTable.columns.id == i['PublicKey']
                                         )
                                     )
-                                self.Peers.append(AmneziaWGPeer(tempPeer, self))
+                                    tempPeer = {**tempPeer, "allowed_ip": i.get("AllowedIPs", "N/A")}
+                                self.Peers.append(self._loadPeer(tempPeer, AmneziaWGPeer))
                 except Exception as e:
                     current_app.logger.error(f"{self.Name} getPeers() Error", e)
         else:
             with self.engine.connect() as conn:
                 existingPeers = conn.execute(self.peersTable.select()).mappings().fetchall()
                 for i in existingPeers:
-                    self.Peers.append(AmneziaWGPeer(i, self))
+                    self.Peers.append(self._loadPeer(i, AmneziaWGPeer))
+        self._indexPeers(self.Peers)
 
     def addPeers(self, peers: list) -> tuple[bool, list, str]:
         result = {
             "message": None,
             "peers": []
         }
+        _, remoteEndpoint = self.DashboardConfig.GetConfig("Peers", "remote_endpoint")
         try:
             with self.engine.begin() as conn:
                 for i in peers:
@@ -356,28 +297,14 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                         "cumu_data": 0,
                         "mtu": i['mtu'],
                         "keepalive": i['keepalive'],
-                        "remote_endpoint": self.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                        "remote_endpoint": remoteEndpoint,
                         "preshared_key": i["preshared_key"],
                         "advanced_security": i['advanced_security']
                     }
                     conn.execute(
                         self.peersTable.insert().values(newPeer)
                     )
-            for p in peers:
-                presharedKeyExist = len(p['preshared_key']) > 0
-                temp_psk_path = None
-                if presharedKeyExist:
-                    temp_psk_path = f".psk_{secrets.token_hex(16)}"
-                    with open(temp_psk_path, "w") as f:
-                        f.write(p['preshared_key'])
-
-                try:
-                    cmd = [self.Protocol, "set", self.Name, "peer", p['id'], "allowed-ips", p['allowed_ip'].replace(' ', '')]
-                    cmd.extend(["preshared-key", temp_psk_path if temp_psk_path else "/dev/null"])
-                    WireguardCLI.run(cmd, timeout=10)
-                finally:
-                    if temp_psk_path and os.path.exists(temp_psk_path):
-                        os.remove(temp_psk_path)
+            self._programPeers(peers)
             WireguardCLI.run([f"{self.Protocol}-quick", "save", self.Name], timeout=10)
             self.getPeers()
             for p in peers:
@@ -393,9 +320,5 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             return False, [], str(e)
         return True, result['peers'], ""
 
-    def getRestrictedPeers(self):
-        self.RestrictedPeers = []
-        with self.engine.connect() as conn:
-            restricted = conn.execute(self.peersRestrictedTable.select()).mappings().fetchall()
-            for i in restricted:
-                self.RestrictedPeers.append(AmneziaWGPeer(i, self))
\ No newline at end of file
+    def _newPeer(self, tableData) -> AmneziaWGPeer:
+        return AmneziaWGPeer(tableData, self)
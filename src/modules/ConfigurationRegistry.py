@@ -0,0 +1,144 @@
+"""
+Configuration Registry
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class ConfigurationRegistry(dict):
+    """
+    Configurations by name, each one constructed the first time it is looked up
+    """
+    # Construction is mostly Python and SQLite work, the pool pays off for the wg and wg-quick calls
+    LOAD_WORKERS = 4
+
+    def __init__(self):
+        super().__init__()
+        self.__loaders: dict[str, Callable] = {}
+        self.__versions: dict[str, object] = {}
+        self.__failed: dict[str, object] = {}
+        self.__nameLocks: dict[str, threading.Lock] = {}
+        self.__lock = threading.Lock()
+
+    def setLoader(self, name: str, loader: Callable, version=None):
+        """
+        Register a configuration, or replace a loaded one on its next lookup
+        @param name: Configuration name
+        @param loader: Returns the configuration, or None when it cannot be loaded
+        @param version: What the loader reads, such as the file modification time. A configuration that
+        failed to load is not registered again until its version changes
+        @return: False if the configuration already failed to load at this version
+        """
+        with self.__lock:
+            if version is not None and name in self.__failed and self.__failed[name] == version:
+                return False
+            self.__failed.pop(name, None)
+            self.__loaders[name] = loader
+            self.__versions[name] = version
+            return True
+
+    def isLoaded(self, name: str) -> bool:
+        return dict.__contains__(self, name) and name not in self.__loaders
+
+    def load(self, names: list[str] = None):
+        """
+        Construct pending configurations in a thread pool
+        @param names: Configurations to construct, None for every pending one
+        """
+        with self.__lock:
+            pending = [n for n in (self.__loaders.keys() if names is None else names) if n in self.__loaders]
+        if len(pending) == 1:
+            self.__load(pending[0])
+        elif pending:
+            with ThreadPoolExecutor(min(self.LOAD_WORKERS, len(pending))) as executor:
+                list(executor.map(self.__load, pending))
+
+    def __load(self, name: str):
+        with self.__lock:
+            if name not in self.__loaders:
+                return dict.get(self, name)
+            nameLock = self.__nameLocks.setdefault(name, threading.Lock())
+        with nameLock:
+            with self.__lock:
+                loader = self.__loaders.get(name)
+            if loader is None:
+                return dict.get(self, name)
+            configuration = loader()
+            with self.__lock:
+                # Only if it was not removed or registered again while constructing
+                if self.__loaders.get(name) is loader:
+                    del self.__loaders[name]
+                    version = self.__versions.pop(name, None)
+                    if configuration is None:
+                        dict.pop(self, name, None)
+                        self.__failed[name] = version
+                    else:
+                        dict.__setitem__(self, name, configuration)
+            return configuration
+
+    def __getitem__(self, name):
+        if name in self.__loaders:
+            configuration = self.__load(name)
+            if configuration is None:
+                raise KeyError(name)
+            return configuration
+        return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __setitem__(self, name, configuration):
+        with self.__lock:
+            self.__loaders.pop(name, None)
+            self.__versions.pop(name, None)
+            self.__failed.pop(name, None)
+            dict.__setitem__(self, name, configuration)
+
+    def __delitem__(self, name):
+        with self.__lock:
+            loader = self.__loaders.pop(name, None)
+            self.__versions.pop(name, None)
+            self.__failed.pop(name, None)
+            if dict.pop(self, name, None) is None and loader is None:
+                raise KeyError(name)
+
+    def pop(self, name, *default):
+        with self.__lock:
+            loader = self.__loaders.pop(name, None)
+            self.__versions.pop(name, None)
+            self.__failed.pop(name, None)
+        if loader is not None and not dict.__contains__(self, name):
+            return None
+        return dict.pop(self, name, *default)
+
+    def clear(self):
+        with self.__lock:
+            self.__loaders.clear()
+            self.__versions.clear()
+            self.__failed.clear()
+            dict.clear(self)
+
+    def __contains__(self, name):
+        return name in self.__loaders or dict.__contains__(self, name)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        with self.__lock:
+            return list(dict.fromkeys(list(dict.keys(self)) + list(self.__loaders.keys())))
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
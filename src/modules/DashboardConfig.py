@@ -1,7 +1,8 @@
 """
 Dashboard Configuration
 """
-import configparser, secrets, os, pyotp, ipaddress, bcrypt, threading
+import configparser, secrets, os, pyotp, ipaddress, bcrypt, threading, hashlib, time
+from types import MappingProxyType
 from sqlalchemy_utils import database_exists, create_database
 import sqlalchemy as db
 from datetime import datetime
@@ -14,11 +15,55 @@ from .Utilities import (
 from .DashboardAPIKey import DashboardAPIKey
 
 
+class DashboardConfigSnapshot:
+    """
+    Parsed, read-only copy of wg-dashboard.ini, replaced as a whole whenever a value is set
+    """
+    def __init__(self, config: configparser.RawConfigParser):
+        self.Values: MappingProxyType[str, MappingProxyType[str, Any]] = MappingProxyType({
+            section: MappingProxyType({
+                key: DashboardConfigSnapshot.parse(section, key, value) for key, value in config.items(section)
+            }) for section in config.sections()
+        })
+        self.AuthRequired: bool = self.get("Server", "auth_req") is True
+        self.APIKeyEnabled: bool = self.get("Server", "dashboard_api_key") is True
+        self.PeerGlobalDNS = self.get("Peers", "peer_global_dns")
+        self.PeerEndpointAllowedIP = self.get("Peers", "peer_endpoint_allowed_ip")
+        self.PeerMTU = self.get("Peers", "peer_mtu")
+        self.PeerKeepAlive = self.get("Peers", "peer_keep_alive")
+        self.PeerRemoteEndpoint = self.get("Peers", "remote_endpoint")
+
+    @staticmethod
+    def parse(section: str, key: str, value: str) -> bool | str | tuple[str, ...]:
+        if section == "Email" and key == "email_template":
+            return value.encode('utf-8').decode('unicode_escape')
+        if section == "WireGuardConfiguration" and key == "autostart":
+            return tuple(filter(lambda x: len(x) > 0, value.split("||")))
+        if value in ["1", "yes", "true", "on"]:
+            return True
+        if value in ["0", "no", "false", "off"]:
+            return False
+        return value
+
+    def get(self, section: str, key: str, default: Any = None) -> Any:
+        values = self.Values.get(section)
+        if values is None:
+            return default
+        return values.get(key.lower(), default)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            raise AttributeError(f"{name} of a configuration snapshot cannot be changed")
+        super().__setattr__(name, value)
+
 
 class DashboardConfig:
     DashboardVersion = 'v4.3.1'
     ConfigurationPath = os.path.abspath(os.getenv('CONFIGURATION_PATH', '.'))
     ConfigurationFilePath = os.path.join(ConfigurationPath, 'wg-dashboard.ini')
+    # Seconds a verified API key skips the index lookup, 0 turns the cache off
+    API_KEY_CACHE_SECONDS = 5
+    API_KEY_CACHE_SIZE = 1024
     
     def __init__(self):
         self._lock = threading.RLock()
@@ -29,6 +74,7 @@ class DashboardConfig:
             self.__config = configparser.RawConfigParser(strict=False)
             with open(DashboardConfig.ConfigurationFilePath, "r+") as f:
                 self.__config.read_file(f)
+            self.__snapshot = DashboardConfigSnapshot(self.__config)
         self.hiddenAttribute = ["totp_key", "auth_req"]
         app_port_default = "10086"
         self.__default = {
@@ -61,7 +107,8 @@ class DashboardConfig:
                 "peer_display_mode": "grid",
                 "remote_endpoint": GetRemoteEndpoint(),
                 "peer_MTU": "1328",
-                "peer_keep_alive": "21"
+                "peer_keep_alive": "21",
+                "peer_traffic_raw_retention_days": "7"
             },
             "Other": {
                 "welcome_session": "true"
@@ -109,7 +156,7 @@ class DashboardConfig:
         self.engine = CreateEngine(ConnectionString('wgdashboard'))
         self.dbMetadata = db.MetaData()
         self.__createAPIKeyTable()
-        self.DashboardAPIKeys = self.__getAPIKeys()
+        self.__getAPIKeys()
         self.SetConfig("Server", "version", DashboardConfig.DashboardVersion)
 
     def getConnectionString(self, database) -> str or None:
@@ -140,19 +187,52 @@ class DashboardConfig:
                                               )
                                     )
         self.dbMetadata.create_all(self.engine)
-    def __getAPIKeys(self) -> list[DashboardAPIKey]:
+    def __getAPIKeys(self):
+        """
+        Load the active API keys, and index their expiry by SHA-256 digest of the key
+        """
+        fKeys: list[DashboardAPIKey] = []
+        index: dict[bytes, datetime | None] = {}
         try:
             with self.engine.connect() as conn:
                 keys = conn.execute(self.apiKeyTable.select().where(
                     db.or_(self.apiKeyTable.columns.ExpiredAt.is_(None), self.apiKeyTable.columns.ExpiredAt > datetime.now())
                 )).fetchall()
-                fKeys = []
                 for k in keys:
                     fKeys.append(DashboardAPIKey(k[0], k[1].strftime("%Y-%m-%d %H:%M:%S"), (k[2].strftime("%Y-%m-%d %H:%M:%S") if k[2] else None)))
-                return fKeys
+                    index[self.__hashAPIKey(k[0])] = k[2]
         except Exception as e:
             current_app.logger.error("API Keys error", e)
-        return []
+            fKeys, index = [], {}
+        self.DashboardAPIKeys = fKeys
+        self.__apiKeyIndex = index
+        self.__apiKeyCache: dict[str, float] = {}
+
+    @staticmethod
+    def __hashAPIKey(key: str) -> bytes:
+        return hashlib.sha256(key.encode('utf-8')).digest()
+
+    def verifyAPIKey(self, key: str) -> bool:
+        """
+        Check that an API key exists and has not expired
+        @param key: Key sent by the client
+        """
+        cache = self.__apiKeyCache
+        cachedUntil = cache.get(key)
+        if cachedUntil is not None and cachedUntil > time.time():
+            return True
+        digest = self.__hashAPIKey(key)
+        if digest not in self.__apiKeyIndex:
+            return False
+        expiredAt = self.__apiKeyIndex[digest]
+        if expiredAt is not None and expiredAt <= datetime.now():
+            return False
+        if self.API_KEY_CACHE_SECONDS > 0:
+            if len(cache) >= self.API_KEY_CACHE_SIZE:
+                cache.clear()
+            cachedUntil = time.time() + self.API_KEY_CACHE_SECONDS
+            cache[key] = min(cachedUntil, expiredAt.timestamp()) if expiredAt is not None else cachedUntil
+        return True
 
     def createAPIKeys(self, ExpiredAt = None):
         newKey = secrets.token_urlsafe(32)
@@ -164,7 +244,7 @@ class DashboardConfig:
                 })
             )
 
-        self.DashboardAPIKeys = self.__getAPIKeys()
+        self.__getAPIKeys()
 
     def deleteAPIKey(self, key):
         with self.engine.begin() as conn:
@@ -174,7 +254,7 @@ class DashboardConfig:
                 }).where(self.apiKeyTable.columns.Key == key)
             )
 
-        self.DashboardAPIKeys = self.__getAPIKeys()
+        self.__getAPIKeys()
 
     def __configValidation(self, section : str, key: str, value: Any) -> tuple[bool, str]:
         if (type(value) is str and len(value) == 0
@@ -255,6 +335,7 @@ class DashboardConfig:
                     self.__config[section][key] = "||".join(value).strip("||")
                 else:
                     self.__config[section][key] = fr"{value}"
+                self.__snapshot = DashboardConfigSnapshot(self.__config)
                 return self.SaveConfig(), ""
             else:
                 return False, f"{key} does not exist under {section}"
@@ -269,36 +350,30 @@ class DashboardConfig:
                      current_app.logger.error(f"Failed to save configuration to {DashboardConfig.ConfigurationFilePath}: {e}")
                 return False
 
-    def GetConfig(self, section, key) ->tuple[bool, bool] | tuple[bool, str] | tuple[bool, list[str]] | tuple[bool, None]:
-        with self._lock:
-            if section not in self.__config:
-                return False, None
-
-            if key not in self.__config[section]:
-                return False, None
-
-            if section == "Email" and key == "email_template":
-                return True, self.__config[section][key].encode('utf-8').decode('unicode_escape')
-
-            if section == "WireGuardConfiguration" and key == "autostart":
-                return True, list(filter(lambda x: len(x) > 0, self.__config[section][key].split("||")))
-
-            if self.__config[section][key] in ["1", "yes", "true", "on"]:
-                return True, True
+    @property
+    def Snapshot(self) -> DashboardConfigSnapshot:
+        """
+        Current parsed configuration, read without taking the lock
+        """
+        return self.__snapshot
 
-            if self.__config[section][key] in ["0", "no", "false", "off"]:
-                return True, False
-
-
-            return True, self.__config[section][key]
+    def GetConfig(self, section, key) ->tuple[bool, bool] | tuple[bool, str] | tuple[bool, list[str]] | tuple[bool, None]:
+        values = self.__snapshot.Values.get(section)
+        if values is None:
+            return False, None
+        key = key.lower()
+        if key not in values:
+            return False, None
+        value = values[key]
+        if type(value) is tuple:
+            return True, list(value)
+        return True, value
 
     def toJson(self) -> dict[str, dict[Any, Any]]:
-        with self._lock:
-            the_dict = {}
-
-            for section in self.__config.sections():
-                the_dict[section] = {}
-                for key, val in self.__config.items(section):
-                    if key not in self.hiddenAttribute:
-                        the_dict[section][key] = self.GetConfig(section, key)[1]
-            return the_dict
+        the_dict = {}
+        for section, values in self.__snapshot.Values.items():
+            the_dict[section] = {}
+            for key, value in values.items():
+                if key not in self.hiddenAttribute:
+                    the_dict[section][key] = list(value) if type(value) is tuple else value
+        return the_dict
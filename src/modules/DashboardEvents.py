@@ -0,0 +1,87 @@
+"""
+Dashboard Events
+"""
+import json, queue, threading
+
+
+class DashboardEventSubscription:
+    def __init__(self, configurations: set[str] | None, maxQueued: int):
+        self.Configurations = configurations
+        self.Queue: queue.Queue[str] = queue.Queue(maxQueued)
+
+
+class DashboardEvents:
+    """
+    Fans events from the background threads out to Server-Sent Events streams
+    """
+    KEEPALIVE_SECONDS = 15
+    MAX_QUEUED = 256
+
+    def __init__(self, maxSubscribers: int = 4, dumps=json.dumps):
+        """
+        @param maxSubscribers: Streams allowed at the same time
+        @param dumps: JSON serializer for event payloads
+        """
+        # Every stream holds a worker thread, keep some free for regular requests
+        self.MaxSubscribers = maxSubscribers
+        self.__dumps = dumps
+        self.__subscriptions: set[DashboardEventSubscription] = set()
+        self.__lock = threading.Lock()
+
+    def hasSubscribers(self) -> bool:
+        return len(self.__subscriptions) > 0
+
+    def subscribe(self, configurations: set[str] = None) -> DashboardEventSubscription | None:
+        """
+        @param configurations: Only receive configuration events for these names, None for all
+        @return: The subscription, or None when too many streams are open
+        """
+        with self.__lock:
+            if len(self.__subscriptions) >= self.MaxSubscribers:
+                return None
+            subscription = DashboardEventSubscription(configurations, self.MAX_QUEUED)
+            self.__subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: DashboardEventSubscription):
+        with self.__lock:
+            self.__subscriptions.discard(subscription)
+
+    def publish(self, event: str, data, configuration: str = None):
+        """
+        @param event: SSE event name
+        @param data: JSON serializable payload
+        @param configuration: Configuration the event belongs to, None for dashboard wide events
+        """
+        with self.__lock:
+            subscriptions = list(self.__subscriptions)
+        message = None
+        for subscription in subscriptions:
+            if configuration is not None and subscription.Configurations is not None \
+                    and configuration not in subscription.Configurations:
+                continue
+            if message is None:
+                message = f"event: {event}\ndata: {self.__dumps(data)}\n\n"
+            try:
+                subscription.Queue.put_nowait(message)
+            except queue.Full:
+                # A stalled client loses its oldest event instead of blocking the background thread
+                try:
+                    subscription.Queue.get_nowait()
+                    subscription.Queue.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def stream(self, subscription: DashboardEventSubscription, stopEvent: threading.Event = None):
+        """
+        Generator of SSE frames for one subscription, unsubscribes when the client goes away
+        """
+        try:
+            yield "retry: 5000\n\n"
+            while stopEvent is None or not stopEvent.is_set():
+                try:
+                    yield subscription.Queue.get(timeout=self.KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,73 @@
+"""
+Dashboard JSON Provider
+"""
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import RowMapping
+
+try:
+    import orjson
+    JSONBackend = "orjson"
+except ImportError:
+    orjson = None
+    JSONBackend = "json"
+
+
+class DashboardJSONProvider(DefaultJSONProvider):
+    """
+    Serializes objects with a toJson() method, row mappings and datetimes.
+    Encodes with orjson when it is installed, and falls back to the json module for what orjson refuses,
+    such as integers wider than 64 bits.
+    """
+    def __init__(self, app):
+        super().__init__(app)
+        self.Backend = JSONBackend
+
+    def default(self, o):
+        if callable(getattr(o, "toJson", None)):
+            return o.toJson()
+        if type(o) is RowMapping:
+            return dict(o)
+        if type(o) is datetime:
+            if o.tzinfo is None:
+                return o.isoformat(" ", "seconds")
+            return o.strftime("%Y-%m-%d %H:%M:%S")
+        return super().default(o)
+
+    def __orjsonOptions(self, indent) -> int | None:
+        if self.Backend != "orjson" or indent not in (None, 2):
+            return None
+        # Datetimes go through default() so they keep the format the frontend expects
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumpBytes(self, obj, indent: int = None) -> bytes:
+        options = self.__orjsonOptions(indent)
+        if options is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=options)
+            except orjson.JSONEncodeError:
+                pass
+        if indent is None:
+            return super().dumps(obj, separators=(",", ":")).encode()
+        return super().dumps(obj, indent=indent).encode()
+
+    def dumps(self, obj, **kwargs) -> str:
+        if set(kwargs.keys()) <= {"indent", "separators"} and kwargs.get("separators", (",", ":")) == (",", ":"):
+            return self.dumpBytes(obj, kwargs.get("indent")).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: str | bytes, **kwargs):
+        if self.Backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(self.dumpBytes(obj, indent) + b"\n", mimetype=self.mimetype)
@@ -5,6 +5,7 @@ import uuid
 import sqlalchemy as db
 from flask import current_app
 from .ConnectionString import ConnectionString, CreateEngine
+from .LogQueue import LogQueue
 
 
 class DashboardLogger:
@@ -24,21 +25,23 @@ class DashboardLogger:
                                              db.Column('Message', db.Text), extend_existing=True,
                                              )
         self.metadata.create_all(self.engine)
+        self.queue = LogQueue(self.engine, self.dashboardLoggerTable)
         self.log(Message="WGDashboard started")
 
     def log(self, URL: str = "", IP: str = "", Status: str = "true", Message: str = "") -> bool:
-        try:
-            with self.engine.begin() as conn:
-                conn.execute(
-                    self.dashboardLoggerTable.insert().values(
-                        LogID=str(uuid.uuid4()),
-                        URL=URL,
-                        IP=IP,
-                        Status=Status,
-                        Message=Message
-                    )
-                )
-            return True
-        except Exception as e:
-            current_app.logger.error(f"Access Log Error", e)
-            return False
\ No newline at end of file
+        """
+        Queue a log, it is written to the table by the log queue thread
+        """
+        if not self.queue.put({
+            "LogID": str(uuid.uuid4()),
+            "URL": URL,
+            "IP": IP,
+            "Status": Status,
+            "Message": Message
+        }):
+            current_app.logger.error(f"Access Log Error: log queue is full")
+            return False
+        return True
+
+    def stop(self):
+        self.queue.stop()
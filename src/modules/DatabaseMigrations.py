@@ -0,0 +1,182 @@
+"""
+Database Migrations
+"""
+import logging, threading, weakref
+
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseMigrations:
+    """
+    Schema and data migrations of the configuration tables, applied once per configuration.
+    The version each configuration reached is recorded in wgd_schema_versions, so a configuration
+    already at the current version is constructed without inspecting or scanning the database.
+    """
+    VERSION = 3
+    __runners: "weakref.WeakKeyDictionary[sqlalchemy.Engine, DatabaseMigrations]" = weakref.WeakKeyDictionary()
+    __runnersLock = threading.Lock()
+
+    def __init__(self, engine: sqlalchemy.Engine):
+        self.engine = engine
+        self.metadata = sqlalchemy.MetaData()
+        self.versionsTable = sqlalchemy.Table(
+            'wgd_schema_versions', self.metadata,
+            sqlalchemy.Column('name', sqlalchemy.String(255), primary_key=True),
+            sqlalchemy.Column('version', sqlalchemy.Integer, nullable=False),
+            sqlalchemy.Column('updated_at', sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.now())
+        )
+        self.migrationsTable = sqlalchemy.Table(
+            'wgd_migrations', self.metadata,
+            sqlalchemy.Column('id', sqlalchemy.String(255), primary_key=True),
+            sqlalchemy.Column('applied_at', sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.now())
+        )
+        self.__versions: dict[str, int] | None = None
+        self.__lock = threading.RLock()
+
+    @classmethod
+    def forEngine(cls, engine: sqlalchemy.Engine) -> "DatabaseMigrations":
+        """
+        @param engine: Engine of the configuration database
+        @return: Migration runner shared by every configuration of the engine
+        """
+        with cls.__runnersLock:
+            runner = cls.__runners.get(engine)
+            if runner is None:
+                runner = cls.__runners[engine] = cls(engine)
+            return runner
+
+    def version(self, name: str) -> int:
+        """
+        @param name: Configuration name
+        @return: Version recorded for the configuration, 0 when it was never migrated
+        """
+        with self.__lock:
+            if self.__versions is None:
+                try:
+                    with self.engine.connect() as conn:
+                        self.__versions = {
+                            row.name: row.version for row in conn.execute(self.versionsTable.select())
+                        }
+                except sqlalchemy.exc.DBAPIError:
+                    self.__versions = {}
+            return self.__versions.get(name, 0)
+
+    def migrate(self, configuration, name: str) -> bool:
+        """
+        Create the tables of a configuration and run the migrations it has not had yet
+        @param configuration: WireguardConfiguration whose metadata holds the tables of name
+        @param name: Configuration name, the prefix of its tables
+        @return: True if anything ran
+        """
+        with self.__lock:
+            current = self.version(name)
+            if current >= self.VERSION:
+                return False
+            self.metadata.create_all(self.engine)
+            # Runs before the tables are created, a new configuration has nothing to convert
+            if current < 1:
+                self.__migrateCountersToBytes(name)
+                self.__setVersion(name, 1)
+            configuration.metadata.create_all(self.engine)
+            steps = [
+                (2, lambda: configuration._createTrackingIndexes(name)),
+                (3, lambda: self.__addHandshakeTimestamps(name)),
+            ]
+            for version, step in steps:
+                if version > current:
+                    step()
+                    self.__setVersion(name, version)
+            return True
+
+    def reset(self, name: str):
+        """
+        Forget the migrations of a configuration whose tables were dropped
+        @param name: Configuration name
+        """
+        with self.__lock:
+            with self.engine.begin() as conn:
+                conn.execute(self.versionsTable.delete().where(self.versionsTable.c.name == name))
+                conn.execute(self.migrationsTable.delete().where(self.migrationsTable.c.id.in_(
+                    [f'float_to_bigint_v1_{name}', f'tracking_indexes_v1_{name}']
+                )))
+            if self.__versions is not None:
+                self.__versions.pop(name, None)
+
+    def __setVersion(self, name: str, version: int):
+        with self.engine.begin() as conn:
+            conn.execute(self.versionsTable.delete().where(self.versionsTable.c.name == name))
+            conn.execute(self.versionsTable.insert().values(name=name, version=version))
+        self.__versions[name] = version
+
+    def __addHandshakeTimestamps(self, dbName: str):
+        """
+        Add latest_handshake_at to the peer tables created before it existed
+        """
+        inspector = sqlalchemy.inspect(self.engine)
+        with self.engine.begin() as conn:
+            for t in [dbName, f'{dbName}_restrict_access', f'{dbName}_deleted']:
+                if inspector.has_table(t) and 'latest_handshake_at' not in [c['name'] for c in inspector.get_columns(t)]:
+                    conn.execute(sqlalchemy.text(f'ALTER TABLE "{t}" ADD COLUMN latest_handshake_at BIGINT'))
+
+    def __migrateCountersToBytes(self, dbName: str):
+        """
+        Convert traffic counters stored as Float (GB) to BigInteger (Bytes), and bring back values
+        above 1 PB left by converting twice
+        """
+        migration_id = f'float_to_bigint_v1_{dbName}'
+        with self.engine.connect() as conn:
+            # Databases upgraded before this runner already had both
+            if conn.execute(
+                self.migrationsTable.select().where(self.migrationsTable.c.id == migration_id)
+            ).first() is not None:
+                return
+
+        inspector = sqlalchemy.inspect(self.engine)
+        if not inspector.has_table(dbName):
+            with self.engine.begin() as conn:
+                conn.execute(self.migrationsTable.insert().values(id=migration_id))
+            return
+        tables = [t for t in [dbName, f'{dbName}_restrict_access', f'{dbName}_transfer', f'{dbName}_deleted']
+                  if inspector.has_table(t)]
+        GB_TO_BYTES = 1024**3
+        if any(col['name'] == 'total_receive' and isinstance(col['type'], sqlalchemy.Float)
+               for col in inspector.get_columns(dbName)):
+            logger.info(f"Migrating database {dbName} from Float (GB) to BigInteger (Bytes)")
+            with self.engine.begin() as conn:
+                for t in tables:
+                    # Use CASE to avoid re-multiplying if data already looks like bytes (> 1M GB is unlikely)
+                    conn.execute(sqlalchemy.text(f"""
+                        UPDATE "{t}" SET
+                            total_receive = CAST(CASE WHEN total_receive < 1000000 THEN total_receive * {GB_TO_BYTES} ELSE total_receive END AS INTEGER),
+                            total_sent = CAST(CASE WHEN total_sent < 1000000 THEN total_sent * {GB_TO_BYTES} ELSE total_sent END AS INTEGER),
+                            total_data = CAST(CASE WHEN total_data < 1000000 THEN total_data * {GB_TO_BYTES} ELSE total_data END AS INTEGER),
+                            cumu_receive = CAST(CASE WHEN cumu_receive < 1000000 THEN cumu_receive * {GB_TO_BYTES} ELSE cumu_receive END AS INTEGER),
+                            cumu_sent = CAST(CASE WHEN cumu_sent < 1000000 THEN cumu_sent * {GB_TO_BYTES} ELSE cumu_sent END AS INTEGER),
+                            cumu_data = CAST(CASE WHEN cumu_data < 1000000 THEN cumu_data * {GB_TO_BYTES} ELSE cumu_data END AS INTEGER)
+                    """))
+
+        logger.info(f"Checking for corrupted data in {dbName}")
+        THRESHOLD = 1024**5 # 1 PB
+        cols_to_fix = ['total_receive', 'total_sent', 'total_data', 'cumu_receive', 'cumu_sent', 'cumu_data']
+        with self.engine.begin() as conn:
+            for t in tables:
+                rows = conn.execute(sqlalchemy.text(f'SELECT * FROM "{t}"')).mappings().fetchall()
+                for row in rows:
+                    updates = {}
+                    for col in cols_to_fix:
+                        if col in row and row[col] is not None and row[col] > THRESHOLD:
+                            val = row[col]
+                            while val > THRESHOLD:
+                                val //= GB_TO_BYTES
+                            updates[col] = val
+                    if updates:
+                        if 'id' in row:
+                            where_clause = 'id = :row_id'
+                            params = {**updates, "row_id": row['id']}
+                            if t.endswith('_transfer') and 'time' in row:
+                                where_clause += ' AND time = :row_time'
+                                params['row_time'] = row['time']
+                            conn.execute(sqlalchemy.text(f'UPDATE "{t}" SET ' + ', '.join([f'{k} = :{k}' for k in updates.keys()]) + f' WHERE {where_clause}'), params)
+            conn.execute(self.migrationsTable.insert().values(id=migration_id))
@@ -0,0 +1,159 @@
+"""
+IP Address Allocator
+"""
+import ipaddress
+
+
+class SubnetAllocator:
+    # Subnets up to this many addresses keep a bitmap, larger ones (IPv6 /64 and friends) a sparse dict
+    BITMAP_LIMIT = 1 << 24
+
+    def __init__(self, network: ipaddress.IPv4Network | ipaddress.IPv6Network):
+        self.network = network
+        self.__base = int(network.network_address)
+        self.__size = network.num_addresses
+        # Offsets handed out as host addresses, the same range as network.hosts()
+        if network.prefixlen == network.max_prefixlen:
+            self.__first, self.__last = 0, 0
+        elif network.prefixlen == network.max_prefixlen - 1:
+            self.__first, self.__last = 0, 1
+        elif network.version == 4:
+            self.__first, self.__last = 1, self.__size - 2
+        else:
+            self.__first, self.__last = 1, self.__size - 1
+        self.__usedCount = 0
+        self.__hint = self.__first
+        if self.__size <= self.BITMAP_LIMIT:
+            self.__bitmap = bytearray((self.__size + 7) // 8)
+            # Extra references when more than one peer claims the same address
+            self.__shared: dict[int, int] = {}
+            self.__sparse = None
+        else:
+            self.__bitmap = None
+            self.__sparse: dict[int, int] = {}
+
+    def offsetOf(self, address: ipaddress.IPv4Address | ipaddress.IPv6Address) -> int | None:
+        if address.version != self.network.version:
+            return None
+        offset = int(address) - self.__base
+        return offset if 0 <= offset < self.__size else None
+
+    def use(self, offset: int):
+        if self.__bitmap is not None:
+            index, bit = offset >> 3, 1 << (offset & 7)
+            if self.__bitmap[index] & bit:
+                self.__shared[offset] = self.__shared.get(offset, 0) + 1
+                return
+            self.__bitmap[index] |= bit
+        else:
+            count = self.__sparse.get(offset, 0)
+            self.__sparse[offset] = count + 1
+            if count:
+                return
+        self.__usedCount += 1
+
+    def release(self, offset: int):
+        if self.__bitmap is not None:
+            index, bit = offset >> 3, 1 << (offset & 7)
+            if not self.__bitmap[index] & bit:
+                return
+            if offset in self.__shared:
+                self.__shared[offset] -= 1
+                if self.__shared[offset] == 0:
+                    del self.__shared[offset]
+                return
+            self.__bitmap[index] &= ~bit
+        else:
+            count = self.__sparse.get(offset, 0)
+            if count == 0:
+                return
+            if count > 1:
+                self.__sparse[offset] = count - 1
+                return
+            del self.__sparse[offset]
+        self.__usedCount -= 1
+        if self.__first <= offset < self.__hint:
+            self.__hint = offset
+
+    def freeCount(self) -> int:
+        return self.__size - self.__usedCount
+
+    def nextFree(self, amount: int) -> list[str]:
+        """
+        Lowest free host addresses, in the same format peers store them
+        @param amount: Maximum number of addresses to return
+        @return: List of addresses with their full prefix length, e.g. 10.0.0.2/32
+        """
+        result = []
+        offset = self.__hint
+        firstFree = None
+        while offset <= self.__last and len(result) < amount:
+            if self.__bitmap is not None:
+                byte = self.__bitmap[offset >> 3]
+                if byte == 0xFF:
+                    offset = (offset | 7) + 1
+                    continue
+                free = not byte & (1 << (offset & 7))
+            else:
+                free = offset not in self.__sparse
+            if free:
+                if firstFree is None:
+                    firstFree = offset
+                result.append(f"{self.network.network_address + offset}/{self.network.max_prefixlen}")
+            offset += 1
+        # Everything below the first free address is taken, later calls can start there
+        self.__hint = firstFree if firstFree is not None else offset
+        return result
+
+
+class IPAllocator:
+    """
+    Tracks which addresses of a configuration's subnets are used by peers
+    """
+    def __init__(self, addresses: str):
+        self.Address = addresses
+        self.Subnets: dict[str, SubnetAllocator] = {}
+        self.InvalidAddresses: list[str] = []
+        for ca in addresses.split(','):
+            ca = ca.strip()
+            caSplit = ca.split('/')
+            if len(caSplit) != 2:
+                continue
+            try:
+                self.Subnets[ca] = SubnetAllocator(ipaddress.ip_network(ca, False))
+            except ValueError:
+                self.InvalidAddresses.append(ca)
+        # The interface's own address is never available
+        for ca in self.Subnets.keys():
+            self.use(ca)
+
+    def __offsets(self, allowedIPs: str):
+        for ip in allowedIPs.split(','):
+            ipSplit = ip.strip().split('/')
+            if len(ipSplit) != 2:
+                continue
+            try:
+                address = ipaddress.ip_address(ipSplit[0])
+            except ValueError:
+                continue
+            for subnet in self.Subnets.values():
+                offset = subnet.offsetOf(address)
+                if offset is not None:
+                    yield subnet, offset
+
+    def use(self, allowedIPs: str):
+        """
+        @param allowedIPs: Comma separated addresses as stored in a peer's allowed_ip
+        """
+        for subnet, offset in self.__offsets(allowedIPs):
+            subnet.use(offset)
+
+    def release(self, allowedIPs: str):
+        for subnet, offset in self.__offsets(allowedIPs):
+            subnet.release(offset)
+
+    def freeCounts(self) -> dict[str, int]:
+        return {ca: subnet.freeCount() for ca, subnet in self.Subnets.items()}
+
+    def available(self, amount: int) -> dict[str, list[str]]:
+        return {ca: subnet.nextFree(amount) for ca, subnet in self.Subnets.items()}
@@ -0,0 +1,106 @@
+"""
+Log Queue
+"""
+import logging, queue, threading, time
+
+import sqlalchemy as db
+
+logger = logging.getLogger(__name__)
+
+
+class LogQueue:
+    """
+    Buffers log rows in memory and inserts them in batches from a background thread
+    """
+    BATCH_SIZE = 500
+    FLUSH_SECONDS = 2
+    MAX_QUEUED = 10000
+
+    def __init__(self, engine: db.Engine, table: db.Table, cleanup=None, cleanupSeconds: int = 3600):
+        """
+        @param engine: Engine of the log database
+        @param table: Table the rows are inserted into
+        @param cleanup: Retention callable, run every cleanupSeconds from the background thread
+        @param cleanupSeconds: Seconds between two cleanup runs
+        """
+        self.engine = engine
+        self.table = table
+        self.Dropped = 0
+        self.__cleanup = cleanup
+        self.__cleanupSeconds = cleanupSeconds
+        self.__queue: queue.Queue[dict] = queue.Queue(self.MAX_QUEUED)
+        self.__flushLock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__stopEvent = threading.Event()
+        self.__threadLock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+    def put(self, row: dict) -> bool:
+        """
+        @param row: Column values of the log, every row of a table must have the same keys
+        @return: False when the queue is full and the row was dropped
+        """
+        self.__startThread()
+        try:
+            self.__queue.put_nowait(row)
+        except queue.Full:
+            self.Dropped += 1
+            return False
+        if self.__stopEvent.is_set():
+            # Nothing writes the queue once stopped
+            self.flush()
+        elif self.__queue.qsize() >= self.BATCH_SIZE:
+            self.__wake.set()
+        return True
+
+    def flush(self):
+        """
+        Insert every queued row, called before the table is read
+        """
+        with self.__flushLock:
+            while True:
+                rows = []
+                while len(rows) < self.BATCH_SIZE:
+                    try:
+                        rows.append(self.__queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not rows:
+                    return
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(self.table.insert(), rows)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(rows)} logs to {self.table.name}: {e}")
+
+    def stop(self):
+        """
+        Stop the background thread and write what is left in the queue
+        """
+        self.__stopEvent.set()
+        self.__wake.set()
+        if self.__thread is not None:
+            self.__thread.join(self.FLUSH_SECONDS * 5)
+        self.flush()
+
+    def __startThread(self):
+        # Started on first use, a thread started before Gunicorn forks its worker would not run in the worker
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        with self.__threadLock:
+            if (self.__thread is None or not self.__thread.is_alive()) and not self.__stopEvent.is_set():
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+
+    def __run(self):
+        nextCleanup = time.time() + self.__cleanupSeconds
+        while not self.__stopEvent.is_set():
+            self.__wake.wait(self.FLUSH_SECONDS)
+            self.__wake.clear()
+            self.flush()
+            if self.__cleanup is not None and time.time() >= nextCleanup:
+                nextCleanup = time.time() + self.__cleanupSeconds
+                try:
+                    self.__cleanup()
+                except Exception as e:
+                    logger.error(f"Log cleanup of {self.table.name} failed: {e}")
@@ -19,6 +19,16 @@ from .Utilities import GenerateWireguardPublicKey, ValidateIPAddressesWithRange,
 class Peer:
     def __init__(self, tableData, configuration):
         self.configuration = configuration
+        self.loadTableData(tableData)
+        # Set directly, a new Peer is not a change of the configuration until it is registered
+        self.jobs: list[PeerJob] = configuration.AllPeerJobs.searchJob(configuration.Name, self.id)
+        self.ShareLink: list[PeerShareLink] = configuration.AllPeerShareLinks.getLink(configuration.Name, self.id)
+
+    def loadTableData(self, tableData):
+        """
+        Copy a row of the peers table onto this object, so existing Peer objects can be refreshed in place
+        @param tableData: Row mapping or dict from the peers table
+        """
         self.id = tableData["id"]
         self.private_key = tableData["private_key"]
         self.DNS = tableData["DNS"]
@@ -38,10 +48,20 @@ class Peer:
         self.keepalive = tableData["keepalive"]
         self.remote_endpoint = tableData["remote_endpoint"]
         self.preshared_key = tableData["preshared_key"]
-        self.jobs: list[PeerJob] = []
-        self.ShareLink: list[PeerShareLink] = []
-        self.getJobs()
-        self.getShareLink()
+        self.latest_handshake_at = tableData.get("latest_handshake_at")
+
+    @property
+    def latest_handshake(self) -> str:
+        """
+        Age of the latest handshake, derived from latest_handshake_at so it does not need to be stored on every poll
+        """
+        if self.latest_handshake_at:
+            return str(datetime.datetime.now() - datetime.datetime.fromtimestamp(self.latest_handshake_at)).split(".", maxsplit=1)[0]
+        return self.__latestHandshake
+
+    @latest_handshake.setter
+    def latest_handshake(self, value: str):
+        self.__latestHandshake = value
 
     def toJson(self):
         return {
@@ -275,10 +295,16 @@ class Peer:
         return final
 
     def getJobs(self):
-        self.jobs = self.configuration.AllPeerJobs.searchJob(self.configuration.Name, self.id)
+        jobs = self.configuration.AllPeerJobs.searchJob(self.configuration.Name, self.id)
+        if jobs != self.jobs:
+            self.jobs = jobs
+            self.configuration.bumpVersion([self.id])
 
     def getShareLink(self):
-        self.ShareLink = self.configuration.AllPeerShareLinks.getLink(self.configuration.Name, self.id)
+        shareLink = self.configuration.AllPeerShareLinks.getLink(self.configuration.Name, self.id)
+        if shareLink != self.ShareLink:
+            self.ShareLink = shareLink
+            self.configuration.bumpVersion([self.id])
 
     def resetDataUsage(self, mode: str):
         try:
@@ -326,6 +352,7 @@ class Peer:
                     self.total_sent = 0
                 else:
                     return False
+            self.configuration.bumpVersion([self.id])
         except Exception as e:
             print(e)
             return False
@@ -353,27 +380,7 @@ class Peer:
             endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
             startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        with self.configuration.engine.connect() as conn:
-            result = conn.execute(
-                db.select(
-                    self.configuration.peersTransferTable.c.cumu_data,
-                    self.configuration.peersTransferTable.c.total_data,
-                    self.configuration.peersTransferTable.c.cumu_receive,
-                    self.configuration.peersTransferTable.c.total_receive,
-                    self.configuration.peersTransferTable.c.cumu_sent,
-                    self.configuration.peersTransferTable.c.total_sent,
-                    self.configuration.peersTransferTable.c.time
-                ).where(
-                    db.and_(
-                        self.configuration.peersTransferTable.c.id == self.id,
-                        self.configuration.peersTransferTable.c.time <= endDate,
-                        self.configuration.peersTransferTable.c.time >= startDate,
-                        )
-                ).order_by(
-                    self.configuration.peersTransferTable.c.time
-                )
-            ).mappings().fetchall()
-        return list(result)
+        return self.configuration.getPeerTransferHistory(self.id, startDate, endDate)
             
     
     def getSessions(self, startDate: datetime.datetime = None, endDate: datetime.datetime = None):
@@ -387,22 +394,7 @@ class Peer:
         startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
             
 
-        with self.configuration.engine.connect() as conn:
-            result = conn.execute(
-                db.select(
-                    self.configuration.peersTransferTable.c.time
-                ).where(
-                    db.and_(
-                        self.configuration.peersTransferTable.c.id == self.id,
-                        self.configuration.peersTransferTable.c.time <= endDate,
-                        self.configuration.peersTransferTable.c.time >= startDate,
-                    )
-                ).order_by(
-                    self.configuration.peersTransferTable.c.time
-                )
-            ).fetchall()
-        time = list(map(lambda x : x[0], result))
-        return time
+        return self.configuration.getPeerSessionTimes(self.id, startDate, endDate)
     
     def __duration(self, t1: datetime.datetime, t2: datetime.datetime):
         delta = t1 - t2
@@ -1,17 +1,22 @@
 """
 Peer Job Logger
 """
-import uuid
+import logging, uuid
 from typing import Sequence
 
 import sqlalchemy as db
-from flask import current_app
 from sqlalchemy import RowMapping
 
 from .ConnectionString import ConnectionString, CreateEngine
 from .Log import Log
+from .LogQueue import LogQueue
+
+logger = logging.getLogger(__name__)
 
 class PeerJobLogger:
+    RETENTION_DAYS = 30
+    CLEANUP_SECONDS = 3600
+
     def __init__(self, AllPeerJobs, DashboardConfig):
         self.engine = CreateEngine(ConnectionString("wgdashboard_log"))                
         self.metadata = db.MetaData()
@@ -26,25 +31,27 @@ class PeerJobLogger:
         self.logs: list[Log] = []
         self.metadata.create_all(self.engine)
         self.AllPeerJobs = AllPeerJobs
+        self.cleanupLogs(self.RETENTION_DAYS)
+        self.queue = LogQueue(self.engine, self.jobLogTable,
+                              lambda: self.cleanupLogs(self.RETENTION_DAYS), self.CLEANUP_SECONDS)
+
     def log(self, JobID: str, Status: bool = True, Message: str = "") -> bool:
-        try:
-            with self.engine.begin() as conn:
-                conn.execute(
-                    self.jobLogTable.insert().values(
-                        {
-                            "LogID": str(uuid.uuid4()), 
-                            "JobID": JobID, 
-                            "Status": Status, 
-                            "Message": Message
-                        }
-                    )
-                )
-        except Exception as e:
-            current_app.logger.error(f"Peer Job Log Error", e)
+        """
+        Queue a log, it is written to the table by the log queue thread
+        """
+        if not self.queue.put({
+            "LogID": str(uuid.uuid4()),
+            "JobID": JobID,
+            "Status": Status,
+            "Message": Message
+        }):
+            logger.error(f"Peer Job Log Error: log queue is full")
             return False
-        self.cleanupLogs()
         return True
 
+    def stop(self):
+        self.queue.stop()
+
     def cleanupLogs(self, days: int = 30):
         try:
             with self.engine.begin() as conn:
@@ -62,10 +69,11 @@ class PeerJobLogger:
                         )
                     )
         except Exception as e:
-            current_app.logger.error(f"Failed to cleanup job logs: {str(e)}")
+            logger.error(f"Failed to cleanup job logs: {str(e)}")
 
     def getLogs(self, configName = None) -> list[Log]:
         logs: list[Log] = []
+        self.queue.flush()
         try:
             allJobs = self.AllPeerJobs.getAllJobs(configName)
             allJobsID = [x.JobID for x in allJobs]
@@ -78,11 +86,12 @@ class PeerJobLogger:
                     logs.append(
                         Log(l.LogID, l.JobID, l.LogDate.strftime("%Y-%m-%d %H:%M:%S"), l.Status, l.Message))
         except Exception as e:
-            current_app.logger.error(f"Getting Peer Job Log Error", e)
+            logger.error(f"Getting Peer Job Log Error: {e}")
             return logs
         return logs
     
     def getFailingJobs(self) -> Sequence[RowMapping]:
+        self.queue.flush()
         with self.engine.connect() as conn:
             table = conn.execute(
                 db.select(
@@ -103,6 +112,7 @@ class PeerJobLogger:
             return table
     
     def deleteLogs(self, LogID = None, JobID = None):
+        self.queue.flush()
         with self.engine.begin() as conn:
             print(f"[WGDashboard] Deleted stale logs of JobID: {JobID}")
             conn.execute(
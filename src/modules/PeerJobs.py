@@ -1,18 +1,37 @@
 """
 Peer Jobs
 """
+import heapq
+import threading
+
 import sqlalchemy
 
 from .ConnectionString import ConnectionString, CreateEngine
 from .PeerJob import PeerJob
 from .PeerJobLogger import PeerJobLogger
 import sqlalchemy as db
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import current_app
 
 class PeerJobs:
+    DATA_FIELDS = ["total_receive", "total_sent", "total_data"]
+    # Triggered jobs whose action failed are tried again after this long
+    RETRY_SECONDS = 180
+    # The scheduler still evaluates every job this often, in case a counter changed outside the dashboard
+    FULL_SCAN_SECONDS = 3600
+    # Above this many peers, counters are fetched for the whole configuration instead of with an IN list
+    COUNTER_LOOKUP_LIMIT = 500
+
     def __init__(self, DashboardConfig, WireguardConfigurations, AllPeerShareLinks):
-        self.Jobs: list[PeerJob] = []
+        self.__jobIndex: dict[str, PeerJob] = {}
+        self.__peerJobs: dict[tuple[str, str], list[PeerJob]] = {}
+        # Min-heap of (due time, JobID), an entry is stale unless it matches __dueTimes
+        self.__schedule: list[tuple[datetime, str]] = []
+        self.__dueTimes: dict[str, datetime] = {}
+        self.__signatures: dict[str, tuple[str, str, str]] = {}
+        self.__scheduleChanged = threading.Event()
+        self.__stopped = threading.Event()
+        self.__lock = threading.RLock()
         self.engine = CreateEngine(ConnectionString('wgdashboard_job'))
         self.metadata = db.MetaData()
         self.peerJobTable = db.Table('PeerJobs', self.metadata,
@@ -34,15 +53,104 @@ class PeerJobs:
         self.cleanJob(init=True)
 
     def __getJobs(self):
-        self.Jobs.clear()
+        jobs = []
         with self.engine.connect() as conn:
-            jobs = conn.execute(self.peerJobTable.select().where(
+            rows = conn.execute(self.peerJobTable.select().where(
                 self.peerJobTable.columns.ExpireDate.is_(None)
             )).mappings().fetchall()
-            for job in jobs:
-                self.Jobs.append(PeerJob(
+            for job in rows:
+                jobs.append(PeerJob(
                     job['JobID'], job['Configuration'], job['Peer'], job['Field'], job['Operator'], job['Value'],
                     job['CreationDate'], job['ExpireDate'], job['Action']))
+        self.__setJobs(jobs)
+
+    def __setJobs(self, jobs: list[PeerJob]):
+        """
+        Replace every active job, used when the table is loaded
+        """
+        with self.__lock:
+            self.__jobIndex = {}
+            self.__peerJobs = {}
+            for job in jobs:
+                self.__addJob(job)
+            self.__removeJobs([j for j in self.__signatures if j not in self.__jobIndex])
+
+    def __addJob(self, job: PeerJob):
+        """
+        Index a new or updated job, and schedule it if its condition changed
+        """
+        with self.__lock:
+            current = self.__jobIndex.get(job.JobID)
+            if current is not None:
+                self.__peerJobs[(current.Configuration, current.Peer)].remove(current)
+            self.__jobIndex[job.JobID] = job
+            self.__peerJobs.setdefault((job.Configuration, job.Peer), []).append(job)
+            signature = (job.Field, job.Operator, job.Value)
+            if self.__signatures.get(job.JobID) != signature:
+                self.__signatures[job.JobID] = signature
+                self.__scheduleJob(job, self.__dueTime(job, datetime.now()))
+
+    def __removeJobs(self, jobIds: list[str]):
+        with self.__lock:
+            for jobId in jobIds:
+                job = self.__jobIndex.pop(jobId, None)
+                if job is not None:
+                    peerJobs = self.__peerJobs[(job.Configuration, job.Peer)]
+                    peerJobs.remove(job)
+                    if not peerJobs:
+                        del self.__peerJobs[(job.Configuration, job.Peer)]
+                self.__signatures.pop(jobId, None)
+                self.__dueTimes.pop(jobId, None)
+
+    @property
+    def Jobs(self) -> list[PeerJob]:
+        return list(self.__jobIndex.values())
+
+    @staticmethod
+    def __dueTime(job: PeerJob, now: datetime) -> datetime:
+        """
+        Date jobs become due at their date, everything else is checked once right away
+        """
+        if job.Field == "date" and job.Operator == "lgt":
+            try:
+                return max(datetime.fromisoformat(job.Value), now)
+            except ValueError:
+                pass
+        return now
+
+    def __scheduleJob(self, job: PeerJob, due: datetime):
+        with self.__lock:
+            self.__dueTimes[job.JobID] = due
+            heapq.heappush(self.__schedule, (due, job.JobID))
+            if self.__schedule[0][1] == job.JobID:
+                self.__scheduleChanged.set()
+
+    def secondsUntilNextJob(self) -> float | None:
+        with self.__lock:
+            while self.__schedule and self.__dueTimes.get(self.__schedule[0][1]) != self.__schedule[0][0]:
+                heapq.heappop(self.__schedule)
+            if not self.__schedule:
+                return None
+            return max((self.__schedule[0][0] - datetime.now()).total_seconds(), 0)
+
+    def waitForNextJob(self, maximum: float):
+        """
+        Sleep until the earliest scheduled job is due, a sooner one is scheduled, or maximum seconds pass
+        """
+        if self.__stopped.is_set():
+            return
+        seconds = self.secondsUntilNextJob()
+        timeout = maximum if seconds is None else min(seconds, maximum)
+        if timeout > 0:
+            self.__scheduleChanged.wait(timeout)
+        self.__scheduleChanged.clear()
+
+    def stop(self):
+        """
+        Wake the scheduler and keep waitForNextJob from sleeping again, used when the dashboard shuts down
+        """
+        self.__stopped.set()
+        self.__scheduleChanged.set()
 
     def getAllJobs(self, configuration: str = None):
         if configuration is not None:
@@ -62,10 +170,11 @@ class PeerJobs:
         return [x.toJson() for x in self.Jobs]
 
     def searchJob(self, Configuration: str, Peer: str):
-        return list(filter(lambda x: x.Configuration == Configuration and x.Peer == Peer, self.Jobs))
+        return list(self.__peerJobs.get((Configuration, Peer), []))
 
     def searchJobById(self, JobID):
-        return list(filter(lambda x: x.JobID == JobID, self.Jobs))
+        job = self.__jobIndex.get(JobID)
+        return [job] if job is not None else []
 
     def saveJob(self, Job: PeerJob) -> tuple[bool, list] | tuple[bool, str]:
         import traceback
@@ -73,6 +182,8 @@ class PeerJobs:
             with self.engine.begin() as conn:
                 currentJob = self.searchJobById(Job.JobID)
                 if len(currentJob) == 0:
+                    savedJob = PeerJob(Job.JobID, Job.Configuration, Job.Peer, Job.Field, Job.Operator, Job.Value,
+                                       datetime.now(), None, Job.Action)
                     conn.execute(
                         self.peerJobTable.insert().values(
                             {
@@ -82,7 +193,7 @@ class PeerJobs:
                                 "Field": Job.Field,
                                 "Operator": Job.Operator,
                                 "Value": Job.Value,
-                                "CreationDate": datetime.now(),
+                                "CreationDate": savedJob.CreationDate,
                                 "ExpireDate": None,
                                 "Action": Job.Action
                             }
@@ -90,6 +201,8 @@ class PeerJobs:
                     )
                     self.JobLogger.log(Job.JobID, Message=f"Job is created if {Job.Field} {Job.Operator} {Job.Value} then {Job.Action}")
                 else:
+                    savedJob = PeerJob(Job.JobID, currentJob[0].Configuration, currentJob[0].Peer, Job.Field, Job.Operator,
+                                       Job.Value, currentJob[0].CreationDate, None, Job.Action)
                     conn.execute(
                         self.peerJobTable.update().values({
                             "Field": Job.Field,
@@ -99,38 +212,46 @@ class PeerJobs:
                         }).where(self.peerJobTable.columns.JobID == Job.JobID)
                     )
                     self.JobLogger.log(Job.JobID, Message=f"Job is updated from if {currentJob[0].Field} {currentJob[0].Operator} {currentJob[0].Value} then {currentJob[0].Action}; to if {Job.Field} {Job.Operator} {Job.Value} then {Job.Action}")
-            self.__getJobs()
-            conf = self.WireguardConfigurations.get(Job.Configuration)
+            self.__addJob(savedJob)
+            conf = self.WireguardConfigurations.get(savedJob.Configuration)
             if conf:
-                found, peer = conf.searchPeer(Job.Peer)
+                found, peer = conf.searchAnyPeer(savedJob.Peer)
                 if found:
                     peer.getJobs()
-            return True, list(
-                filter(lambda x: x.Configuration == Job.Configuration and x.Peer == Job.Peer and x.JobID == Job.JobID,
-                       self.Jobs))
+            return True, [savedJob]
         except Exception as e:
             traceback.print_exc()
             return False, str(e)
 
     def deleteJob(self, Job: PeerJob) -> tuple[bool, None] | tuple[bool, str]:
+        if len(self.searchJobById(Job.JobID)) == 0:
+            return False, "Job does not exist"
+        return self.deleteJobs([Job])
+
+    def deleteJobs(self, Jobs: list[PeerJob]) -> tuple[bool, None] | tuple[bool, str]:
+        """
+        Expire several jobs with one update
+        """
+        if not Jobs:
+            return True, None
         try:
-            if len(self.searchJobById(Job.JobID)) == 0:
-                return False, "Job does not exist"
             with self.engine.begin() as conn:
                 conn.execute(
                     self.peerJobTable.update().values(
                         {
                             "ExpireDate": datetime.now()
                         }
-                    ).where(self.peerJobTable.columns.JobID == Job.JobID)
+                    ).where(self.peerJobTable.columns.JobID.in_([j.JobID for j in Jobs]))
                 )
-                self.JobLogger.log(Job.JobID, Message=f"Job is removed due to being deleted or finished.")
-            self.__getJobs()
-            config = self.WireguardConfigurations.get(Job.Configuration)
-            if config:
-                found, peer = config.searchPeer(Job.Peer)
-                if found and peer:
-                    peer.getJobs()
+            for job in Jobs:
+                self.JobLogger.log(job.JobID, Message=f"Job is removed due to being deleted or finished.")
+            self.__removeJobs([j.JobID for j in Jobs])
+            for configurationName, peerId in set((j.Configuration, j.Peer) for j in Jobs):
+                config = self.WireguardConfigurations.get(configurationName)
+                if config:
+                    found, peer = config.searchAnyPeer(peerId)
+                    if found and peer:
+                        peer.getJobs()
             return True, None
         except Exception as e:
             return False, str(e)
@@ -153,58 +274,106 @@ class PeerJobs:
 
 
     def runJob(self):
-        self.cleanJob()
+        """
+        Evaluate every active job
+        """
+        with self.__lock:
+            self.cleanJob()
+            self.__evaluate(self.Jobs)
+
+    def runDueJobs(self):
+        """
+        Evaluate the jobs whose scheduled time has come
+        """
+        with self.__lock:
+            now = datetime.now()
+            due = []
+            while self.__schedule and self.__schedule[0][0] <= now:
+                dueTime, jobId = heapq.heappop(self.__schedule)
+                if self.__dueTimes.get(jobId) == dueTime:
+                    del self.__dueTimes[jobId]
+                    due.append(self.__jobIndex[jobId])
+            if due:
+                self.__evaluate(due)
+
+    def runPeerJobs(self, configurationName: str, peerIds: list[str]):
+        """
+        Evaluate the data usage jobs of peers whose counters just changed
+        """
+        with self.__lock:
+            jobs = [job for peerId in peerIds for job in self.__peerJobs.get((configurationName, peerId), [])
+                    if job.Field in self.DATA_FIELDS]
+            if jobs:
+                self.__evaluate(jobs)
+
+    def __evaluate(self, jobs: list[PeerJob]):
         needToDelete = []
-        self.__getJobs()
-        for job in self.Jobs:
-            c = self.WireguardConfigurations.get(job.Configuration)
-            if c is not None:
-                f, fp = c.searchPeer(job.Peer)
-                if f:
-                    if job.Field in ["total_receive", "total_sent", "total_data"]:
-                        s = job.Field.split("_")[1]
-                        # Fetch the absolute freshest peer traffic statistics directly from the database
-                        # to prevent stale in-memory cache race conditions.
-                        with c.engine.connect() as conn:
-                            db_peer = conn.execute(
-                                c.peersTable.select().where(c.peersTable.c.id == fp.id)
-                            ).mappings().fetchone()
-                        if db_peer:
-                            x: float = float(db_peer[f"total_{s}"] + db_peer[f"cumu_{s}"])
-                        else:
-                            x: float = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
-                        y: float = float(job.Value) * (1024 ** 3)
-                    else:
-                        x: datetime = datetime.now()
-                        y: datetime = datetime.strptime(job.Value, "%Y-%m-%d %H:%M:%S")
-                    runAction: bool = self.__runJob_Compare(x, y, job.Operator)
-                    if runAction:
-                        s = False
-                        if job.Action == "restrict":
-                            s, msg = c.restrictPeers([fp.id])
-                        elif job.Action == "delete":
-                            s, msg = c.deletePeers([fp.id], self, self.AllPeerShareLinks)
-                        elif job.Action == "reset_total_data_usage":
-                            s = fp.resetDataUsage("total")
-                            c.restrictPeers([fp.id])
-                            c.allowAccessPeers([fp.id])
-                        if s is True:
-                            self.JobLogger.log(job.JobID, s,
-                                          f"Peer {fp.id} from {c.Name} is successfully {job.Action}ed."
-                                          )
-                            needToDelete.append(job)
+        jobsByConfiguration: dict[str, dict[str, list[PeerJob]]] = {}
+        for job in jobs:
+            jobsByConfiguration.setdefault(job.Configuration, {}).setdefault(job.Peer, []).append(job)
+
+        now = datetime.now()
+        for configurationName, jobsByPeer in jobsByConfiguration.items():
+            c = self.WireguardConfigurations.get(configurationName)
+            if c is None:
+                for jobs in jobsByPeer.values():
+                    for job in jobs:
+                        self.JobLogger.log(job.JobID, False,
+                                      f"Somehow can't find this peer {job.Peer} from {job.Configuration} failed {job.Action}ed."
+                                      )
+                        self.__scheduleJob(job, now + timedelta(seconds=self.RETRY_SECONDS))
+                continue
+            counters = None
+            triggered: dict[str, list[tuple[PeerJob, object]]] = {}
+            for peerId, jobs in jobsByPeer.items():
+                f, fp = c.searchPeer(peerId)
+                if not f:
+                    for job in jobs:
+                        self.JobLogger.log(job.JobID, False,
+                                      f"Somehow can't find this peer {job.Peer} from {c.Name} failed {job.Action}ed."
+                                      )
+                        self.__scheduleJob(job, now + timedelta(seconds=self.RETRY_SECONDS))
+                    continue
+                for job in jobs:
+                    try:
+                        if job.Field in self.DATA_FIELDS:
+                            if counters is None:
+                                counters = self.__getCounters(
+                                    c, list(jobsByPeer.keys()) if len(jobsByPeer) <= self.COUNTER_LOOKUP_LIMIT else None)
+                            s = job.Field.split("_")[1]
+                            # Counters come from the database, the in-memory peer only covers peers added since the query
+                            row = counters.get(fp.id)
+                            if row is not None:
+                                x: float = float((row[f"total_{s}"] or 0) + (row[f"cumu_{s}"] or 0))
+                            else:
+                                x: float = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
+                            y: float = float(job.Value) * (1024 ** 3)
                         else:
-                            self.JobLogger.log(job.JobID, s,
-                                          f"Peer {fp.id} from {c.Name} failed {job.Action}ed."
-                                          )
+                            x: datetime = now
+                            y: datetime = datetime.fromisoformat(job.Value)
+                    except ValueError:
+                        self.JobLogger.log(job.JobID, False, f"Value {job.Value} of this job is invalid.")
+                        continue
+                    if self.__runJob_Compare(x, y, job.Operator):
+                        triggered.setdefault(job.Action, []).append((job, fp))
+                    elif job.Field == "date" and now <= y:
+                        # The comparison can only change once the date passes
+                        self.__scheduleJob(job, y + timedelta(seconds=1))
+
+            for job, fp, s in self.__runActions(c, triggered):
+                if s is True:
+                    self.JobLogger.log(job.JobID, s,
+                                  f"Peer {fp.id} from {c.Name} is successfully {job.Action}ed."
+                                  )
+                    needToDelete.append(job)
                 else:
-                    self.JobLogger.log(job.JobID, False,
-                                  f"Somehow can't find this peer {job.Peer} from {c.Name} failed {job.Action}ed."
+                    self.JobLogger.log(job.JobID, s,
+                                  f"Peer {fp.id} from {c.Name} failed {job.Action}ed."
                                   )
-            else:
-                self.JobLogger.log(job.JobID, False,
-                              f"Somehow can't find this peer {job.Peer} from {job.Configuration} failed {job.Action}ed."
-                              )
+                    if job.JobID in self.__jobIndex:
+                        self.__scheduleJob(job, now + timedelta(seconds=self.RETRY_SECONDS))
+        # Deleting a peer already removed its jobs through deleteJobs
+        needToDelete = [j for j in needToDelete if j.JobID in self.__jobIndex]
         for j in needToDelete:
             self.JobLogger.log(j.JobID, Message=f"Job is removed due to being deleted or finished.")
         
@@ -218,14 +387,70 @@ class PeerJobs:
                         }
                     ).where(self.peerJobTable.columns.JobID.in_(job_ids))
                 )
-            self.__getJobs()
+            self.__removeJobs(job_ids)
             configs_to_refresh = set((j.Configuration, j.Peer) for j in needToDelete)
             for conf_name, peer_id in configs_to_refresh:
                 conf = self.WireguardConfigurations.get(conf_name)
                 if conf:
-                    found, peer = conf.searchPeer(peer_id)
+                    found, peer = conf.searchAnyPeer(peer_id)
                     if found:
                         peer.getJobs()
+
+    @staticmethod
+    def __getCounters(configuration, peerIds: list[str] = None) -> dict:
+        """
+        Fetch the traffic counters of peers in a configuration with one query
+        @param peerIds: Peers to fetch, None for every peer
+        @return: Peer ID to row with total_* and cumu_* columns
+        """
+        table = configuration.peersTable
+        query = db.select(table.c.id, table.c.total_receive, table.c.total_sent, table.c.total_data,
+                          table.c.cumu_receive, table.c.cumu_sent, table.c.cumu_data)
+        if peerIds is not None:
+            query = query.where(table.c.id.in_(peerIds))
+        with configuration.engine.connect() as conn:
+            rows = conn.execute(query).mappings().fetchall()
+        return {row["id"]: row for row in rows}
+
+    def __runActions(self, c, triggered: dict[str, list[tuple[PeerJob, object]]]) -> list[tuple[PeerJob, object, bool]]:
+        """
+        Run the triggered jobs of a configuration with one call per action
+        @return: (job, peer, succeeded) for every triggered job
+        """
+        results = []
+        deleting = set(fp.id for _, fp in triggered.get("delete", []))
+        # A peer being deleted does not need restricting or resetting first, those jobs succeed if the delete does
+        deletedWith = list(triggered.get("delete", []))
+        for action in ("restrict", "reset_total_data_usage"):
+            deletedWith.extend((job, fp) for job, fp in triggered.get(action, []) if fp.id in deleting)
+            triggered[action] = [(job, fp) for job, fp in triggered.get(action, []) if fp.id not in deleting]
+
+        restrictIds = list(dict.fromkeys(fp.id for _, fp in triggered["restrict"]))
+        if restrictIds:
+            c.restrictPeers(restrictIds)
+            for job, fp in triggered["restrict"]:
+                results.append((job, fp, c.searchRestrictedPeer(fp.id)[0]))
+
+        resetIds = list(dict.fromkeys(fp.id for _, fp in triggered["reset_total_data_usage"]))
+        if resetIds:
+            reset = {}
+            for job, fp in triggered["reset_total_data_usage"]:
+                if fp.id not in reset:
+                    reset[fp.id] = fp.resetDataUsage("total")
+                results.append((job, fp, reset[fp.id]))
+            # Reconnect the peers so they start over from zero
+            c.restrictPeers(resetIds)
+            c.allowAccessPeers(resetIds)
+
+        if deleting:
+            c.deletePeers(list(deleting), self, self.AllPeerShareLinks)
+            for job, fp in deletedWith:
+                results.append((job, fp, c.searchPeer(fp.id)[0] is False))
+
+        for action, jobs in triggered.items():
+            if action not in ("restrict", "reset_total_data_usage", "delete"):
+                results.extend((job, fp, False) for job, fp in jobs)
+        return results
             
     def cleanJob(self, init = False):
         failingJobs = self.JobLogger.getFailingJobs()
@@ -240,7 +465,8 @@ class PeerJobs:
                 )
                 self.JobLogger.deleteLogs(JobID=job.get('JobID'))
                 self.JobLogger.log(job.get('JobID'), Message=f"Job is removed due to being stale.")
-        
+        self.__removeJobs([job.get('JobID') for job in failingJobs])
+
         if init:
             with self.engine.connect() as conn:
                 is_sqlite = conn.dialect.name == 'sqlite'
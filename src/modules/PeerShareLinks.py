@@ -9,7 +9,8 @@ Peer Share Links
 """
 class PeerShareLinks:
     def __init__(self, DashboardConfig, WireguardConfigurations):
-        self.Links: list[PeerShareLink] = []
+        self.__linkIndex: dict[str, PeerShareLink] = {}
+        self.__peerLinks: dict[tuple[str, str], list[PeerShareLink]] = {}
         self.engine = CreateEngine(ConnectionString("wgdashboard"))
         self.metadata = db.MetaData()
         self.peerShareLinksTable = db.Table(
@@ -25,7 +26,8 @@ class PeerShareLinks:
         self.__getSharedLinks()
         self.wireguardConfigurations = WireguardConfigurations
     def __getSharedLinks(self):
-        self.Links.clear()
+        self.__linkIndex = {}
+        self.__peerLinks = {}
         with self.engine.connect() as conn:
             allLinks = conn.execute(
                 self.peerShareLinksTable.select().where(
@@ -33,27 +35,54 @@ class PeerShareLinks:
                 )
             ).mappings().fetchall()
             for link in allLinks:
-                self.Links.append(PeerShareLink(**link))
+                self.__addLink(PeerShareLink(**link))
 
+    def __addLink(self, link: PeerShareLink):
+        """
+        Index a new or updated link by ShareID and by (Configuration, Peer), an expired link is only removed
+        """
+        self.__removeLink(link.ShareID)
+        if link.ExpireDate is not None and link.ExpireDate <= datetime.now():
+            return
+        self.__linkIndex[link.ShareID] = link
+        self.__peerLinks.setdefault((link.Configuration, link.Peer), []).append(link)
 
+    def __removeLink(self, ShareID: str):
+        link = self.__linkIndex.pop(ShareID, None)
+        if link is not None:
+            peerLinks = self.__peerLinks[(link.Configuration, link.Peer)]
+            peerLinks.remove(link)
+            if not peerLinks:
+                del self.__peerLinks[(link.Configuration, link.Peer)]
+
+    @property
+    def Links(self) -> list[PeerShareLink]:
+        return list(self.__linkIndex.values())
 
     def getLink(self, Configuration: str, Peer: str) -> list[PeerShareLink]:
+        links = self.__peerLinks.get((Configuration, Peer))
+        if not links:
+            return []
         now = datetime.now()
-        return list(filter(lambda x : x.Configuration == Configuration and x.Peer == Peer and (x.ExpireDate is None or x.ExpireDate > now), self.Links))
+        return [x for x in links if x.ExpireDate is None or x.ExpireDate > now]
 
     def getLinkByID(self, ShareID: str) -> list[PeerShareLink]:
-        now = datetime.now()
-        return list(filter(lambda x : x.ShareID == ShareID and (x.ExpireDate is None or x.ExpireDate > now), self.Links))
+        link = self.__linkIndex.get(ShareID)
+        if link is None or (link.ExpireDate is not None and link.ExpireDate <= datetime.now()):
+            return []
+        return [link]
 
     def addLink(self, Configuration: str, Peer: str, ExpireDate: datetime = None) -> tuple[bool, str]:
         try:
             newShareID = str(uuid.uuid4())
+            now = datetime.now()
             with self.engine.begin() as conn:
-                if len(self.getLink(Configuration, Peer)) > 0:
+                activeLinks = self.getLink(Configuration, Peer)
+                if len(activeLinks) > 0:
                     conn.execute(
                         self.peerShareLinksTable.update().values(
                             {
-                                "ExpireDate": datetime.now()
+                                "ExpireDate": now
                             }
                         ).where(db.and_(self.peerShareLinksTable.columns.Configuration == Configuration, self.peerShareLinksTable.columns.Peer == Peer))
                     )
@@ -64,12 +93,15 @@ class PeerShareLinks:
                             "ShareID": newShareID,
                             "Configuration": Configuration,
                             "Peer": Peer,
-                            "ExpireDate": ExpireDate
+                            "ExpireDate": ExpireDate,
+                            "SharedDate": now
                         }
                     )
                 )
-            self.__getSharedLinks()
-            self.wireguardConfigurations.get(Configuration).searchPeer(Peer)[1].getShareLink()
+            for link in activeLinks:
+                self.__removeLink(link.ShareID)
+            self.__addLink(PeerShareLink(newShareID, Configuration, Peer, ExpireDate, now))
+            self.wireguardConfigurations.get(Configuration).searchAnyPeer(Peer)[1].getShareLink()
         except Exception as e:
             return False, str(e)
         return True, newShareID
@@ -81,9 +113,9 @@ class PeerShareLinks:
                     {
                         "ExpireDate": ExpireDate
                     }
-                ).returning(self.peerShareLinksTable.c.Configuration, self.peerShareLinksTable.c.Peer)
+                ).returning(*self.peerShareLinksTable.c)
                 .where(self.peerShareLinksTable.columns.ShareID == ShareID)
             ).mappings().fetchone()
-        self.__getSharedLinks()
-        self.wireguardConfigurations.get(updated.Configuration).searchPeer(updated.Peer)[1].getShareLink()
+        self.__addLink(PeerShareLink(**updated))
+        self.wireguardConfigurations.get(updated.Configuration).searchAnyPeer(updated.Peer)[1].getShareLink()
         return True, ""
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Response Compression
+"""
+import gzip
+
+from flask import Flask, request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ResponseCompression:
+    """
+    Compresses large text responses with brotli or gzip, whichever the client prefers
+    """
+    MINIMUM_SIZE = 1024
+    COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml")
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 4
+
+    def __init__(self, app: Flask = None, minimumSize: int = MINIMUM_SIZE):
+        self.MinimumSize = minimumSize
+        self.Encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        if app is not None:
+            app.after_request(self.compress)
+
+    def __compressible(self, response: Response) -> bool:
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if not 200 <= response.status_code < 300 or response.status_code in (204, 206):
+            return False
+        if "Content-Encoding" in response.headers:
+            return False
+        mimetype = response.mimetype or ""
+        if not (mimetype.startswith("text/") or mimetype in self.COMPRESSIBLE_TYPES):
+            return False
+        return response.content_length is None or response.content_length >= self.MinimumSize
+
+    def encode(self, data: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(data, quality=self.BROTLI_QUALITY)
+        return gzip.compress(data, compresslevel=self.GZIP_LEVEL, mtime=0)
+
+    def compress(self, response: Response) -> Response:
+        if not self.__compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(self.Encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.MinimumSize:
+            return response
+        response.set_data(self.encode(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -13,6 +13,7 @@ class SystemStatus:
         self.NetworkInterfaces = NetworkInterfaces()
         self.Processes = Processes()
         self._cached_status = {}
+        self._listeners = []
         
         # Prime process CPU percentages (first call to cpu_percent() always returns 0)
         try:
@@ -77,11 +78,17 @@ class SystemStatus:
                     "NetworkInterfacesPriority": self.NetworkInterfaces.getInterfacePriorities(),
                     "Processes": self.Processes.toJson()
                 }
+                for listener in list(self._listeners):
+                    listener(self._cached_status)
             except Exception as e:
                 logger.error(f"SystemStatus monitoring loop error: {e}", exc_info=True)
 
             self._stop_event.wait(5)
 
+    def addListener(self, listener):
+        """Calls listener with every new status snapshot, from the monitoring thread."""
+        self._listeners.append(listener)
+
     def stop(self):
         """Signals the background monitoring thread to stop."""
         self._stop_event.set()
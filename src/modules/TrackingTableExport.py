@@ -0,0 +1,84 @@
+"""
+Tracking Table Export
+"""
+import csv, io, json, zlib
+from datetime import datetime
+from typing import Iterable
+
+
+class TrackingTableExport:
+    """
+    Turns streamed tracking table rows into CSV or NDJSON chunks, optionally gzip compressed
+    """
+    FORMATS = {
+        "csv": "text/csv",
+        "ndjson": "application/x-ndjson"
+    }
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, columns: list[str], rows: Iterable, exportFormat: str = "csv",
+                 compress: bool = False, dumps=json.dumps):
+        """
+        @param columns: Column names, also the CSV header
+        @param rows: Row mappings, consumed lazily
+        @param exportFormat: csv or ndjson
+        @param compress: Gzip the output
+        @param dumps: JSON serializer for NDJSON lines
+        """
+        if exportFormat not in self.FORMATS:
+            raise ValueError(f"Format must be one of {', '.join(self.FORMATS.keys())}")
+        self.Columns = columns
+        self.Rows = rows
+        self.Format = exportFormat
+        self.Compress = compress
+        self.__dumps = dumps
+
+    @property
+    def mimetype(self) -> str:
+        return "application/gzip" if self.Compress else self.FORMATS[self.Format]
+
+    def filename(self, name: str) -> str:
+        return f"{name}.{self.Format}" + (".gz" if self.Compress else "")
+
+    @staticmethod
+    def __value(value):
+        if type(value) is datetime:
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        return value
+
+    def __csvChunks(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.Columns)
+        for row in self.Rows:
+            writer.writerow([self.__value(row[c]) for c in self.Columns])
+            if buffer.tell() >= self.CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def __ndjsonChunks(self):
+        lines, size = [], 0
+        for row in self.Rows:
+            line = self.__dumps({c: self.__value(row[c]) for c in self.Columns})
+            lines.append(line)
+            size += len(line) + 1
+            if size >= self.CHUNK_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines, size = [], 0
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    def __iter__(self):
+        chunks = self.__csvChunks() if self.Format == "csv" else self.__ndjsonChunks()
+        if not self.Compress:
+            for chunk in chunks:
+                yield chunk.encode()
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
@@ -1,6 +1,7 @@
 import re, ipaddress
 import subprocess
 from .WireguardCLI import WireguardCLI
+from . import WireguardKeys
 
 
 def RegexMatch(regex, text) -> bool:
@@ -78,20 +79,61 @@ def IsIPInSubnet(ip: str, subnet: str) -> bool:
         return False
 
 def GenerateWireguardPublicKey(privateKey: str) -> tuple[bool, str] | tuple[bool, None]:
+    if WireguardKeys.KeyBackend == "cryptography":
+        try:
+            return True, WireguardKeys.GeneratePublicKey(privateKey)
+        except ValueError:
+            return False, None
+        except Exception:
+            pass
     try:
         publicKey = WireguardCLI.run(["wg", "pubkey"], input=privateKey.encode(),
                                      timeout=10)
         return True, publicKey.decode().strip('\n')
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         return False, None
+    except OSError:
+        pass
+    # Last resort, neither cryptography nor wg is available
+    try:
+        return True, WireguardKeys.GeneratePublicKey(privateKey)
+    except ValueError:
+        return False, None
 
 def GenerateWireguardPrivateKey() -> tuple[bool, str] | tuple[bool, None]:
+    try:
+        return True, WireguardKeys.GeneratePrivateKey()
+    except Exception:
+        pass
     try:
         publicKey = WireguardCLI.run(["wg", "genkey"],
                                      timeout=10)
         return True, publicKey.decode().strip('\n')
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-        return False, None    
+        return False, None
+
+def GenerateWireguardKeyPairs(amount: int) -> tuple[bool, list[tuple[str, str]]]:
+    """
+    Generate multiple key pairs at once
+    @param amount: Number of key pairs
+    @return: Status and a list of (private key, public key)
+    """
+    if WireguardKeys.KeyBackend == "cryptography":
+        try:
+            return True, WireguardKeys.GenerateKeyPairs(amount)
+        except Exception:
+            pass
+    pairs = []
+    for _ in range(amount):
+        status, privateKey = GenerateWireguardPrivateKey()
+        if not status:
+            return False, []
+        status, publicKey = GenerateWireguardPublicKey(privateKey)
+        if not status:
+            return False, []
+        pairs.append((privateKey, publicKey))
+    return True, pairs
+
 def ValidatePasswordStrength(password: str) -> tuple[bool, str] | tuple[bool, None]:
     # Rules:
     #     - Must be over 8 characters & numbers
@@ -17,13 +17,7 @@ class WireguardCLI:
             if any(x in cmd_0 for x in ["wg", "awg"]):
                 interface_name = command_list[2]
 
-        if interface_name:
-            with WireguardCLI._global_lock:
-                if interface_name not in WireguardCLI._locks:
-                    WireguardCLI._locks[interface_name] = threading.Lock()
-                lock = WireguardCLI._locks[interface_name]
-        else:
-            lock = WireguardCLI._global_lock
+        lock = WireguardCLI.interfaceLock(interface_name) if interface_name else WireguardCLI._global_lock
 
         with lock:
             try:
@@ -36,3 +30,135 @@ class WireguardCLI:
                 raise e
             except subprocess.TimeoutExpired as e:
                 raise e
+
+    @staticmethod
+    def interfaceLock(interface_name: str) -> threading.RLock:
+        """
+        Lock held by run() for every command on an interface, hold it to make several commands atomic
+        @param interface_name: Interface name
+        """
+        with WireguardCLI._global_lock:
+            if interface_name not in WireguardCLI._locks:
+                WireguardCLI._locks[interface_name] = threading.RLock()
+            return WireguardCLI._locks[interface_name]
+
+    StatsBackend = None
+
+    @staticmethod
+    def peerStats(protocol: str, interface: str) -> list[tuple[str, str, int, int, int]]:
+        """
+        Read the runtime counters of every peer on an interface
+        @param protocol: wg or awg
+        @param interface: Interface name
+        @return: List of (public key, endpoint, latest handshake timestamp, rx bytes, tx bytes)
+        """
+        backend = WireguardCLI.StatsBackend
+        if backend is not None and backend.available(protocol):
+            try:
+                return backend.peerStats(protocol, interface)
+            except Exception:
+                pass
+        return DumpStatsBackend.peerStats(protocol, interface)
+
+
+class DumpStatsBackend:
+    """
+    Parses the output of `wg show <interface> dump`, works for every protocol
+    """
+    name = "dump"
+
+    @staticmethod
+    def available(protocol: str) -> bool:
+        return True
+
+    @staticmethod
+    def peerStats(protocol: str, interface: str) -> list[tuple[str, str, int, int, int]]:
+        return DumpStatsBackend.parse(WireguardCLI.run([protocol, "show", interface, "dump"], timeout=10))
+
+    @staticmethod
+    def parse(output: bytes) -> list[tuple[str, str, int, int, int]]:
+        stats = []
+        # The first line describes the interface itself
+        for line in output.decode("UTF-8").strip().split("\n")[1:]:
+            parts = line.split("\t")
+            if len(parts) < 8:
+                continue
+            try:
+                stats.append((parts[0], parts[2], int(parts[4]), int(parts[5]), int(parts[6])))
+            except ValueError:
+                continue
+        return stats
+
+
+class NetlinkStatsBackend:
+    """
+    Reads peer counters over the WireGuard generic netlink family through pyroute2, without spawning wg.
+    Only the kernel wg module is supported, awg interfaces keep using the dump parser
+    """
+    name = "netlink"
+
+    def __init__(self, socketFactory=None):
+        self.__socketFactory = socketFactory
+        self.__socket = None
+        self.__disabled = False
+        self.__lock = threading.Lock()
+
+    def available(self, protocol: str) -> bool:
+        return protocol == "wg" and not self.__disabled
+
+    def __getSocket(self):
+        if self.__socket is None:
+            try:
+                if self.__socketFactory is None:
+                    from pyroute2 import WireGuard
+                    self.__socketFactory = WireGuard
+                self.__socket = self.__socketFactory()
+            except Exception:
+                # pyroute2 missing or the wireguard family is not registered, stop trying
+                self.__disabled = True
+                raise
+        return self.__socket
+
+    def peerStats(self, protocol: str, interface: str) -> list[tuple[str, str, int, int, int]]:
+        with self.__lock:
+            sock = self.__getSocket()
+            try:
+                messages = sock.info(interface)
+            except Exception:
+                self.__socket = None
+                try:
+                    sock.close()
+                except Exception:
+                    pass
+                raise
+            return NetlinkStatsBackend.parse(messages)
+
+    @staticmethod
+    def parse(messages) -> list[tuple[str, str, int, int, int]]:
+        stats = []
+        for msg in messages:
+            for peer in msg.get_attr('WGDEVICE_A_PEERS') or []:
+                publicKey = peer.get_attr('WGPEER_A_PUBLIC_KEY')
+                if publicKey is None:
+                    continue
+                if isinstance(publicKey, bytes):
+                    publicKey = publicKey.decode()
+                endpoint = peer.get_attr('WGPEER_A_ENDPOINT')
+                if endpoint is None:
+                    endpoint = "(none)"
+                elif ":" in endpoint['addr']:
+                    endpoint = f"[{endpoint['addr']}]:{endpoint['port']}"
+                else:
+                    endpoint = f"{endpoint['addr']}:{endpoint['port']}"
+                handshake = peer.get_attr('WGPEER_A_LAST_HANDSHAKE_TIME')
+                stats.append((
+                    publicKey,
+                    endpoint,
+                    handshake['tv_sec'] if handshake is not None else 0,
+                    peer.get_attr('WGPEER_A_RX_BYTES') or 0,
+                    peer.get_attr('WGPEER_A_TX_BYTES') or 0
+                ))
+        return stats
+
+
+WireguardCLI.StatsBackend = NetlinkStatsBackend()
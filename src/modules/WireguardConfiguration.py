@@ -5,15 +5,15 @@ from typing import Any
 
 import jinja2
 import jinja2.sandbox
-import sqlalchemy, random, shutil, configparser, ipaddress, os, subprocess, time, re, uuid, psutil, traceback
+import sqlalchemy, random, shutil, configparser, ipaddress, os, subprocess, time, re, uuid, psutil, traceback, tempfile, base64, json
 from zipfile import ZipFile
 from datetime import datetime, timedelta
-from itertools import islice
 from flask import current_app
 
 from .WireguardCLI import WireguardCLI
 from .ConnectionString import ConnectionString, CreateEngine
 from .DashboardConfig import DashboardConfig
+from .DatabaseMigrations import DatabaseMigrations
 from .Peer import Peer
 from .PeerJobs import PeerJobs
 from .PeerShareLinks import PeerShareLinks
@@ -21,11 +21,41 @@ from .Utilities import StringToBoolean, GenerateWireguardPublicKey, RegexMatch,
     ValidateEndpointAllowedIPs
 from .WireguardConfigurationInfo import WireguardConfigurationInfo, PeerGroupsClass
 from .DashboardWebHooks import DashboardWebHooks
+from .IPAllocator import IPAllocator
 
 
 class WireguardConfiguration:
     INTERFACE_KEYS = ["PrivateKey", "Address", "ListenPort", "DNS", "MTU", "Table", "PreUp", "PostUp", "PreDown", "PostDown", "SaveConfig"]
     AWG_INTERFACE_KEYS = ["Jc", "Jmin", "Jmax", "S1", "S2", "H1", "H2", "H3", "H4"]
+    # (table suffix, bucket size, how long buckets are kept), each level is built from the previous one
+    TRANSFER_ROLLUPS = [
+        ("5m", timedelta(minutes=5), timedelta(days=30)),
+        ("1h", timedelta(hours=1), timedelta(days=365)),
+        ("1d", timedelta(days=1), None)
+    ]
+    # getTraffics picks the coarsest resolution still giving at least this many points
+    TRAFFIC_MINIMUM_POINTS = 100
+    PEER_SORT_KEYS = ["status", "name", "total_data", "latest_handshake"]
+    PEER_STATUS_FILTERS = ["running", "stopped", "restricted"]
+    # Rows fetched per round trip when exporting tracking tables
+    STREAM_BATCH_SIZE = 1000
+    # Bumped whenever peers or settings change, clients use it to skip unchanged polls
+    Version: int = 0
+    __epoch: str | None = None
+    # Version each peer last changed at, ordered oldest first, and the same for removed peers
+    __peerVersions: dict[str, int] | None = None
+    __removedPeerVersions: dict[str, int] | None = None
+    # Changes at or before this version are no longer fully known, e.g. trimmed removals
+    __changesFloor: int = 0
+    REMOVED_PEERS_KEPT = 10000
+    # Handshake ages are derived when a peer is serialised, a cached response may show them this much behind
+    HANDSHAKE_AGE_SECONDS = 60
+    # (peer id, endpoint) pairs already in the history endpoint table, None until first loaded
+    __historyEndpoints: set | None = None
+    # Addresses used by peers and restricted peers, None until first asked for available addresses
+    __ipAllocator: IPAllocator | None = None
+    # Modification time of the configuration file when it was last parsed or saved
+    __configFileModifiedTime: float | None = None
 
     class InvalidConfigurationFileException(Exception):
         def __init__(self, m):
@@ -45,6 +75,8 @@ class WireguardConfiguration:
                  wg: bool = True
                  ):
         self.Peers = []
+        self.PeerIndex: dict[str, Peer] = {}
+        self.RestrictedPeerIndex: dict[str, Peer] = {}
         self.__parser: configparser.ConfigParser = configparser.RawConfigParser(strict=False)
         self.__parser.optionxform = str
         self.__configFileModifiedTime = None
@@ -129,7 +161,6 @@ class WireguardConfiguration:
             os.mkdir(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup'))
 
         current_app.logger.info(f"Initialized Configuration: {name}")
-        self.__dumpDatabase()
         if self.getAutostartStatus() and not self.getStatus() and startup:
             self.toggleConfiguration()
             current_app.logger.info(f"Autostart Configuration: {name}")
@@ -153,8 +184,10 @@ class WireguardConfiguration:
 
     def __initPeersList(self):
         self.Peers: list[Peer] = []
+        self.PeerIndex = {}
+        self.RestrictedPeerIndex = {}
         self.getPeers()
-        self.getRestrictedPeersList()
+        self.getRestrictedPeers()
 
     def getRawConfigurationFile(self):
         with open(self.configPath, 'r') as f:
@@ -221,9 +254,11 @@ class WireguardConfiguration:
             if self.PrivateKey:
                 self.PublicKey = self.__getPublicKey()
             self.Status = self.getStatus()
+            self.bumpVersion()
 
     def __dropDatabase(self):
-        existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted']
+        existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted'] + \
+                         [f'{self.Name}_transfer_{name}' for name, _, _ in self.TRANSFER_ROLLUPS]
         try:
             with self.engine.begin() as conn:
                 for t in existingTables:
@@ -232,6 +267,7 @@ class WireguardConfiguration:
                             f'DROP TABLE "{t}"'
                         )
                     )
+            DatabaseMigrations.forEngine(self.engine).reset(self.Name)
         except Exception as e:
             current_app.logger.error("Dropping table failed")
             return False
@@ -240,72 +276,6 @@ class WireguardConfiguration:
     def createDatabase(self, dbName = None):
         if dbName is None:
             dbName = self.Name
-        
-        # Check if we need to migrate from Float (GB) to BigInteger (Bytes)
-        # We do this by checking if the columns are currently Float
-        inspector = sqlalchemy.inspect(self.engine)
-        needs_migration = False
-        migration_id = f'float_to_bigint_v1_{dbName}'
-        migration_applied = False
-
-        if inspector.has_table('wgd_migrations'):
-            with self.engine.connect() as conn:
-                res = conn.execute(sqlalchemy.text("SELECT id FROM wgd_migrations WHERE id = :id"), {"id": migration_id}).fetchone()
-                if res:
-                    migration_applied = True
-
-        if not migration_applied and inspector.has_table(dbName):
-            columns = inspector.get_columns(dbName)
-            for col in columns:
-                if col['name'] == 'total_receive' and isinstance(col['type'], sqlalchemy.Float):
-                    needs_migration = True
-                    break
-        
-        if needs_migration:
-            current_app.logger.info(f"Migrating database {dbName} from Float (GB) to BigInteger (Bytes)")
-            GB_TO_BYTES = 1024**3
-            tables_to_migrate = [dbName, f'{dbName}_restrict_access', f'{dbName}_transfer', f'{dbName}_deleted']
-            with self.engine.begin() as conn:
-                for t in tables_to_migrate:
-                    if inspector.has_table(t):
-                        # Use CASE to avoid re-multiplying if data already looks like bytes (> 1M GB is unlikely)
-                        conn.execute(sqlalchemy.text(f"""
-                            UPDATE "{t}" SET 
-                                total_receive = CAST(CASE WHEN total_receive < 1000000 THEN total_receive * {GB_TO_BYTES} ELSE total_receive END AS INTEGER),
-                                total_sent = CAST(CASE WHEN total_sent < 1000000 THEN total_sent * {GB_TO_BYTES} ELSE total_sent END AS INTEGER),
-                                total_data = CAST(CASE WHEN total_data < 1000000 THEN total_data * {GB_TO_BYTES} ELSE total_data END AS INTEGER),
-                                cumu_receive = CAST(CASE WHEN cumu_receive < 1000000 THEN cumu_receive * {GB_TO_BYTES} ELSE cumu_receive END AS INTEGER),
-                                cumu_sent = CAST(CASE WHEN cumu_sent < 1000000 THEN cumu_sent * {GB_TO_BYTES} ELSE cumu_sent END AS INTEGER),
-                                cumu_data = CAST(CASE WHEN cumu_data < 1000000 THEN cumu_data * {GB_TO_BYTES} ELSE cumu_data END AS INTEGER)
-                        """))
-
-        # Normalize potentially corrupted data (Task 2)
-        if not migration_applied and inspector.has_table(dbName):
-            current_app.logger.info(f"Checking for corrupted data in {dbName}")
-            THRESHOLD = 1024**5 # 1 PB
-            GB_TO_BYTES = 1024**3
-            cols_to_fix = ['total_receive', 'total_sent', 'total_data', 'cumu_receive', 'cumu_sent', 'cumu_data']
-            tables_to_check = [dbName, f'{dbName}_restrict_access', f'{dbName}_transfer', f'{dbName}_deleted']
-            with self.engine.begin() as conn:
-                for t in tables_to_check:
-                    if inspector.has_table(t):
-                        rows = conn.execute(sqlalchemy.text(f'SELECT * FROM "{t}"')).mappings().fetchall()
-                        for row in rows:
-                            updates = {}
-                            for col in cols_to_fix:
-                                if col in row and row[col] is not None and row[col] > THRESHOLD:
-                                    val = row[col]
-                                    while val > THRESHOLD:
-                                        val //= GB_TO_BYTES
-                                    updates[col] = val
-                            if updates:
-                                if 'id' in row:
-                                    where_clause = 'id = :row_id'
-                                    params = {**updates, "row_id": row['id']}
-                                    if t.endswith('_transfer') and 'time' in row:
-                                        where_clause += ' AND time = :row_time'
-                                        params['row_time'] = row['time']
-                                    conn.execute(sqlalchemy.text(f'UPDATE "{t}" SET ' + ', '.join([f'{k} = :{k}' for k in updates.keys()]) + f' WHERE {where_clause}'), params)
 
         self.peersTable = sqlalchemy.Table(
             dbName, self.metadata,
@@ -328,6 +298,7 @@ class WireguardConfiguration:
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
         self.peersRestrictedTable = sqlalchemy.Table(
@@ -351,6 +322,7 @@ class WireguardConfiguration:
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
         self.peersTransferTable = sqlalchemy.Table(
@@ -397,9 +369,12 @@ class WireguardConfiguration:
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('preshared_key', sqlalchemy.String(255)),
+            sqlalchemy.Column('latest_handshake_at', sqlalchemy.BigInteger),
             extend_existing=True
         )
 
+        self._createTransferRollupTables(dbName)
+
         self.infoTable = sqlalchemy.Table(
             'ConfigurationsInfo', self.metadata,
             sqlalchemy.Column('ID', sqlalchemy.String(255), primary_key=True),
@@ -414,12 +389,48 @@ class WireguardConfiguration:
             extend_existing=True
         )
 
-        self.metadata.create_all(self.engine)
+        DatabaseMigrations.forEngine(self.engine).migrate(self, dbName)
 
-        if not migration_applied:
-            with self.engine.begin() as conn:
-                conn.execute(self.migrationsTable.insert().values(id=migration_id))
 
+    def _createTrackingIndexes(self, dbName):
+        """
+        Index the tracking tables so per-peer history lookups stop scanning the whole table.
+        Existing databases get the indexes built once, recorded in wgd_migrations
+        """
+        migration_id = f'tracking_indexes_v1_{dbName}'
+        indexes = [
+            (self.peersTransferTable, f'ix_{dbName}_transfer_id_time', ('id', 'time')),
+            (self.peersTransferTable, f'ix_{dbName}_transfer_time', ('time',)),
+            (self.peersHistoryEndpointTable, f'ix_{dbName}_history_endpoint_id_endpoint', ('id', 'endpoint')),
+        ]
+        with self.engine.begin() as conn:
+            if conn.execute(
+                self.migrationsTable.select().where(self.migrationsTable.c.id == migration_id)
+            ).first() is not None:
+                return
+            for table, name, columns in indexes:
+                index = next((i for i in table.indexes if i.name == name), None)
+                if index is None:
+                    index = sqlalchemy.Index(name, *[table.c[c] for c in columns])
+                index.create(conn, checkfirst=True)
+            conn.execute(self.migrationsTable.insert().values(id=migration_id))
+
+    def _createTransferRollupTables(self, dbName):
+        self.peersTransferRollupTables = {}
+        for name, _, _ in self.TRANSFER_ROLLUPS:
+            self.peersTransferRollupTables[name] = sqlalchemy.Table(
+                f'{dbName}_transfer_{name}', self.metadata,
+                sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False, primary_key=True),
+                sqlalchemy.Column('time', (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP),
+                                  nullable=False, primary_key=True),
+                sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+                sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+                sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
+                sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+                sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+                sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
+                extend_existing=True
+            )
 
     def __dumpDatabase(self):
         with self.engine.connect() as conn:
@@ -486,13 +497,103 @@ class WireguardConfiguration:
         self.RestrictedPeers = []
         with self.engine.connect() as conn:
             restricted = conn.execute(self.peersRestrictedTable.select()).mappings().fetchall()
-            for i in restricted:
-                self.RestrictedPeers.append(Peer(i, self))
+        changed = []
+        for i in restricted:
+            peer = self.RestrictedPeerIndex.get(i["id"])
+            if peer is None:
+                peer = self._newPeer(i)
+                changed.append(peer.id)
+            else:
+                if self.__rowChanged(peer, i):
+                    peer.loadTableData(i)
+                    changed.append(peer.id)
+                peer.getJobs()
+                peer.getShareLink()
+            self.RestrictedPeers.append(peer)
+        index = {p.id: p for p in self.RestrictedPeers}
+        removed = [k for k in self.RestrictedPeerIndex.keys() if k not in index and k not in self.PeerIndex]
+        if changed or removed:
+            self.bumpVersion(changed, removed)
+        self.RestrictedPeerIndex = index
+
+    @property
+    def Epoch(self) -> str:
+        """
+        Identifies this instance, a configuration built again starts its Version over under a new Epoch
+        """
+        if self.__epoch is None:
+            self.__epoch = uuid.uuid4().hex[:8]
+        return self.__epoch
+
+    def handshakeAgeBucket(self) -> int | None:
+        """
+        Part of a response tag that moves on while peers show handshake ages, which change without a version bump
+        @return: None when no peer has a handshake
+        """
+        if any(p.latest_handshake_at for p in self.Peers) or \
+                any(p.latest_handshake_at for p in self.RestrictedPeerIndex.values()):
+            return int(time.time() // self.HANDSHAKE_AGE_SECONDS)
+        return None
+
+    def bumpVersion(self, changedPeers: list[str] = (), removedPeers: list[str] = ()):
+        """
+        Mark peers or settings of this configuration as changed
+        @param changedPeers: Public keys of peers that were added or changed
+        @param removedPeers: Public keys of peers that no longer exist
+        """
+        if self.__peerVersions is None:
+            self.__peerVersions = {}
+            self.__removedPeerVersions = {}
+        self.Version += 1
+        for i in changedPeers:
+            # Re-inserting keeps both dicts ordered by version
+            self.__peerVersions.pop(i, None)
+            self.__peerVersions[i] = self.Version
+            self.__removedPeerVersions.pop(i, None)
+        for i in removedPeers:
+            self.__peerVersions.pop(i, None)
+            self.__removedPeerVersions.pop(i, None)
+            self.__removedPeerVersions[i] = self.Version
+        while len(self.__removedPeerVersions) > self.REMOVED_PEERS_KEPT:
+            oldest = next(iter(self.__removedPeerVersions))
+            self.__changesFloor = self.__removedPeerVersions.pop(oldest)
+
+    def getPeerChanges(self, since: int) -> dict | None:
+        """
+        Peers changed or removed after a version
+        @param since: Version the client last synced at
+        @return: Changed peers, changed restricted peers and removed public keys, None when only a full sync can answer
+        """
+        if since > self.Version or since < self.__changesFloor:
+            return None
+        # Copied in one step, the poller may bump versions while this runs
+        changed = list((self.__peerVersions or {}).items())
+        removed = list((self.__removedPeerVersions or {}).items())
+        result = {"peers": [], "restrictedPeers": [], "removedPeers": []}
+        for peerId, version in reversed(changed):
+            if version <= since:
+                break
+            if peerId in self.PeerIndex:
+                result["peers"].append(self.PeerIndex[peerId])
+            elif peerId in self.RestrictedPeerIndex:
+                result["restrictedPeers"].append(self.RestrictedPeerIndex[peerId])
+        for peerId, version in reversed(removed):
+            if version <= since:
+                break
+            result["removedPeers"].append(peerId)
+        return result
 
-    def configurationFileChanged(self) :
+    @staticmethod
+    def __rowChanged(peer: Peer, tableData) -> bool:
+        # With a handshake time the age is derived from it, so the stored age is not compared
+        return any(getattr(peer, key, None) != value for key, value in tableData.items()
+                   if key != "latest_handshake" or not tableData.get("latest_handshake_at"))
+
+    def configurationFileChanged(self, update: bool = True):
         mt = os.path.getmtime(self.configPath)
         changed = self.__configFileModifiedTime is None or self.__configFileModifiedTime != mt
-        self.__configFileModifiedTime = mt
+        if update:
+            self.__configFileModifiedTime = mt
         return changed
 
     def getPeers(self):
@@ -505,6 +606,8 @@ class WireguardConfiguration:
                 try:
                     if "[Peer]" not in content:
                         current_app.logger.info(f"{self.Name} config has no [Peer] section")
+                        self.Peers = tmpList
+                        self._indexPeers(tmpList)
                         return
 
                     peerStarts = content.index("[Peer]")
@@ -526,6 +629,7 @@ class WireguardConfiguration:
                             if len(split) == 2:
                                 p[pCounter]["name"] = split[1]
                     
+                    config = self.DashboardConfig.Snapshot
                     for i in p:
                         if "PublicKey" in i.keys():
                             with self.engine.connect() as conn:
@@ -539,9 +643,8 @@ class WireguardConfiguration:
                                 tempPeer = {
                                     "id": i['PublicKey'],
                                     "private_key": "",
-                                    "DNS": self.DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
-                                    "endpoint_allowed_ip": self.DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
-                                        1],
+                                    "DNS": config.PeerGlobalDNS,
+                                    "endpoint_allowed_ip": config.PeerEndpointAllowedIP,
                                     "name": i.get("name"),
                                     "total_receive": 0,
                                     "total_sent": 0,
@@ -553,9 +656,9 @@ class WireguardConfiguration:
                                     "cumu_receive": 0,
                                     "cumu_sent": 0,
                                     "cumu_data": 0,
-                                    "mtu": self.DashboardConfig.GetConfig("Peers", "peer_mtu")[1] if len(self.DashboardConfig.GetConfig("Peers", "peer_mtu")[1]) > 0 else None,
-                                    "keepalive": self.DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1] if len(self.DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1]) > 0 else None,
-                                    "remote_endpoint": self.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                                    "mtu": config.PeerMTU if len(config.PeerMTU) > 0 else None,
+                                    "keepalive": config.PeerKeepAlive if len(config.PeerKeepAlive) > 0 else None,
+                                    "remote_endpoint": config.PeerRemoteEndpoint,
                                     "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
                                 }
                                 with self.engine.begin() as conn:
@@ -571,61 +674,241 @@ class WireguardConfiguration:
                                             self.peersTable.columns.id == i['PublicKey']
                                         )
                                     )
-                            tmpList.append(Peer(tempPeer, self))
+                                tempPeer = {**tempPeer, "allowed_ip": i.get("AllowedIPs", "N/A")}
+                            tmpList.append(self._loadPeer(tempPeer))
                 except Exception as e:
                     current_app.logger.error(f"{self.Name} getPeers() Error", e)
         else:
             with self.engine.connect() as conn:
                 existingPeers = conn.execute(self.peersTable.select()).mappings().fetchall()
                 for i in existingPeers:
-                    tmpList.append(Peer(i, self))
+                    tmpList.append(self._loadPeer(i))
         self.Peers = tmpList
+        self._indexPeers(tmpList)
+
+    def _loadPeer(self, tableData, peerClass=Peer) -> Peer:
+        """
+        Refresh the Peer already held in the registry, or create one if this public key is new
+        @param tableData: Row mapping or dict from the peers table
+        @param peerClass: Class used when the peer is not in the registry yet
+        """
+        peer = self.PeerIndex.get(tableData["id"])
+        if peer is None:
+            if self.__ipAllocator is not None:
+                self.__ipAllocator.use(tableData["allowed_ip"])
+            peer = peerClass(tableData, self)
+            self.bumpVersion([peer.id])
+            return peer
+        if self.__ipAllocator is not None and peer.allowed_ip != tableData["allowed_ip"]:
+            self.__ipAllocator.release(peer.allowed_ip)
+            self.__ipAllocator.use(tableData["allowed_ip"])
+        if self.__rowChanged(peer, tableData):
+            peer.loadTableData(tableData)
+            self.bumpVersion([peer.id])
+        return peer
+
+    def _indexPeers(self, peers: list):
+        """
+        Replace the peer registry, releasing the addresses of peers that are gone
+        @param peers: Peers loaded by getPeers
+        """
+        index = {p.id: p for p in peers}
+        removed = [k for k in self.PeerIndex.keys() if k not in index and k not in self.RestrictedPeerIndex]
+        if self.__ipAllocator is not None:
+            for peerId in removed:
+                self.__ipAllocator.release(self.PeerIndex[peerId].allowed_ip)
+        self.PeerIndex = index
+        if removed:
+            self.bumpVersion(removedPeers=removed)
+
+    def __getIPAllocator(self) -> IPAllocator:
+        if self.__ipAllocator is None or self.__ipAllocator.Address != self.Address:
+            allocator = IPAllocator(self.Address)
+            for ca in allocator.InvalidAddresses:
+                current_app.logger.error(f"Error: Failed to parse IP address {ca} from {self.Name}")
+            for p in self.Peers + self.getRestrictedPeersList():
+                allocator.use(p.allowed_ip)
+            self.__ipAllocator = allocator
+        return self.__ipAllocator
     
-    def logPeersTraffic(self):
+    def logPeersTraffic(self, chunkSize: int = 5000):
+        now = datetime.now()
+        rows = [{
+            "id": tempPeer.id,
+            "total_receive": tempPeer.total_receive,
+            "total_sent": tempPeer.total_sent,
+            "total_data": tempPeer.total_data,
+            "cumu_sent": tempPeer.cumu_sent,
+            "cumu_receive": tempPeer.cumu_receive,
+            "cumu_data": tempPeer.cumu_data,
+            "time": now
+        } for tempPeer in self.Peers if tempPeer.status == "running"]
+        if not rows:
+            return
         with self.engine.begin() as conn:
-            for tempPeer in self.Peers:
-                if tempPeer.status == "running":
-                    conn.execute(
-                        self.peersTransferTable.insert().values({
-                            "id": tempPeer.id,
-                            "total_receive": tempPeer.total_receive,
-                            "total_sent": tempPeer.total_sent,
-                            "total_data": tempPeer.total_data,
-                            "cumu_sent": tempPeer.cumu_sent,
-                            "cumu_receive": tempPeer.cumu_receive,
-                            "cumu_data": tempPeer.cumu_data,
-                            "time": datetime.now()
-                        })
-                    )
+            for i in range(0, len(rows), chunkSize):
+                conn.execute(self.peersTransferTable.insert(), rows[i:i + chunkSize])
     
+    @staticmethod
+    def __bucketStart(t: datetime, period: timedelta) -> datetime:
+        epoch = datetime(1970, 1, 1)
+        return epoch + ((t - epoch) // period) * period
+
+    def __rawTransferRetention(self) -> timedelta | None:
+        status, days = self.DashboardConfig.GetConfig("Peers", "peer_traffic_raw_retention_days")
+        try:
+            days = int(days)
+        except (TypeError, ValueError):
+            return None
+        return timedelta(days=days) if status and days > 0 else None
+
+    def rollupPeersTraffic(self):
+        """
+        Downsample the transfer history into the rollup tables and prune rows past their retention.
+        A bucket keeps the last sample taken inside it, and only complete buckets are written,
+        so every run only reads the rows logged since the previous one
+        """
+        now = datetime.now()
+        source = self.peersTransferTable
+        sourceRetention = self.__rawTransferRetention()
+        for name, period, retention in self.TRANSFER_ROLLUPS:
+            table = self.peersTransferRollupTables[name]
+            end = self.__bucketStart(now, period)
+            with self.engine.begin() as conn:
+                latest = conn.execute(sqlalchemy.select(sqlalchemy.func.max(table.c.time))).scalar()
+                start = latest + period if latest is not None else conn.execute(
+                    sqlalchemy.select(sqlalchemy.func.min(source.c.time))
+                ).scalar()
+                # Read a few buckets at a time so a large backlog never has to fit in memory
+                while start is not None and start < end:
+                    start = self.__bucketStart(start, period)
+                    windowEnd = min(start + period * 6, end)
+                    rows = conn.execute(
+                        sqlalchemy.select(
+                            source.c.id, source.c.time,
+                            source.c.total_receive, source.c.total_sent, source.c.total_data,
+                            source.c.cumu_receive, source.c.cumu_sent, source.c.cumu_data
+                        ).where(
+                            sqlalchemy.and_(source.c.time >= start, source.c.time < windowEnd)
+                        ).order_by(source.c.time)
+                    ).mappings().fetchall()
+                    buckets = {}
+                    for row in rows:
+                        buckets[(row['id'], self.__bucketStart(row['time'], period))] = row
+                    if buckets:
+                        conn.execute(table.insert(), [{**row, "time": key[1]} for key, row in buckets.items()])
+                    start = conn.execute(
+                        sqlalchemy.select(sqlalchemy.func.min(source.c.time)).where(
+                            sqlalchemy.and_(source.c.time >= windowEnd, source.c.time < end)
+                        )
+                    ).scalar()
+
+                # Rows are only pruned once they made it into this level
+                if sourceRetention is not None:
+                    conn.execute(source.delete().where(source.c.time < min(now - sourceRetention, end)))
+            source = table
+            sourceRetention = retention
+
+    def getPeerTransferHistory(self, peerId: str, startDate: datetime, endDate: datetime) -> list[dict]:
+        """
+        Transfer history of a peer, read from the coarsest table that still gives a useful number of points
+        @param peerId: Public key of the peer
+        @param startDate: Start of the range
+        @param endDate: End of the range
+        @return: List of rows ordered by time
+        """
+        level = 0
+        for i, (_, period, _) in enumerate(self.TRANSFER_ROLLUPS, start=1):
+            if (endDate - startDate) / period >= self.TRAFFIC_MINIMUM_POINTS:
+                level = i
+        # A finer level no longer holds rows that old, move on to the first one whose retention covers the start
+        now = datetime.now()
+        while level < len(self.TRANSFER_ROLLUPS):
+            retention = self.__rawTransferRetention() if level == 0 else self.TRANSFER_ROLLUPS[level - 1][2]
+            if retention is None or startDate >= now - retention:
+                break
+            level += 1
+        return self.__transferRows(level, peerId, startDate, endDate)
+
+    def __transferRows(self, level: int, peerId: str, startDate: datetime, endDate: datetime) -> list[dict]:
+        table = self.peersTransferTable if level == 0 else self.peersTransferRollupTables[self.TRANSFER_ROLLUPS[level - 1][0]]
+        with self.engine.connect() as conn:
+            rows = [dict(r) for r in conn.execute(
+                sqlalchemy.select(
+                    table.c.cumu_data, table.c.total_data,
+                    table.c.cumu_receive, table.c.total_receive,
+                    table.c.cumu_sent, table.c.total_sent,
+                    table.c.time
+                ).where(
+                    sqlalchemy.and_(table.c.id == peerId, table.c.time <= endDate, table.c.time >= startDate)
+                ).order_by(table.c.time)
+            ).mappings()]
+            if level == 0:
+                return rows
+            latest = conn.execute(
+                sqlalchemy.select(sqlalchemy.func.max(table.c.time)).where(table.c.id == peerId)
+            ).scalar()
+        # The current bucket is not rolled up yet, take it from the next finer level
+        covered = startDate if latest is None else max(startDate, latest + self.TRANSFER_ROLLUPS[level - 1][1])
+        if covered <= endDate:
+            rows.extend(self.__transferRows(level - 1, peerId, covered, endDate))
+        return rows
+
+    def getPeerSessionTimes(self, peerId: str, startDate: datetime, endDate: datetime) -> list[datetime]:
+        """
+        Sample times of a peer, using the 5 minutes rollup for the part that is past the raw retention
+        """
+        raw = self.peersTransferTable
+        fine = self.peersTransferRollupTables[self.TRANSFER_ROLLUPS[0][0]]
+        with self.engine.connect() as conn:
+            earliestRaw = conn.execute(
+                sqlalchemy.select(sqlalchemy.func.min(raw.c.time)).where(raw.c.id == peerId)
+            ).scalar()
+            times = []
+            if earliestRaw is None or startDate < earliestRaw:
+                times = list(conn.execute(
+                    sqlalchemy.select(fine.c.time).where(
+                        sqlalchemy.and_(fine.c.id == peerId, fine.c.time >= startDate, fine.c.time <= endDate,
+                                        *([fine.c.time < earliestRaw] if earliestRaw is not None else []))
+                    ).order_by(fine.c.time)
+                ).scalars())
+            times.extend(conn.execute(
+                sqlalchemy.select(raw.c.time).where(
+                    sqlalchemy.and_(raw.c.id == peerId, raw.c.time >= startDate, raw.c.time <= endDate)
+                ).order_by(raw.c.time)
+            ).scalars())
+        return times
+
     def logPeersHistoryEndpoint(self):
-        with self.engine.begin() as conn:
-            for tempPeer in self.Peers:
-                if tempPeer.status == "running":
-                    endpoint = tempPeer.endpoint.rsplit(":", 1)    
-                    if len(endpoint) == 2 and len(endpoint[0]) > 0:
-                        exist = conn.execute(
-                            self.peersHistoryEndpointTable.select().where(
-                                sqlalchemy.and_(
-                                    self.peersHistoryEndpointTable.c.id == tempPeer.id,
-                                    self.peersHistoryEndpointTable.c.endpoint == endpoint[0]
-                                )
-                            )
-                        ).mappings().fetchone()
-                        if not exist:
-                            conn.execute(
-                                self.peersHistoryEndpointTable.insert().values({
-                                    "id": tempPeer.id,
-                                    "endpoint": endpoint[0],
-                                    "time": datetime.now()
-                                })
-                            )
-                          
+        table = self.peersHistoryEndpointTable
+        if self.__historyEndpoints is None:
+            # Loaded once through the (id, endpoint) index, afterwards only new pairs touch the database
+            with self.engine.connect() as conn:
+                self.__historyEndpoints = set(
+                    conn.execute(sqlalchemy.select(table.c.id, table.c.endpoint).distinct()).tuples()
+                )
+        now = datetime.now()
+        newEndpoints = {}
+        for tempPeer in self.Peers:
+            if tempPeer.status == "running":
+                endpoint = tempPeer.endpoint.rsplit(":", 1)
+                if len(endpoint) == 2 and len(endpoint[0]) > 0 and (tempPeer.id, endpoint[0]) not in self.__historyEndpoints:
+                    newEndpoints[(tempPeer.id, endpoint[0])] = {
+                        "id": tempPeer.id,
+                        "endpoint": endpoint[0],
+                        "time": now
+                    }
+        if newEndpoints:
+            with self.engine.begin() as conn:
+                conn.execute(table.insert(), list(newEndpoints.values()))
+            self.__historyEndpoints.update(newEndpoints.keys())
+
     def addPeers(self, peers: list) -> tuple[bool, list, str]:
         result = {
             "message": None,
             "peers": []
         }
+        _, remoteEndpoint = self.DashboardConfig.GetConfig("Peers", "remote_endpoint")
         try:
             with self.engine.begin() as conn:
                 for i in peers:
@@ -647,29 +930,13 @@ class WireguardConfiguration:
                         "cumu_data": 0,
                         "mtu": i['mtu'],
                         "keepalive": i['keepalive'],
-                        "remote_endpoint": self.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                        "remote_endpoint": remoteEndpoint,
                         "preshared_key": i["preshared_key"]
                     }
                     conn.execute(
                         self.peersTable.insert().values(newPeer)
                     )
-            for p in peers:
-                presharedKeyExist = len(p['preshared_key']) > 0
-                temp_psk_path = None
-                if presharedKeyExist:
-                    temp_psk_path = f".psk_{secrets.token_hex(16)}"
-                    with open(temp_psk_path, "w") as f:
-                        f.write(p['preshared_key'])
-
-                try:
-                    cmd = [self.Protocol, "set", self.Name, "peer", p['id'], "allowed-ips", p['allowed_ip'].replace(' ', '')]
-                    if p.get('keepalive') is not None and int(p.get('keepalive')) > 0:
-                        cmd.extend(["persistent-keepalive", str(p.get('keepalive'))])
-                    cmd.extend(["preshared-key", temp_psk_path if temp_psk_path else "/dev/null"])
-                    WireguardCLI.run(cmd, timeout=10)
-                finally:
-                    if temp_psk_path and os.path.exists(temp_psk_path):
-                        os.remove(temp_psk_path)
+            self._programPeers(peers)
             WireguardCLI.run([f"{self.Protocol}-quick", "save", self.Name], timeout=10)
             self.getPeers()
             for p in peers:
@@ -686,52 +953,68 @@ class WireguardConfiguration:
         return True, result['peers'], ""
 
     def searchPeer(self, publicKey):
-        for i in self.Peers:
-            if i.id == publicKey:
-                return True, i
-        return False, None
+        peer = self.PeerIndex.get(publicKey)
+        if peer is None:
+            return False, None
+        return True, peer
+
+    def searchRestrictedPeer(self, publicKey):
+        peer = self.RestrictedPeerIndex.get(publicKey)
+        if peer is None:
+            return False, None
+        return True, peer
+
+    def searchAnyPeer(self, publicKey):
+        """
+        Look a peer up whether it is restricted or not
+        """
+        peer = self.PeerIndex.get(publicKey) or self.RestrictedPeerIndex.get(publicKey)
+        if peer is None:
+            return False, None
+        return True, peer
+
+    def __syncPeersList(self):
+        self.Peers = list(self.PeerIndex.values())
+        self.RestrictedPeers = list(self.RestrictedPeerIndex.values())
 
     def allowAccessPeers(self, listOfPublicKeys) -> tuple[bool, str]:
         if not self.getStatus():
             self.toggleConfiguration()
         with self.engine.begin() as conn:
+            restrictedPeers = conn.execute(
+                self.peersRestrictedTable.select().where(
+                    self.peersRestrictedTable.columns.id.in_(listOfPublicKeys)
+                )
+            ).mappings().fetchall()
+            # Every key is checked before anything is moved
+            found = set(p['id'] for p in restrictedPeers)
+            for i in listOfPublicKeys:
+                if i not in found:
+                    return False, "Failed to allow access of peer " + i
             for i in listOfPublicKeys:
                 stmt = self.peersRestrictedTable.select().where(
                     self.peersRestrictedTable.columns.id == i
                 )
-                restrictedPeer = conn.execute(stmt).mappings().fetchone()
-                if restrictedPeer is not None:
-                    conn.execute(
-                        self.peersTable.insert().from_select(
-                            [c.name for c in self.peersTable.columns],
-                            stmt
-                        )
+                conn.execute(
+                    self.peersTable.insert().from_select(
+                        [c.name for c in self.peersTable.columns],
+                        stmt
                     )
-                    conn.execute(
-                        self.peersRestrictedTable.delete().where(
-                            self.peersRestrictedTable.columns.id == i
-                        )
+                )
+                conn.execute(
+                    self.peersRestrictedTable.delete().where(
+                        self.peersRestrictedTable.columns.id == i
                     )
-
-                    presharedKeyExist = len(restrictedPeer['preshared_key']) > 0
-                    temp_psk_path = None
-                    if presharedKeyExist:
-                        temp_psk_path = f".psk_{secrets.token_hex(16)}"
-                        with open(temp_psk_path, "w") as f:
-                            f.write(restrictedPeer['preshared_key'])
-
-                    try:
-                        cmd = [self.Protocol, "set", self.Name, "peer", restrictedPeer['id'], "allowed-ips", restrictedPeer['allowed_ip'].replace(' ', '')]
-                        if restrictedPeer.get('keepalive') is not None and int(restrictedPeer.get('keepalive')) > 0:
-                            cmd.extend(["persistent-keepalive", str(restrictedPeer.get('keepalive'))])
-                        cmd.extend(["preshared-key", temp_psk_path if temp_psk_path else "/dev/null"])
-                        WireguardCLI.run(cmd, timeout=10)
-                    finally:
-                        if temp_psk_path and os.path.exists(temp_psk_path):
-                            os.remove(temp_psk_path)
-                else:
-                    return False, "Failed to allow access of peer " + i
-        if not self.__wgSave():
+                )
+            # Program the interface before the transaction commits, so a failure leaves the tables untouched
+            self._programPeers(restrictedPeers)
+        for i in listOfPublicKeys:
+            allowed = self.RestrictedPeerIndex.pop(i, None)
+            if allowed is not None:
+                self.PeerIndex[i] = allowed
+        self.__syncPeersList()
+        self.bumpVersion(listOfPublicKeys)
+        if not self.__wgSave()[0]:
             return False, "Failed to save configuration through WireGuard"
         self.getPeers()
         return True, "Allow access successfully"
@@ -739,45 +1022,58 @@ class WireguardConfiguration:
     def restrictPeers(self, listOfPublicKeys) -> tuple[bool, str]:
         numOfRestrictedPeers = 0
         numOfFailedToRestrictPeers = 0
+        restricted = []
         if not self.getStatus():
             self.toggleConfiguration()
 
+        targets = []
+        for p in listOfPublicKeys:
+            found, pf = self.searchPeer(p)
+            if found:
+                targets.append(pf)
+        try:
+            self._programPeers(removePublicKeys=[pf.id for pf in targets])
+        except Exception as e:
+            traceback.print_stack()
+            numOfFailedToRestrictPeers = len(targets)
+            targets = []
+
         with self.engine.begin() as conn:
-            for p in listOfPublicKeys:
-                found, pf = self.searchPeer(p)
-                if found:
-                    try:
-                        WireguardCLI.run([self.Protocol, "set", self.Name, "peer", pf.id, "remove"], timeout=10)
-                        conn.execute(
-                            self.peersRestrictedTable.insert().from_select(
-                                [c.name for c in self.peersTable.columns],
-                                self.peersTable.select().where(
-                                    self.peersTable.columns.id == pf.id
-                                )
+            for pf in targets:
+                try:
+                    conn.execute(
+                        self.peersRestrictedTable.insert().from_select(
+                            [c.name for c in self.peersTable.columns],
+                            self.peersTable.select().where(
+                                self.peersTable.columns.id == pf.id
                             )
                         )
-                        conn.execute(
-                            self.peersRestrictedTable.update().values({
-                                "status": "stopped"
-                            }).where(
-                                self.peersRestrictedTable.columns.id == pf.id
-                            )
+                    )
+                    conn.execute(
+                        self.peersRestrictedTable.update().values({
+                            "status": "stopped"
+                        }).where(
+                            self.peersRestrictedTable.columns.id == pf.id
                         )
-                        conn.execute(
-                            self.peersTable.delete().where(
-                                self.peersTable.columns.id == pf.id
-                            )
+                    )
+                    conn.execute(
+                        self.peersTable.delete().where(
+                            self.peersTable.columns.id == pf.id
                         )
-                        numOfRestrictedPeers += 1
-                    except Exception as e:
-                        traceback.print_stack()
-                        numOfFailedToRestrictPeers += 1
+                    )
+                    pf.status = "stopped"
+                    self.RestrictedPeerIndex[pf.id] = self.PeerIndex.pop(pf.id)
+                    restricted.append(pf.id)
+                    numOfRestrictedPeers += 1
+                except Exception as e:
+                    traceback.print_stack()
+                    numOfFailedToRestrictPeers += 1
 
-        if not self.__wgSave():
+        self.__syncPeersList()
+        self.bumpVersion(restricted)
+        if not self.__wgSave()[0]:
             return False, "Failed to save configuration through WireGuard"
 
-        self.getPeers()
-
         if numOfRestrictedPeers == len(listOfPublicKeys):
             return True, f"Restricted {numOfRestrictedPeers} peer(s)"
         return False, f"Restricted {numOfRestrictedPeers} peer(s) successfully. Failed to restrict {numOfFailedToRestrictPeers} peer(s)"
@@ -789,30 +1085,42 @@ class WireguardConfiguration:
         deleted = []
         if not self.getStatus():
             self.toggleConfiguration()
+        targets = []
+        jobs = []
+        for p in listOfPublicKeys:
+            found, pf = self.searchPeer(p)
+            if found:
+                jobs.extend(pf.jobs)
+                for shareLink in pf.ShareLink:
+                    AllPeerShareLinks.updateLinkExpireDate(shareLink.ShareID, datetime.now())
+                targets.append(pf)
+        AllPeerJobs.deleteJobs(jobs)
+        try:
+            self._programPeers(removePublicKeys=[pf.id for pf in targets])
+        except Exception as e:
+            numOfFailedToDeletePeers = len(targets)
+            targets = []
+
         with self.engine.begin() as conn:
-            for p in listOfPublicKeys:
-                found, pf = self.searchPeer(p)
-                if found:
-                    for job in pf.jobs:
-                        AllPeerJobs.deleteJob(job)
-                    for shareLink in pf.ShareLink:
-                        AllPeerShareLinks.updateLinkExpireDate(shareLink.ShareID, datetime.now())
-                    try:
-                        WireguardCLI.run([self.Protocol, "set", self.Name, "peer", pf.id, "remove"], timeout=10)
-                        conn.execute(
-                            self.peersTable.delete().where(
-                                self.peersTable.columns.id == pf.id
-                            )
+            for pf in targets:
+                try:
+                    conn.execute(
+                        self.peersTable.delete().where(
+                            self.peersTable.columns.id == pf.id
                         )
-                        deleted.append(pf.id)
-                        numOfDeletedPeers += 1
-                    except Exception as e:
-                        numOfFailedToDeletePeers += 1
+                    )
+                    deleted.append(pf.id)
+                    self.PeerIndex.pop(pf.id, None)
+                    if self.__ipAllocator is not None:
+                        self.__ipAllocator.release(pf.allowed_ip)
+                    numOfDeletedPeers += 1
+                except Exception as e:
+                    numOfFailedToDeletePeers += 1
 
-        if not self.__wgSave():
+        self.__syncPeersList()
+        self.bumpVersion(removedPeers=deleted)
+        if not self.__wgSave()[0]:
             return False, "Failed to save configuration through WireGuard"
-
-        self.getPeers()
         
         if numOfDeletedPeers == 0 and numOfFailedToDeletePeers == 0:
             return False, "No peer(s) to delete found"
@@ -829,10 +1137,56 @@ class WireguardConfiguration:
     def __wgSave(self) -> tuple[bool, str] | tuple[bool, None]:
         try:
             WireguardCLI.run([f"{self.Protocol}-quick", "save", self.Name], timeout=10)
+            # The file now matches the registry, so it is not parsed or rebuilt again for this write
+            self.configurationFileChanged()
             return True, None
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             return False, str(e)
 
+    def _programPeers(self, peers: list = None, removePublicKeys: list = None):
+        """
+        Apply a batch of peer changes to the running interface with a constant number of wg calls.
+        Additions go through a single `wg addconf`, removals through `wg showconf` + `wg syncconf`
+        @param peers: Rows or dicts with id, allowed_ip, preshared_key and keepalive to add or update
+        @param removePublicKeys: Public keys of peers to remove from the interface
+        @raise subprocess.CalledProcessError: When wg rejects the change
+        """
+        peers = peers or []
+        removePublicKeys = set(removePublicKeys or [])
+        if not peers and not removePublicKeys:
+            return
+        # Held from showconf to syncconf, so a peer added by another thread in between is not dropped
+        with WireguardCLI.interfaceLock(self.Name):
+            self.__programPeers(peers, removePublicKeys)
+
+    def __programPeers(self, peers: list, removePublicKeys: set):
+        sections = []
+        if removePublicKeys:
+            current = WireguardCLI.run([self.Protocol, "showconf", self.Name], timeout=10).decode()
+            for section in re.split(r'\n(?=\[)', current.strip()):
+                match = re.search(r'^PublicKey\s*=\s*(\S+)', section, re.MULTILINE)
+                if section.startswith("[Peer]") and match and match.group(1) in removePublicKeys:
+                    continue
+                sections.append(section.strip())
+        for p in peers:
+            section = ["[Peer]", f"PublicKey = {p['id']}"]
+            if p.get('preshared_key'):
+                section.append(f"PresharedKey = {p['preshared_key']}")
+            section.append(f"AllowedIPs = {p['allowed_ip'].replace(' ', '')}")
+            if p.get('keepalive') is not None and int(p.get('keepalive')) > 0:
+                section.append(f"PersistentKeepalive = {p.get('keepalive')}")
+            sections.append("\n".join(section))
+
+        # mkstemp creates the file readable by the owner only, since it may carry preshared keys
+        fd, path = tempfile.mkstemp(prefix=f".{self.Name}_", suffix=".conf")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("\n\n".join(sections) + "\n")
+            WireguardCLI.run([self.Protocol, "syncconf" if removePublicKeys else "addconf", self.Name, path],
+                             timeout=30)
+        finally:
+            os.remove(path)
+
     def getPeersLatestHandshake(self):
         if not self.getStatus():
             self.toggleConfiguration()
@@ -974,14 +1328,18 @@ class WireguardConfiguration:
                 )
                 count += 2
 
-    def updatePeersData(self):
+    def updatePeersData(self) -> list[dict]:
+        """
+        Poll the interface counters and store the peers that changed
+        @return: Peers whose status changed, with their new status, handshake and endpoint
+        """
+        transitions = []
         if not self.getStatus():
-            return
+            return transitions
         try:
-            dump = WireguardCLI.run([self.Protocol, "show", self.Name, "dump"],
-                                           timeout=10).decode("UTF-8").strip().split("\n")
-            if len(dump) < 2:
-                return
+            stats = WireguardCLI.peerStats(self.Protocol, self.Name)
+            if not stats:
+                return transitions
             
             now = datetime.now()
             time_delta = timedelta(minutes=3)
@@ -1005,70 +1363,85 @@ class WireguardConfiguration:
                     pass
 
             with self.engine.begin() as conn:
-                # Fetch all existing peers in one query
-                all_peers = conn.execute(self.peersTable.select()).mappings().fetchall()
-                peers_by_id = {peer['id']: peer for peer in all_peers}
+                # Previous values come from the in-memory registry, so a poll never reloads the whole table
+                peers_by_id = self.PeerIndex
 
-                for line in dump[1:]:
-                    parts = line.split("\t")
-                    if len(parts) < 8:
+                # Collect only the rows that actually changed, then write them with a single executemany
+                changed = []
+                for peer_id, endpoint, latest_handshake_ts, cur_total_receive, cur_total_sent in stats:
+                    cur_i = peers_by_id.get(peer_id)
+                    if not cur_i:
                         continue
-                    
-                    peer_id = parts[0]
-                    endpoint = parts[2]
-                    latest_handshake_ts = int(parts[4])
-                    transfer_rx = int(parts[5])
-                    transfer_tx = int(parts[6])
-                    
+
                     minus = now - datetime.fromtimestamp(latest_handshake_ts)
                     status = "running" if minus < time_delta else "stopped"
-                    handshake_str = str(minus).split(".", maxsplit=1)[0] if latest_handshake_ts > 0 else "No Handshake"
-
-                    cur_i = peers_by_id.get(peer_id)
-                    if cur_i:
-                        total_sent = cur_i['total_sent']
-                        total_receive = cur_i['total_receive']
-                        try:
-                            # transfer_tx/rx are already integers from dump split
-                            cur_total_sent = int(transfer_tx)
-                            cur_total_receive = int(transfer_rx)
-                        except (ValueError, TypeError):
-                            continue
-                        
-                        updates = {
-                            "latest_handshake": handshake_str,
-                            "status": status,
-                            "endpoint": endpoint,
-                            "total_receive": cur_total_receive,
-                            "total_sent": cur_total_sent,
-                            "total_data": cur_total_receive + cur_total_sent
-                        }
-                        
-                        cumu_updated = False
-                        cumu_sent = cur_i['cumu_sent']
-                        cumu_receive = cur_i['cumu_receive']
-                        
-                        if is_reboot or cur_total_sent < total_sent:
-                            cumu_sent += total_sent
-                            updates["cumu_sent"] = cumu_sent
-                            cumu_updated = True
-                        
-                        if is_reboot or cur_total_receive < total_receive:
-                            cumu_receive += total_receive
-                            updates["cumu_receive"] = cumu_receive
-                            cumu_updated = True
+                    handshake_at = int(latest_handshake_ts) if latest_handshake_ts > 0 else None
+
+                    total_sent = cur_i.total_sent or 0
+                    total_receive = cur_i.total_receive or 0
+                    cumu_sent = cur_i.cumu_sent or 0
+                    cumu_receive = cur_i.cumu_receive or 0
+                    cumu_data = cur_i.cumu_data or 0
+
+                    # Delta Pattern: fold the previous counter into the cumulative one when it resets
+                    if is_reboot or cur_total_sent < total_sent:
+                        cumu_sent += total_sent
+                    if is_reboot or cur_total_receive < total_receive:
+                        cumu_receive += total_receive
+                    if cumu_sent != (cur_i.cumu_sent or 0) or cumu_receive != (cur_i.cumu_receive or 0):
+                        cumu_data = cumu_sent + cumu_receive
+
+                    # The age of the handshake changes on every poll, only a new handshake is a change
+                    if (cur_i.latest_handshake_at == handshake_at
+                            and cur_i.status == status
+                            and cur_i.endpoint == endpoint
+                            and total_receive == cur_total_receive
+                            and total_sent == cur_total_sent
+                            and cumu_data == (cur_i.cumu_data or 0)):
+                        continue
 
-                        if cumu_updated:
-                            updates["cumu_data"] = cumu_sent + cumu_receive
+                    changed.append({
+                        "_id": peer_id,
+                        "latest_handshake": str(minus).split(".", maxsplit=1)[0] if handshake_at else "No Handshake",
+                        "latest_handshake_at": handshake_at,
+                        "status": status,
+                        "endpoint": endpoint,
+                        "total_receive": cur_total_receive,
+                        "total_sent": cur_total_sent,
+                        "total_data": cur_total_receive + cur_total_sent,
+                        "cumu_receive": cumu_receive,
+                        "cumu_sent": cumu_sent,
+                        "cumu_data": cumu_data
+                    })
+
+                if changed:
+                    conn.execute(
+                        self.peersTable.update().where(
+                            self.peersTable.c.id == sqlalchemy.bindparam("_id")
+                        ),
+                        changed
+                    )
 
-                        conn.execute(
-                            self.peersTable.update().values(updates).where(
-                                self.peersTable.c.id == peer_id
-                            )
-                        )
+            # Apply the same values to the registry only once the transaction has committed
+            for row in changed:
+                peer = peers_by_id.get(row["_id"])
+                if peer is not None:
+                    if peer.status != row["status"]:
+                        transitions.append({
+                            "id": peer.id,
+                            "status": row["status"],
+                            "latest_handshake": row["latest_handshake"],
+                            "endpoint": row["endpoint"]
+                        })
+                    for key, value in row.items():
+                        if key != "_id":
+                            setattr(peer, key, value)
+            if changed:
+                self.bumpVersion([row["_id"] for row in changed])
 
         except Exception as e:
             current_app.logger.error(f"Failed to update peers data for {self.Name}: {e}")
+        return transitions
 
     def toggleConfiguration(self) -> tuple[bool, str] | tuple[bool, None]:
         self.getStatus()
@@ -1093,9 +1466,111 @@ class WireguardConfiguration:
         return self.Peers
 
     def getRestrictedPeersList(self) -> list:
-        self.getRestrictedPeers()
         return self.RestrictedPeers
 
+    def _newPeer(self, tableData) -> Peer:
+        return Peer(tableData, self)
+
+    def __peerSortKeys(self, q, sort: str) -> list:
+        if sort == "status":
+            return [q.c.status]
+        if sort == "total_data":
+            return [sqlalchemy.func.coalesce(q.c.total_data, 0) + sqlalchemy.func.coalesce(q.c.cumu_data, 0)]
+        if sort == "latest_handshake":
+            # Most recent first, peers without a handshake last
+            return [-sqlalchemy.func.coalesce(q.c.latest_handshake_at, 0)]
+        return [sqlalchemy.func.coalesce(q.c.name, "")]
+
+    def queryPeers(self, search: str = None, status: str = None, sort: str = "name", descending: bool = False,
+                   limit: int = 50, cursor: str = None, offset: int = 0) -> dict:
+        """
+        One page of peers and restricted peers, filtered and sorted by the database
+        @param search: Matched against name, public key and allowed IPs
+        @param status: running, stopped or restricted
+        @param sort: One of PEER_SORT_KEYS
+        @param descending: Reverse the sort order
+        @param limit: Page size
+        @param cursor: nextCursor of the previous page, takes precedence over offset
+        @param offset: Number of peers to skip when no cursor is given
+        @return: Page of peers, page of restricted peers, filtered totals and the cursor of the next page
+        """
+        if sort not in self.PEER_SORT_KEYS:
+            raise ValueError(f"Sort must be one of {', '.join(self.PEER_SORT_KEYS)}")
+        if status is not None and status not in self.PEER_STATUS_FILTERS:
+            raise ValueError(f"Status must be one of {', '.join(self.PEER_STATUS_FILTERS)}")
+
+        columns = ["id", "name", "status", "allowed_ip", "total_data", "cumu_data", "latest_handshake_at"]
+        q = sqlalchemy.union_all(
+            sqlalchemy.select(*[self.peersTable.c[c] for c in columns], sqlalchemy.literal(0).label("restricted")),
+            sqlalchemy.select(*[self.peersRestrictedTable.c[c] for c in columns], sqlalchemy.literal(1).label("restricted"))
+        ).subquery()
+
+        conditions = []
+        if search:
+            conditions.append(sqlalchemy.or_(
+                q.c.name.contains(search, autoescape=True),
+                q.c.id.contains(search, autoescape=True),
+                q.c.allowed_ip.contains(search, autoescape=True)
+            ))
+        if status == "restricted":
+            conditions.append(q.c.restricted == 1)
+        elif status is not None:
+            conditions.append(sqlalchemy.and_(q.c.restricted == 0, q.c.status == status))
+
+        keys = self.__peerSortKeys(q, sort) + [q.c.id]
+        stmt = sqlalchemy.select(q.c.id, q.c.restricted, *[k.label(f"sort_{n}") for n, k in enumerate(keys)]).where(*conditions)
+        if cursor:
+            try:
+                values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except (ValueError, TypeError):
+                raise ValueError("Invalid cursor")
+            if type(values) is not list or len(values) != len(keys):
+                raise ValueError("Invalid cursor")
+            row = sqlalchemy.tuple_(*keys)
+            after = sqlalchemy.tuple_(*[sqlalchemy.literal(v) for v in values])
+            stmt = stmt.where(row < after if descending else row > after)
+        elif offset:
+            stmt = stmt.offset(offset)
+        stmt = stmt.order_by(*[k.desc() if descending else k.asc() for k in keys]).limit(limit + 1)
+
+        with self.engine.connect() as conn:
+            page = conn.execute(stmt).mappings().fetchall()
+            totals = dict(conn.execute(
+                sqlalchemy.select(q.c.restricted, sqlalchemy.func.count()).where(*conditions).group_by(q.c.restricted)
+            ).tuples().fetchall())
+            nextCursor = None
+            if len(page) > limit:
+                page = page[:limit]
+                nextCursor = base64.urlsafe_b64encode(
+                    json.dumps([page[-1][f"sort_{n}"] for n in range(len(keys))]).encode()
+                ).decode()
+
+            # Peers come from the registry, only rows it does not hold are loaded in full
+            missing = {0: [], 1: []}
+            for r in page:
+                index = self.RestrictedPeerIndex if r["restricted"] else self.PeerIndex
+                if r["id"] not in index:
+                    missing[r["restricted"]].append(r["id"])
+            loaded = {}
+            for restricted, table in ((0, self.peersTable), (1, self.peersRestrictedTable)):
+                if missing[restricted]:
+                    for row in conn.execute(table.select().where(table.c.id.in_(missing[restricted]))).mappings():
+                        loaded[(restricted, row["id"])] = self._newPeer(row)
+
+        peers, restrictedPeers = [], []
+        for r in page:
+            index = self.RestrictedPeerIndex if r["restricted"] else self.PeerIndex
+            peer = index.get(r["id"]) or loaded.get((r["restricted"], r["id"]))
+            if peer is not None:
+                (restrictedPeers if r["restricted"] else peers).append(peer)
+        return {
+            "peers": peers,
+            "restrictedPeers": restrictedPeers,
+            "totalPeers": totals.get(0, 0),
+            "totalRestrictedPeers": totals.get(1, 0),
+            "nextCursor": nextCursor
+        }
+
     def toJson(self):
         self.Status = self.getStatus()
         return {
@@ -1291,6 +1766,7 @@ class WireguardConfiguration:
             return False, msg
         for i in allowEdit:
             setattr(self, i, str(newData[i]))
+        self.bumpVersion()
 
         return True, ""
     def deleteConfiguration(self):
@@ -1328,6 +1804,12 @@ class WireguardConfiguration:
                         f'INSERT INTO "{newConfigurationName}_transfer" SELECT * FROM "{self.Name}_transfer"'
                     )
                 )
+                for name, _, _ in self.TRANSFER_ROLLUPS:
+                    conn.execute(
+                        sqlalchemy.text(
+                            f'INSERT INTO "{newConfigurationName}_transfer_{name}" SELECT * FROM "{self.Name}_transfer_{name}"'
+                        )
+                    )
             self.AllPeerJobs.updateJobConfigurationName(self.Name, newConfigurationName)
             shutil.copy(
                 self.configPath,
@@ -1342,33 +1824,7 @@ class WireguardConfiguration:
     def getNumberOfAvailableIP(self):
         if len(self.Address) < 0:
             return False, None
-        existedAddress = set()
-        availableAddress = {}
-        for p in self.Peers + self.getRestrictedPeersList():
-            peerAllowedIP = p.allowed_ip.split(',')
-            for pip in peerAllowedIP:
-                ppip = pip.strip().split('/')
-                if len(ppip) == 2:
-                    try:
-                        check = ipaddress.ip_network(ppip[0])
-                        existedAddress.add(check)
-                    except Exception as e:
-                        current_app.logger.error(f"{self.Name} peer {p.id} have invalid ip", e)
-        configurationAddresses = self.Address.split(',')
-        for ca in configurationAddresses:
-            ca = ca.strip()
-            caSplit = ca.split('/')
-            try:
-                if len(caSplit) == 2:
-                    network = ipaddress.ip_network(ca, False)
-                    existedAddress.add(ipaddress.ip_network(caSplit[0]))
-                    availableAddress[ca] = network.num_addresses
-                    for p in existedAddress:
-                        if p.version == network.version and p.subnet_of(network):
-                            availableAddress[ca] -= 1
-            except Exception as e:
-                current_app.logger.error(f"Error: Failed to parse IP address {ca} from {self.Name}", e)
-        return True, availableAddress
+        return True, self.__getIPAllocator().freeCounts()
 
     def getAvailableIP(self, threshold = 255):
         if len(self.Address) == 0:
@@ -1379,42 +1835,7 @@ class WireguardConfiguration:
             threshold = 1024
         else:
             threshold = min(threshold, 1024)
-
-        existedAddress = set()
-        availableAddress = {}
-        for p in self.Peers + self.getRestrictedPeersList():
-            peerAllowedIP = p.allowed_ip.split(',')
-            for pip in peerAllowedIP:
-                ppip = pip.strip().split('/')
-                if len(ppip) == 2:
-                    try:
-                        # Normalize to compressed string for fast set lookup
-                        check = ipaddress.ip_network(ppip[0])
-                        existedAddress.add(check.compressed)
-                    except Exception as e:
-                        current_app.logger.error(f"{self.Name} peer {p.id} have invalid ip", e)
-        
-        configurationAddresses = self.Address.split(',')
-        for ca in configurationAddresses:
-            ca = ca.strip()
-            caSplit = ca.split('/')
-            try:
-                if len(caSplit) == 2:
-                    network = ipaddress.ip_network(ca, False)
-                    # Add the network address itself to existedAddress
-                    existedAddress.add(ipaddress.ip_network(caSplit[0]).compressed)
-                    
-                    # Efficiently find available IPs by iterating and checking set membership
-                    # hosts() is a generator, so we only consume until we find 'threshold' items
-                    available = islice(
-                        filter(lambda ip_str: ip_str not in existedAddress, 
-                               map(lambda ip: f"{ip}/{ip.max_prefixlen}", network.hosts())),
-                        threshold
-                    )
-                    availableAddress[ca] = list(available)
-            except Exception as e:
-                current_app.logger.error(f"Failed to parse IP address {ca} from {self.Name}", exc_info=e)
-        return True, availableAddress
+        return True, self.__getIPAllocator().available(threshold)
 
     def getRealtimeTrafficUsage(self):
         import time
@@ -1515,6 +1936,7 @@ class WireguardConfiguration:
         else: 
             return False, "Key does not exist", None
         self.storeConfigurationInfo()
+        self.bumpVersion()
         return True, None, None
     
     def __validateOverridePeerSettings(self, key: str, value: str | int) -> tuple[bool, None] | tuple[bool, str]:
@@ -1558,6 +1980,32 @@ class WireguardConfiguration:
                 self.peersHistoryEndpointTable.select()
             ).mappings().fetchall()
             return data
+
+    def streamTransferTable(self, peerIds: list[str] = None, startDate: datetime = None, endDate: datetime = None):
+        return self.__streamTable(self.peersTransferTable, peerIds, startDate, endDate)
+
+    def streamHistoricalEndpointTable(self, peerIds: list[str] = None, startDate: datetime = None, endDate: datetime = None):
+        return self.__streamTable(self.peersHistoryEndpointTable, peerIds, startDate, endDate)
+
+    def __streamTable(self, table: sqlalchemy.Table, peerIds: list[str] | None,
+                      startDate: datetime | None, endDate: datetime | None):
+        """
+        Yield the rows of a tracking table a batch at a time, so memory use does not grow with the table
+        @param peerIds: Only rows of these peers
+        @param startDate: Only rows at or after this time
+        @param endDate: Only rows before this time
+        """
+        query = table.select()
+        if peerIds:
+            query = query.where(table.c.id.in_(peerIds))
+        if startDate:
+            query = query.where(table.c.time >= startDate)
+        if endDate:
+            query = query.where(table.c.time < endDate)
+        with self.engine.connect() as db:
+            result = db.execution_options(stream_results=True, yield_per=self.STREAM_BATCH_SIZE).execute(query)
+            for row in result.mappings():
+                yield row
     
     def deleteTransferTable(self):
         try:
@@ -1565,6 +2013,8 @@ class WireguardConfiguration:
                 db.execute(
                     self.peersTransferTable.delete()
             )
+                for table in self.peersTransferRollupTables.values():
+                    db.execute(table.delete())
             with self.engine.connect() as conn:
                 is_sqlite = conn.dialect.name == 'sqlite'
             if is_sqlite:
@@ -1581,6 +2031,7 @@ class WireguardConfiguration:
                 db.execute(
                     self.peersHistoryEndpointTable.delete()
                 )
+            self.__historyEndpoints = None
             with self.engine.connect() as conn:
                 is_sqlite = conn.dialect.name == 'sqlite'
             if is_sqlite:
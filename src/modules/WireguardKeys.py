@@ -0,0 +1,134 @@
+"""
+WireGuard Curve25519 key generation without spawning `wg genkey` / `wg pubkey`
+"""
+import base64
+import binascii
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives import serialization
+    KeyBackend = "cryptography"
+except ImportError:
+    X25519PrivateKey = None
+    KeyBackend = "python"
+    logger.warning("cryptography is not installed, public keys are derived with wg, "
+                   "or with the pure-Python X25519 fallback when wg is unavailable")
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT = 9
+
+
+def _clamp(scalar: bytes) -> bytes:
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return bytes(k)
+
+
+def _cswap(swap: int, a: int, b: int) -> tuple[int, int]:
+    """
+    Swap a and b when swap is 1 without branching on it, as cswap in RFC 7748 section 5
+    """
+    dummy = -swap & (a ^ b)
+    return a ^ dummy, b ^ dummy
+
+
+def _x25519(scalar: bytes, u: int) -> int:
+    """
+    Montgomery ladder from RFC 7748 section 5, the scalar bits only select through _cswap
+    @param scalar: Clamped 32 bytes scalar
+    @param u: u-coordinate of the point to multiply
+    @return: u-coordinate of the result
+    """
+    k = int.from_bytes(scalar, "little")
+    x1 = u
+    x2, z2, x3, z3 = 1, 0, u, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        kt = (k >> t) & 1
+        swap ^= kt
+        x2, x3 = _cswap(swap, x2, x3)
+        z2, z3 = _cswap(swap, z2, z3)
+        swap = kt
+
+        a = x2 + z2
+        aa = a * a % _P
+        b = x2 - z2
+        bb = b * b % _P
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+    x2, x3 = _cswap(swap, x2, x3)
+    z2, z3 = _cswap(swap, z2, z3)
+    return x2 * pow(z2, _P - 2, _P) % _P
+
+
+def X25519(scalar: bytes, u: bytes) -> bytes:
+    """
+    X25519 function as specified in RFC 7748, used by the tests against the RFC vectors
+    @param scalar: 32 bytes scalar, clamped here
+    @param u: 32 bytes little-endian u-coordinate
+    @return: 32 bytes little-endian result
+    """
+    if len(scalar) != 32 or len(u) != 32:
+        raise ValueError("X25519 inputs must be 32 bytes")
+    uInt = int.from_bytes(u, "little") & ((1 << 255) - 1)
+    return _x25519(_clamp(scalar), uInt).to_bytes(32, "little")
+
+
+def _decodeKey(key: str) -> bytes:
+    try:
+        raw = base64.b64decode(key.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Key is not valid base64")
+    if len(raw) != 32:
+        raise ValueError("Key must be 32 bytes")
+    return raw
+
+
+def GeneratePrivateKey() -> str:
+    """
+    Same output as `wg genkey`: 32 random bytes, clamped, base64 encoded
+    """
+    return base64.b64encode(_clamp(os.urandom(32))).decode()
+
+
+def GeneratePublicKey(privateKey: str) -> str:
+    """
+    Same output as `wg pubkey`
+    @param privateKey: Base64 private key
+    @return: Base64 public key
+    """
+    raw = _decodeKey(privateKey)
+    if X25519PrivateKey is not None:
+        public = X25519PrivateKey.from_private_bytes(raw).public_key().public_bytes(
+            encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+        )
+    else:
+        public = _x25519(_clamp(raw), _BASE_POINT).to_bytes(32, "little")
+    return base64.b64encode(public).decode()
+
+
+def GenerateKeyPairs(amount: int) -> list[tuple[str, str]]:
+    """
+    Generate a batch of key pairs in one go
+    @param amount: Number of key pairs
+    @return: List of (private key, public key)
+    """
+    pairs = []
+    for _ in range(amount):
+        privateKey = GeneratePrivateKey()
+        pairs.append((privateKey, GeneratePublicKey(privateKey)))
+    return pairs
@@ -0,0 +1,79 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import MetaData, create_engine
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def dashboard_settings(tmp_path):
+    """(section, key) -> value returned by the mocked DashboardConfig, anything else is an empty string"""
+    return {("Database", "type"): "sqlite", ("Server", "wg_conf_path"): str(tmp_path)}
+
+
+@pytest.fixture
+def engine():
+    return create_engine("sqlite:///:memory:")
+
+
+@pytest.fixture
+def MockWGConfig(tmp_path, engine, dashboard_settings):
+    """A WireguardConfiguration that keeps its peers in the database instead of a configuration file"""
+    # Imported here so stress tests that mock flask before importing the modules still can
+    from modules.WireguardConfiguration import WireguardConfiguration
+    configPath = tmp_path / "test_wg.conf"
+    configPath.write_text("[Interface]\n")
+    mock_db_config = MagicMock()
+    mock_db_config.GetConfig.side_effect = lambda section, key: (True, dashboard_settings.get((section, key), ""))
+
+    class MockWGConfig(WireguardConfiguration):
+        def __init__(self):
+            self.Name = "test_wg"
+            self.Protocol = "wg"
+            self.configPath = str(configPath)
+            self.Address = "10.0.0.1/24, fd00::1/64"
+            self.metadata = MetaData()
+            self.engine = engine
+            self.DashboardConfig = mock_db_config
+            self.DashboardWebHooks = MagicMock()
+            self.AllPeerJobs = MagicMock()
+            self.AllPeerJobs.searchJob.return_value = []
+            self.AllPeerShareLinks = MagicMock()
+            self.AllPeerShareLinks.getLink.return_value = []
+            self.Peers = []
+            self.RestrictedPeers = []
+            self.PeerIndex = {}
+            self.RestrictedPeerIndex = {}
+            self.createDatabase()
+
+        def getStatus(self):
+            return True
+
+        def getPeers(self):
+            with self.engine.connect() as conn:
+                rows = conn.execute(self.peersTable.select()).mappings().fetchall()
+            self.Peers = [self._loadPeer(r) for r in rows]
+            self._indexPeers(self.Peers)
+
+    return MockWGConfig
+
+
+@pytest.fixture
+def wg_config(MockWGConfig):
+    return MockWGConfig()
+
+
+@pytest.fixture
+def peer_row():
+    """Build a peer table row for peer{i}=, with any column overridden by keyword"""
+    def peerRow(i, **kwargs):
+        return {
+            "id": f"peer{i}=", "private_key": "", "DNS": "", "endpoint_allowed_ip": "0.0.0.0/0", "name": f"peer{i}",
+            "total_receive": 0, "total_sent": 0, "total_data": 0, "endpoint": "N/A", "status": "stopped",
+            "latest_handshake": "No Handshake", "allowed_ip": f"10.0.0.{i}/32", "cumu_receive": 0, "cumu_sent": 0,
+            "cumu_data": 0, "mtu": None, "keepalive": None, "remote_endpoint": "", "preshared_key": "", **kwargs
+        }
+    return peerRow
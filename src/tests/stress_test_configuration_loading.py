@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+from flask import Flask
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.ConfigurationRegistry import ConfigurationRegistry
+from modules.WireguardConfiguration import WireguardConfiguration
+
+CONFIGURATIONS = 50
+PEERS = 500
+QUERIED = 2
+
+
+class StressTestConfigurationLoading(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = db.create_engine(f"sqlite:///{os.path.join(directory.name, 'wgdashboard.db')}")
+        self.addCleanup(self.engine.dispose)
+        self.app = Flask(__name__)
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+        engine, app = self.engine, self.app
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self, name, loading=True):
+                self.Name = name
+                self.Protocol = "wg"
+                self.metadata = db.MetaData()
+                self.engine = engine
+                self.DashboardConfig = mock_config
+                self.AllPeerJobs = MagicMock()
+                self.AllPeerJobs.searchJob.return_value = []
+                self.AllPeerShareLinks = MagicMock()
+                self.AllPeerShareLinks.getLink.return_value = []
+                self.PeerIndex = {}
+                self.RestrictedPeerIndex = {}
+                with app.app_context():
+                    self.createDatabase()
+                with self.engine.connect() as conn:
+                    rows = conn.execute(self.peersTable.select()).mappings().fetchall()
+                self.Peers = [self._loadPeer(r) for r in rows]
+                if loading:
+                    # Stands in for the wg and wg-quick calls of a real configuration
+                    subprocess.run(["sleep", "0.05"])
+
+        self.configurationClass = Configuration
+        self.names = [f"wg{i}" for i in range(CONFIGURATIONS)]
+        for name in self.names:
+            configuration = Configuration(name, loading=False)
+            with engine.begin() as conn:
+                conn.execute(configuration.peersTable.insert(), [{
+                    "id": f"{name}-{i:040d}=", "private_key": "", "DNS": "", "endpoint_allowed_ip": "0.0.0.0/0",
+                    "name": f"peer-{i}", "total_receive": i, "total_sent": i, "total_data": 2 * i, "endpoint": "N/A",
+                    "status": "stopped", "latest_handshake": "No Handshake", "allowed_ip": f"10.0.{i // 256}.{i % 256}/32",
+                    "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0, "mtu": None, "keepalive": None,
+                    "remote_endpoint": "", "preshared_key": ""
+                } for i in range(PEERS)])
+
+    def _registry(self) -> ConfigurationRegistry:
+        registry = ConfigurationRegistry()
+        for name in self.names:
+            registry.setLoader(name, lambda name=name: self.configurationClass(name))
+        return registry
+
+    def test_startup(self):
+        start = time.time()
+        serial = {name: self.configurationClass(name) for name in self.names}
+        before = time.time() - start
+
+        start = time.time()
+        registry = self._registry()
+        for name in self.names[:QUERIED]:
+            registry.get(name)
+        lazy = time.time() - start
+
+        registry = self._registry()
+        start = time.time()
+        registry.load()
+        pooled = time.time() - start
+
+        print(f"\n{CONFIGURATIONS} configurations with {PEERS} peers: {before:.2f} s serial, "
+              f"{pooled:.2f} s thread pool, {lazy * 1000:.0f} ms lazy with {QUERIED} looked up")
+        self.assertEqual(len(serial), len(list(registry.values())))
+        self.assertLess(lazy * 10, before)
+        self.assertLess(pooled, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
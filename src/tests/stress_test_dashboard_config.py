@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.DashboardConfig
+from modules.DashboardConfig import DashboardConfig
+
+READS = 200000
+API_KEYS = 10000
+REQUESTS = 2000
+
+
+class StressTestDashboardConfig(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patches = [
+            patch.object(DashboardConfig, "ConfigurationFilePath", os.path.join(directory.name, "wg-dashboard.ini")),
+            patch.object(modules.DashboardConfig, "GetRemoteEndpoint", lambda: "192.0.2.1"),
+            patch.object(modules.DashboardConfig, "ConnectionString", lambda database: "sqlite://"),
+            patch.object(modules.DashboardConfig, "CreateEngine", lambda cn: create_engine(cn, poolclass=StaticPool)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.config = DashboardConfig()
+
+    def test_reads(self):
+        parser = self.config._DashboardConfig__config
+        lock = threading.RLock()
+
+        # GetConfig before the snapshot: a lock and the string comparisons on every read
+        def legacy(section, key):
+            with lock:
+                if section not in parser or key not in parser[section]:
+                    return False, None
+                if parser[section][key] in ["1", "yes", "true", "on"]:
+                    return True, True
+                if parser[section][key] in ["0", "no", "false", "off"]:
+                    return True, False
+                return True, parser[section][key]
+
+        start = time.time()
+        for _ in range(READS):
+            legacy("Server", "auth_req")
+        before = time.time() - start
+
+        start = time.time()
+        for _ in range(READS):
+            self.config.GetConfig("Server", "auth_req")
+        getConfig = time.time() - start
+
+        start = time.time()
+        for _ in range(READS):
+            self.config.Snapshot.AuthRequired
+        after = time.time() - start
+
+        print(f"\n{READS} reads: {before / READS * 1e9:.0f} ns locked and parsed, "
+              f"{getConfig / READS * 1e9:.0f} ns GetConfig, {after / READS * 1e9:.0f} ns snapshot attribute")
+        self.assertLess(getConfig * 2, before)
+        self.assertLess(after * 10, before)
+
+    def test_api_key_lookup(self):
+        with self.config.engine.begin() as conn:
+            conn.execute(self.config.apiKeyTable.insert(), [
+                {"Key": f"key-{i}", "CreatedAt": datetime.now(), "ExpiredAt": None} for i in range(API_KEYS)])
+        self.config.createAPIKeys()
+        apiKey = self.config.DashboardAPIKeys[-1].Key
+
+        start = time.time()
+        for _ in range(REQUESTS):
+            any(x.Key == apiKey for x in self.config.DashboardAPIKeys)
+        before = time.time() - start
+
+        with patch.object(DashboardConfig, "API_KEY_CACHE_SECONDS", 0):
+            start = time.time()
+            for _ in range(REQUESTS):
+                self.config.verifyAPIKey(apiKey)
+            indexed = time.time() - start
+
+        start = time.time()
+        for _ in range(REQUESTS):
+            self.config.verifyAPIKey(apiKey)
+        cached = time.time() - start
+
+        print(f"\n{API_KEYS} API keys: {before / REQUESTS * 1e6:.1f} us per scan, "
+              f"{indexed / REQUESTS * 1e6:.2f} us per indexed lookup, {cached / REQUESTS * 1e6:.2f} us cached")
+        self.assertTrue(self.config.verifyAPIKey(apiKey))
+        self.assertLess(indexed * 50, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+import sqlalchemy as db
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.LogQueue import LogQueue
+
+LOGS = 5000
+
+
+class StressTestLogQueue(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = db.create_engine(f"sqlite:///{os.path.join(directory.name, 'log.db')}")
+        self.addCleanup(self.engine.dispose)
+        metadata = db.MetaData()
+        self.table = db.Table('DashboardLog', metadata,
+                              db.Column('LogID', db.String(255), nullable=False, primary_key=True),
+                              db.Column('LogDate', db.DATETIME, server_default=db.func.now()),
+                              db.Column('URL', db.String(255)),
+                              db.Column('IP', db.String(255)),
+                              db.Column('Status', db.String(255), nullable=False),
+                              db.Column('Message', db.Text))
+        metadata.create_all(self.engine)
+
+    def _row(self):
+        return {"LogID": str(uuid.uuid4()), "URL": "http://localhost/api/handshake", "IP": "127.0.0.1",
+                "Status": "true", "Message": "API Key Access: true"}
+
+    def test_log_latency(self):
+        start = time.time()
+        for _ in range(LOGS):
+            with self.engine.begin() as conn:
+                conn.execute(self.table.insert().values(self._row()))
+        before = time.time() - start
+
+        logs = LogQueue(self.engine, self.table)
+        start = time.time()
+        for _ in range(LOGS):
+            logs.put(self._row())
+        after = time.time() - start
+        logs.stop()
+
+        with self.engine.connect() as conn:
+            count = conn.execute(db.select(db.func.count()).select_from(self.table)).scalar()
+        print(f"\n{LOGS} logs: {before / LOGS * 1e6:.0f} us per synchronous insert, {after / LOGS * 1e6:.1f} us per queued log")
+        self.assertEqual(count, 2 * LOGS)
+        self.assertLess(after * 10, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import unittest
+import uuid
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy as db
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.PeerJobLogger
+import modules.PeerJobs
+import modules.PeerShareLinks
+from modules.PeerJobs import PeerJobs
+from modules.PeerShareLinks import PeerShareLinks
+from modules.WireguardConfiguration import WireguardConfiguration
+
+PEERS = 10000
+
+
+class StressTestPeerIndexes(unittest.TestCase):
+    def setUp(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+        # One in-memory database per name, kept while the tables are loaded again
+        engines = {}
+        patches = []
+        for module in (modules.PeerJobs, modules.PeerJobLogger, modules.PeerShareLinks):
+            patches.append(patch.object(module, "ConnectionString", lambda database: database))
+            patches.append(patch.object(module, "CreateEngine", lambda cn: engines.setdefault(cn, db.create_engine(
+                "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}))))
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.Protocol = "wg"
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine("sqlite:///:memory:")
+                self.DashboardConfig = mock_config
+                self.DashboardWebHooks = MagicMock()
+                self.PeerIndex = {}
+                self.RestrictedPeerIndex = {}
+                self.createDatabase()
+
+        self.wgc = Configuration()
+        self.rows = [{
+            "id": f"{i:043d}=", "private_key": "", "DNS": "", "endpoint_allowed_ip": "0.0.0.0/0", "name": f"peer-{i}",
+            "total_receive": 0, "total_sent": 0, "total_data": 0, "endpoint": "N/A", "status": "stopped",
+            "latest_handshake": "No Handshake", "allowed_ip": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32",
+            "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0,
+            "mtu": None, "keepalive": None, "remote_endpoint": "", "preshared_key": ""
+        } for i in range(PEERS)]
+
+        self.links = PeerShareLinks(mock_config, {self.wgc.Name: self.wgc})
+        with self.links.engine.begin() as conn:
+            conn.execute(self.links.peerShareLinksTable.insert(), [{
+                "ShareID": str(uuid.uuid4()), "Configuration": self.wgc.Name, "Peer": f"{i:043d}=",
+                "ExpireDate": None, "SharedDate": datetime.now()
+            } for i in range(PEERS)])
+        self.jobs = PeerJobs(mock_config, {self.wgc.Name: self.wgc}, self.links)
+        with self.jobs.engine.begin() as conn:
+            conn.execute(self.jobs.peerJobTable.insert(), [{
+                "JobID": f"data-{i}", "Configuration": self.wgc.Name, "Peer": f"{i:043d}=", "Field": "total_data",
+                "Operator": "lgt", "Value": "100", "CreationDate": datetime.now(), "ExpireDate": None, "Action": "restrict"
+            } for i in range(PEERS)])
+        # Load both tables again now that they are filled
+        self.jobs = PeerJobs(mock_config, {self.wgc.Name: self.wgc}, self.links)
+        self.links = PeerShareLinks(mock_config, {self.wgc.Name: self.wgc})
+        self.wgc.AllPeerJobs = self.jobs
+        self.wgc.AllPeerShareLinks = self.links
+
+    def _construct(self):
+        self.wgc.PeerIndex = {}
+        start = time.time()
+        peers = [self.wgc._loadPeer(r) for r in self.rows]
+        return peers, time.time() - start
+
+    def test_peer_construction(self):
+        jobs, links = self.jobs.Jobs, self.links.Links
+
+        def searchJob(Configuration, Peer):
+            return list(filter(lambda x: x.Configuration == Configuration and x.Peer == Peer, jobs))
+
+        def getLink(Configuration, Peer):
+            now = datetime.now()
+            return list(filter(lambda x: x.Configuration == Configuration and x.Peer == Peer and x.ExpireDate > now, links))
+
+        # Only a tenth of the peers for the full scans, the rest is extrapolated
+        rows = self.rows
+        self.rows = rows[:PEERS // 10]
+        with patch.object(self.jobs, "searchJob", searchJob), patch.object(self.links, "getLink", getLink):
+            _, before = self._construct()
+        before *= 10
+        self.rows = rows
+        peers, after = self._construct()
+
+        print(f"\n{PEERS} peers, {PEERS} jobs and {PEERS} share links: "
+              f"constructed in {before:.2f} s with full scans, {after * 1000:.1f} ms with indexes")
+        self.assertTrue(all(len(p.jobs) == 1 and len(p.ShareLink) == 1 for p in peers))
+        self.assertLess(after * 20, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy as db
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.PeerJobLogger
+import modules.PeerJobs
+from modules.PeerJobs import PeerJobs
+from modules.WireguardCLI import WireguardCLI
+from modules.WireguardConfiguration import WireguardConfiguration
+
+PEERS = 10000
+TRIGGERED = 100
+
+
+class StressTestPeerJobs(unittest.TestCase):
+    def setUp(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+        patches = [patch.object(WireguardCLI, "run", MagicMock(return_value=b""))]
+        # One in-memory database per name, kept while the jobs are loaded again
+        engines = {}
+        for module in (modules.PeerJobs, modules.PeerJobLogger):
+            patches.append(patch.object(module, "ConnectionString", lambda database: database))
+            patches.append(patch.object(module, "CreateEngine", lambda cn: engines.setdefault(cn, db.create_engine(
+                "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}))))
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        configPath = os.path.join(tmp.name, "stress_wg.conf")
+        with open(configPath, "w") as f:
+            f.write("[Interface]\n")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.Protocol = "wg"
+                self.configPath = configPath
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine("sqlite:///:memory:")
+                self.DashboardConfig = mock_config
+                self.DashboardWebHooks = MagicMock()
+                self.AllPeerShareLinks = MagicMock()
+                self.AllPeerShareLinks.getLink.return_value = []
+                self.PeerIndex = {}
+                self.RestrictedPeerIndex = {}
+                self.createDatabase()
+
+            def getStatus(self):
+                return True
+
+        self.wgc = Configuration()
+        self.jobs = PeerJobs(mock_config, {self.wgc.Name: self.wgc}, MagicMock())
+        self.wgc.AllPeerJobs = self.jobs
+        rows = [{
+            "id": f"{i:043d}=", "private_key": "", "DNS": "", "endpoint_allowed_ip": "0.0.0.0/0", "name": f"peer-{i}",
+            "total_receive": i + 1, "total_sent": i + 1, "total_data": 2 * i + 2, "endpoint": "N/A", "status": "stopped",
+            "latest_handshake": "No Handshake", "allowed_ip": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32",
+            "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0,
+            "mtu": None, "keepalive": None, "remote_endpoint": "", "preshared_key": ""
+        } for i in range(PEERS)]
+        with self.wgc.engine.begin() as conn:
+            conn.execute(self.wgc.peersTable.insert(), rows)
+        self.wgc.PeerIndex = {r["id"]: self.wgc._loadPeer(r) for r in rows}
+        self.wgc.Peers = list(self.wgc.PeerIndex.values())
+
+        # One data cap and one expiry date per peer, the first few data caps already reached
+        future = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.jobs.engine.begin() as conn:
+            conn.execute(self.jobs.peerJobTable.insert(), [{
+                "JobID": f"data-{i}", "Configuration": self.wgc.Name, "Peer": f"{i:043d}=", "Field": "total_data",
+                "Operator": "lgt", "Value": "0" if i < TRIGGERED else "100", "CreationDate": datetime.now(),
+                "ExpireDate": None, "Action": "restrict"
+            } for i in range(PEERS)] + [{
+                "JobID": f"date-{i}", "Configuration": self.wgc.Name, "Peer": f"{i:043d}=", "Field": "date",
+                "Operator": "lgt", "Value": future, "CreationDate": datetime.now(),
+                "ExpireDate": None, "Action": "delete"
+            } for i in range(PEERS)])
+        self.jobs = PeerJobs(mock_config, {self.wgc.Name: self.wgc}, MagicMock())
+        self.wgc.AllPeerJobs = self.jobs
+
+    def test_run_job(self):
+        start = time.time()
+        self.jobs.runJob()
+        elapsed = time.time() - start
+        print(f"\n{2 * PEERS} jobs, {TRIGGERED} triggered: evaluated in {elapsed * 1000:.1f} ms")
+        self.assertEqual(len(self.wgc.RestrictedPeerIndex), TRIGGERED)
+        self.assertEqual(len(self.jobs.Jobs), 2 * PEERS - TRIGGERED)
+        self.assertLess(elapsed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.WireguardConfiguration import WireguardConfiguration
+
+PEERS = 20000
+RESTRICTED = 2000
+
+
+class StressTestPeerListing(unittest.TestCase):
+    def setUp(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.Protocol = "wg"
+                self.ListenPort = "51820"
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine("sqlite:///:memory:")
+                self.DashboardConfig = mock_config
+                self.AllPeerJobs = MagicMock()
+                self.AllPeerJobs.searchJob.return_value = []
+                self.AllPeerShareLinks = MagicMock()
+                self.AllPeerShareLinks.getLink.return_value = []
+                self.PeerIndex = {}
+                self.RestrictedPeerIndex = {}
+                self.createDatabase()
+
+        self.wgc = Configuration()
+        rows = [{
+            "id": f"peer{i:05d}=", "private_key": "", "DNS": "", "endpoint_allowed_ip": "0.0.0.0/0",
+            "name": f"peer-{i}", "total_receive": i, "total_sent": i, "total_data": 2 * i, "endpoint": "N/A",
+            "status": "running" if i % 4 == 0 else "stopped", "latest_handshake": "No Handshake",
+            "allowed_ip": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32",
+            "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0,
+            "mtu": None, "keepalive": None, "remote_endpoint": "", "preshared_key": ""
+        } for i in range(PEERS + RESTRICTED)]
+        with self.wgc.engine.begin() as conn:
+            conn.execute(self.wgc.peersTable.insert(), rows[:PEERS])
+            conn.execute(self.wgc.peersRestrictedTable.insert(), rows[PEERS:])
+        self.wgc.PeerIndex = {r["id"]: self.wgc._loadPeer(r) for r in rows[:PEERS]}
+        self.wgc.Peers = list(self.wgc.PeerIndex.values())
+        self.wgc.getRestrictedPeers()
+
+    def _legacyPage(self, search):
+        """What clients did before, pull every peer and restricted peer as JSON, then filter, sort and slice"""
+        peers = self.wgc.getPeersList() + self.wgc.getRestrictedPeersList()
+        json.dumps([p.toJson() for p in peers], default=str)
+        matched = [p for p in peers if search in p.name or search in p.id or search in p.allowed_ip]
+        return sorted(matched, key=lambda p: p.total_data + p.cumu_data, reverse=True)[:50], len(matched)
+
+    def test_search_page(self):
+        start = time.time()
+        legacy, legacyTotal = self._legacyPage("peer-1")
+        before = time.time() - start
+
+        start = time.time()
+        page = self.wgc.queryPeers(search="peer-1", sort="total_data", descending=True, limit=50)
+        after = time.time() - start
+
+        print(f"\n{PEERS + RESTRICTED} peers, searched page: {before * 1000:.1f} ms in Python, {after * 1000:.1f} ms in the database")
+        self.assertEqual(sorted(p.id for p in page["peers"] + page["restrictedPeers"]), sorted(p.id for p in legacy))
+        self.assertEqual(page["totalPeers"] + page["totalRestrictedPeers"], legacyTotal)
+        self.assertLess(after, before)
+
+    def test_delta_sync_scales_with_churn(self):
+        def serialize(peers):
+            return json.dumps([p.toJson() for p in peers], default=str)
+
+        since = self.wgc.Version
+        changedIds = [f"peer{i:05d}=" for i in range(0, PEERS, PEERS // 30)]
+        self.wgc.bumpVersion(changedIds)
+
+        start = time.time()
+        full = serialize(self.wgc.getPeersList() + list(self.wgc.RestrictedPeerIndex.values()))
+        before = time.time() - start
+
+        start = time.time()
+        changes = self.wgc.getPeerChanges(since)
+        delta = serialize(changes["peers"] + changes["restrictedPeers"])
+        after = time.time() - start
+
+        print(f"\n{PEERS} peers, {len(changedIds)} changed: full sync {len(full) // 1024} KiB in {before * 1000:.1f} ms, "
+              f"delta {len(delta) // 1024} KiB in {after * 1000:.1f} ms")
+        self.assertEqual(sorted(p.id for p in changes["peers"]), sorted(changedIds))
+        self.assertLess(len(delta) * 100, len(full))
+        self.assertLess(after * 10, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import os
 import time
 import unittest
 import tempfile
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 # Mock flask before importing modules that use it
@@ -17,16 +18,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from modules.WireguardConfiguration import WireguardConfiguration
 
 class StressTestPeers(unittest.TestCase):
-    @patch('modules.DashboardConfig.DashboardConfig')
-    @patch('modules.PeerJobs.PeerJobs')
-    @patch('modules.PeerShareLinks.PeerShareLinks')
-    @patch('modules.DashboardWebHooks.DashboardWebHooks')
-    @patch('modules.WireguardCLI.WireguardCLI.run')
-    def test_performance_500_peers(self, mock_wg_run, mock_webhooks, mock_sharelinks, mock_jobs, mock_config):
-        # Setup mocks
+    def _buildConfiguration(self, mock_config, mock_jobs, mock_sharelinks, mock_webhooks, peer_count):
         tmp_dir = tempfile.gettempdir()
         mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" and k == "type" else (True, tmp_dir)
-        
+
         # Mock WireguardConfiguration methods that touch filesystem or DB in ways we want to avoid or control
         with patch.object(WireguardConfiguration, '_WireguardConfiguration__parseConfigurationFile', return_value=None), \
              patch.object(WireguardConfiguration, 'getStatus', return_value=True), \
@@ -37,81 +32,179 @@ class StressTestPeers(unittest.TestCase):
              patch.object(WireguardConfiguration, '_WireguardConfiguration__dumpDatabase', return_value=[]), \
              patch('os.path.exists', return_value=True), \
              patch('os.mkdir', return_value=None):
-            
+
             # Initialize WireguardConfiguration
             wgc = WireguardConfiguration(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, name="test_wg0")
-            wgc.Peers = []
-            wgc.Protocol = "wg"
-            wgc.Name = "test_wg0"
-            
-            # Setup engine and metadata for in-memory sqlite
-            import sqlalchemy as db
-            wgc.engine = db.create_engine('sqlite:///:memory:')
-            wgc.metadata = db.MetaData()
-            
-            # Manually create the peers table
-            wgc.peersTable = db.Table(
-                wgc.Name, wgc.metadata,
-                db.Column('id', db.String(255), primary_key=True),
-                db.Column('total_receive', db.BigInteger, default=0),
-                db.Column('total_sent', db.BigInteger, default=0),
-                db.Column('total_data', db.BigInteger, default=0),
-                db.Column('cumu_receive', db.BigInteger, default=0),
-                db.Column('cumu_sent', db.BigInteger, default=0),
-                db.Column('cumu_data', db.BigInteger, default=0),
-                db.Column('status', db.String(255)),
-                db.Column('latest_handshake', db.String(255)),
-                db.Column('endpoint', db.String(255)),
-                extend_existing=True
-            )
-            wgc.metadata.create_all(wgc.engine)
-
-            # Populate with 500 peers
-            peer_count = 500
-            peers_data = []
-            dump_lines = ["public_key\tpreshared_key\tendpoint\tallowed_ips\tlatest_handshake\ttransfer_rx\ttransfer_tx\tpersistent_keepalive"]
-            
-            now_ts = int(time.time())
-            for i in range(peer_count):
-                pk = f"peer_pubkey_{i:03d}="
-                peers_data.append({
-                    "id": pk,
-                    "total_receive": 0,
-                    "total_sent": 0,
-                    "total_data": 0,
-                    "cumu_receive": 0,
-                    "cumu_sent": 0,
-                    "cumu_data": 0,
-                    "status": "stopped",
-                    "latest_handshake": "No Handshake",
-                    "endpoint": "N/A"
-                })
-                # Simulated wg show dump line:
-                # public_key, preshared_key, endpoint, allowed_ips, latest_handshake, transfer_rx, transfer_tx, persistent_keepalive
+        wgc.getStatus = lambda: True
+        wgc.Peers = []
+        wgc.Protocol = "wg"
+        wgc.Name = "test_wg0"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        wgc.configPath = os.path.join(tmp.name, "test_wg0.conf")
+        with open(wgc.configPath, "w") as f:
+            f.write("[Interface]\n")
+
+        # Setup engine and metadata for in-memory sqlite
+        import sqlalchemy as db
+        wgc.engine = db.create_engine('sqlite:///:memory:')
+        wgc.metadata = db.MetaData()
+
+        # Manually create the peers table
+        wgc.peersTable = db.Table(
+            wgc.Name, wgc.metadata,
+            db.Column('id', db.String(255), primary_key=True),
+            db.Column('total_receive', db.BigInteger, default=0),
+            db.Column('total_sent', db.BigInteger, default=0),
+            db.Column('total_data', db.BigInteger, default=0),
+            db.Column('cumu_receive', db.BigInteger, default=0),
+            db.Column('cumu_sent', db.BigInteger, default=0),
+            db.Column('cumu_data', db.BigInteger, default=0),
+            db.Column('status', db.String(255)),
+            db.Column('latest_handshake', db.String(255)),
+            db.Column('latest_handshake_at', db.BigInteger),
+            db.Column('endpoint', db.String(255)),
+            extend_existing=True
+        )
+        wgc.metadata.create_all(wgc.engine)
+
+        peers_data = []
+        dump_lines = ["public_key\tpreshared_key\tendpoint\tallowed_ips\tlatest_handshake\ttransfer_rx\ttransfer_tx\tpersistent_keepalive"]
+
+        now_ts = int(time.time())
+        for i in range(peer_count):
+            pk = f"peer_pubkey_{i:03d}="
+            peers_data.append({
+                "id": pk,
+                "total_receive": 0,
+                "total_sent": 0,
+                "total_data": 0,
+                "cumu_receive": 0,
+                "cumu_sent": 0,
+                "cumu_data": 0,
+                "status": "stopped",
+                "latest_handshake": "No Handshake",
+                "latest_handshake_at": None,
+                "endpoint": "N/A"
+            })
+            # Simulated wg show dump line:
+            # public_key, preshared_key, endpoint, allowed_ips, latest_handshake, transfer_rx, transfer_tx, persistent_keepalive
+            # Every other peer never completed a handshake, so its row must not change
+            if i % 2 == 0:
                 dump_lines.append(f"{pk}\t(none)\t1.2.3.4:1234\t10.0.0.{i}/32\t{now_ts}\t{1000 * i}\t{2000 * i}\t21")
+            else:
+                dump_lines.append(f"{pk}\t(none)\tN/A\t10.0.0.{i}/32\t0\t0\t0\t21")
+
+        with wgc.engine.begin() as conn:
+            conn.execute(wgc.peersTable.insert(), peers_data)
+        # Lightweight stand-ins for the in-memory registry that getPeers() would normally fill
+        wgc.PeerIndex = {row["id"]: SimpleNamespace(**row) for row in peers_data}
+        return wgc, dump_lines
+
+    @patch('modules.DashboardConfig.DashboardConfig')
+    @patch('modules.PeerJobs.PeerJobs')
+    @patch('modules.PeerShareLinks.PeerShareLinks')
+    @patch('modules.DashboardWebHooks.DashboardWebHooks')
+    @patch('modules.WireguardCLI.WireguardCLI.run')
+    def test_performance_500_peers(self, mock_wg_run, mock_webhooks, mock_sharelinks, mock_jobs, mock_config):
+        peer_count = 500
+        wgc, dump_lines = self._buildConfiguration(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, peer_count)
+
+        # Mock wg show dump output
+        mock_wg_run.return_value = "\n".join(dump_lines).encode('utf-8')
+
+        # Measure performance
+        start_time = time.time()
+        wgc.updatePeersData()
+        end_time = time.time()
+
+        duration = end_time - start_time
+        print(f"\nPerformance for {peer_count} peers: {duration:.4f} seconds")
+
+        self.assertLess(duration, 10, "Update took too long (expected < 10s)")
+
+        # Verify data was updated
+        with wgc.engine.connect() as conn:
+            res = conn.execute(wgc.peersTable.select().where(wgc.peersTable.c.id == "peer_pubkey_498=")).mappings().fetchone()
+            self.assertEqual(res['total_receive'], 1000 * 498)
+            self.assertEqual(res['total_sent'], 2000 * 498)
+            self.assertEqual(res['status'], "running")
+
+    @patch('modules.DashboardConfig.DashboardConfig')
+    @patch('modules.PeerJobs.PeerJobs')
+    @patch('modules.PeerShareLinks.PeerShareLinks')
+    @patch('modules.DashboardWebHooks.DashboardWebHooks')
+    @patch('modules.WireguardCLI.WireguardCLI.run')
+    def test_bulk_update_10k_peers(self, mock_wg_run, mock_webhooks, mock_sharelinks, mock_jobs, mock_config):
+        peer_count = 10000
+        wgc, dump_lines = self._buildConfiguration(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, peer_count)
+        mock_wg_run.return_value = "\n".join(dump_lines).encode('utf-8')
+
+        import sqlalchemy as db
+        statements = []
+        db.event.listen(wgc.engine, "before_cursor_execute",
+                        lambda conn, cursor, statement, parameters, context, executemany:
+                        statements.append((statement, executemany, parameters)))
+
+        start_time = time.time()
+        wgc.updatePeersData()
+        duration = time.time() - start_time
+        print(f"\nBulk update for {peer_count} peers: {duration:.4f} seconds")
+
+        updates = [s for s in statements if s[0].startswith("UPDATE")]
+        # All changes go out as one executemany, and peers that never handshook are skipped
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0][1])
+        self.assertEqual(len(updates[0][2]), peer_count // 2)
+
+        # The registry is refreshed in place and the table is never reloaded
+        self.assertFalse([s for s in statements if s[0].startswith("SELECT")])
+        self.assertEqual(wgc.PeerIndex["peer_pubkey_9998="].total_data, 3000 * 9998)
+        self.assertEqual(wgc.PeerIndex["peer_pubkey_9998="].status, "running")
+
+        # A second poll with the same dump changes nothing, so nothing is written even though the handshakes aged
+        time.sleep(1.1)
+        statements.clear()
+        wgc.updatePeersData()
+        self.assertFalse(statements)
+
+        with wgc.engine.connect() as conn:
+            res = conn.execute(wgc.peersTable.select().where(wgc.peersTable.c.id == "peer_pubkey_9998=")).mappings().fetchone()
+            self.assertEqual(res['total_data'], 3000 * 9998)
+            self.assertEqual(res['endpoint'], "1.2.3.4:1234")
+
+    def _timeBulkDelete(self, mock_config, mock_jobs, mock_sharelinks, mock_webhooks, peer_count):
+        wgc, _ = self._buildConfiguration(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, peer_count)
+        for peer in wgc.PeerIndex.values():
+            peer.jobs = []
+            peer.ShareLink = []
+        wgc.Peers = list(wgc.PeerIndex.values())
+        keys = list(wgc.PeerIndex.keys())
+
+        start_time = time.time()
+        status, _ = wgc.deletePeers(keys, MagicMock(), MagicMock())
+        duration = time.time() - start_time
+
+        self.assertTrue(status)
+        self.assertEqual(wgc.Peers, [])
+        self.assertEqual(wgc.PeerIndex, {})
+        with wgc.engine.connect() as conn:
+            self.assertEqual(conn.execute(wgc.peersTable.select()).fetchall(), [])
+        return duration
+
+    @patch('modules.DashboardConfig.DashboardConfig')
+    @patch('modules.PeerJobs.PeerJobs')
+    @patch('modules.PeerShareLinks.PeerShareLinks')
+    @patch('modules.DashboardWebHooks.DashboardWebHooks')
+    @patch('modules.WireguardCLI.WireguardCLI.run')
+    def test_bulk_delete_5000_peers(self, mock_wg_run, mock_webhooks, mock_sharelinks, mock_jobs, mock_config):
+        mock_wg_run.return_value = b""
+        small = self._timeBulkDelete(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, 1000)
+        large = self._timeBulkDelete(mock_config, mock_jobs, mock_sharelinks, mock_webhooks, 5000)
+        print(f"\nBulk delete: 1000 peers {small:.4f} seconds, 5000 peers {large:.4f} seconds")
 
-            with wgc.engine.begin() as conn:
-                conn.execute(wgc.peersTable.insert(), peers_data)
-
-            # Mock wg show dump output
-            mock_wg_run.return_value = "\n".join(dump_lines).encode('utf-8')
-
-            # Measure performance
-            start_time = time.time()
-            wgc.updatePeersData()
-            end_time = time.time()
-
-            duration = end_time - start_time
-            print(f"\nPerformance for {peer_count} peers: {duration:.4f} seconds")
-            
-            self.assertLess(duration, 10, "Update took too long (expected < 10s)")
-            
-            # Verify data was updated
-            with wgc.engine.connect() as conn:
-                res = conn.execute(wgc.peersTable.select().where(wgc.peersTable.c.id == "peer_pubkey_499=")).mappings().fetchone()
-                self.assertEqual(res['total_receive'], 1000 * 499)
-                self.assertEqual(res['total_sent'], 2000 * 499)
-                self.assertEqual(res['status'], "running")
+        # Five times the peers should cost roughly five times as much, a quadratic scan would be 25x
+        self.assertLess(large, max(small, 0.05) * 12)
 
 if __name__ == '__main__':
     unittest.main()
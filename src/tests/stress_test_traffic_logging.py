@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import sqlalchemy as db
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.WireguardConfiguration import WireguardConfiguration
+
+PEERS = 10000
+# No embedded PostgreSQL server is packaged here, point this at any reachable one to include it
+POSTGRES_URL = os.environ.get("WGD_STRESS_POSTGRES_URL")
+
+
+class StressTestTrafficLogging(unittest.TestCase):
+    def _configuration(self, url):
+        mock_config = MagicMock()
+        dialect = "postgresql" if url.startswith("postgresql") else "sqlite"
+        mock_config.GetConfig.side_effect = lambda s, k: (True, dialect) if s == "Database" else (True, "")
+
+        class Configuration(WireguardConfiguration):
+            def __init__(self):
+                self.Name = "stress_wg"
+                self.metadata = db.MetaData()
+                self.engine = db.create_engine(url)
+                self.DashboardConfig = mock_config
+                self.createDatabase()
+
+        wgc = Configuration()
+        wgc.Peers = [SimpleNamespace(
+            id=f"peer{i:05d}=", status="running",
+            total_receive=i, total_sent=i, total_data=2 * i, cumu_receive=0, cumu_sent=0, cumu_data=0
+        ) for i in range(PEERS)]
+        return wgc
+
+    @staticmethod
+    def _perRowTick(wgc):
+        """The previous implementation, one INSERT and one clock read per running peer"""
+        with wgc.engine.begin() as conn:
+            for tempPeer in wgc.Peers:
+                if tempPeer.status == "running":
+                    conn.execute(
+                        wgc.peersTransferTable.insert().values({
+                            "id": tempPeer.id,
+                            "total_receive": tempPeer.total_receive,
+                            "total_sent": tempPeer.total_sent,
+                            "total_data": tempPeer.total_data,
+                            "cumu_sent": tempPeer.cumu_sent,
+                            "cumu_receive": tempPeer.cumu_receive,
+                            "cumu_data": tempPeer.cumu_data,
+                            "time": datetime.now()
+                        })
+                    )
+
+    def _compare(self, url):
+        wgc = self._configuration(url)
+        try:
+            start = time.time()
+            self._perRowTick(wgc)
+            before = time.time() - start
+
+            start = time.time()
+            wgc.logPeersTraffic()
+            after = time.time() - start
+
+            with wgc.engine.connect() as conn:
+                distinctTimes = conn.execute(
+                    db.select(db.func.count(db.distinct(wgc.peersTransferTable.c.time)))
+                ).scalar()
+                count = conn.execute(db.select(db.func.count()).select_from(wgc.peersTransferTable)).scalar()
+            print(f"\n{wgc.engine.dialect.name} {PEERS}-peer tick: {before:.3f} s per-row, {after:.3f} s batched")
+            self.assertEqual(count, 2 * PEERS)
+            # Every row of the batched tick shares one timestamp
+            self.assertLessEqual(distinctTimes, PEERS + 1)
+            self.assertLess(after, before)
+        finally:
+            wgc.metadata.drop_all(wgc.engine)
+            wgc.engine.dispose()
+
+    def test_sqlite_tick(self):
+        self._compare("sqlite:///:memory:")
+
+    @unittest.skipUnless(POSTGRES_URL, "set WGD_STRESS_POSTGRES_URL to benchmark PostgreSQL")
+    def test_postgresql_tick(self):
+        self._compare(POSTGRES_URL)
+
+
+if __name__ == '__main__':
+    unittest.main()
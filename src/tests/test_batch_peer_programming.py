@@ -0,0 +1,132 @@
+import json
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+FAKE_WG_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+
+@pytest.fixture
+def fake_wg(tmp_path, monkeypatch):
+    """Put the stand-in wg / wg-quick scripts first on PATH and return a reader for their state."""
+    statePath = tmp_path / "wg_state.json"
+    monkeypatch.setenv("WGD_FAKE_WG_STATE", str(statePath))
+    monkeypatch.setenv("PATH", FAKE_WG_BIN + os.pathsep + os.environ.get("PATH", ""))
+
+    def state():
+        with open(statePath) as f:
+            return json.load(f)
+    return state
+
+
+@pytest.fixture
+def dashboard_settings(dashboard_settings):
+    return {**dashboard_settings, ("Peers", "remote_endpoint"): "1.2.3.4"}
+
+
+def _newPeers(count):
+    return [{
+        "id": f"peer{i:05d}=",
+        "private_key": "",
+        "DNS": "1.1.1.1",
+        "endpoint_allowed_ip": "0.0.0.0/0",
+        "name": f"peer{i}",
+        "allowed_ip": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32",
+        "mtu": 1420,
+        "keepalive": 25 if i % 2 == 0 else 0,
+        "preshared_key": "psk=" if i % 3 == 0 else ""
+    } for i in range(count)]
+
+
+def test_bulk_operations_spawn_constant_processes(fake_wg, wg_config):
+    """Adding, restricting, allowing and deleting 300 peers costs a fixed number of wg calls each."""
+    peers = _newPeers(300)
+    status, added, message = wg_config.addPeers(peers)
+    assert status, message
+    calls = fake_wg()["calls"]
+    assert [c[:2] for c in calls] == [["wg", "addconf"], ["wg-quick", "save"]]
+    programmed = fake_wg()["peers"]
+    assert len(programmed) == 300
+    assert programmed["peer00000="] == {
+        "PublicKey": "peer00000=", "PresharedKey": "psk=", "AllowedIPs": "10.0.0.0/32", "PersistentKeepalive": "25"
+    }
+    assert "PresharedKey" not in programmed["peer00001="]
+    assert len(wg_config.Peers) == 300
+
+    restricted = [p["id"] for p in peers[:100]]
+    status, message = wg_config.restrictPeers(restricted)
+    assert status, message
+    calls = fake_wg()["calls"][2:]
+    assert [c[:2] for c in calls] == [["wg", "showconf"], ["wg", "syncconf"], ["wg-quick", "save"]]
+    assert len(fake_wg()["peers"]) == 200
+    assert wg_config.searchRestrictedPeer("peer00000=")[0]
+    assert not wg_config.searchPeer("peer00000=")[0]
+
+    status, message = wg_config.allowAccessPeers(restricted)
+    assert status, message
+    calls = fake_wg()["calls"][5:]
+    assert [c[:2] for c in calls] == [["wg", "addconf"], ["wg-quick", "save"]]
+    assert len(fake_wg()["peers"]) == 300
+    assert wg_config.searchPeer("peer00000=")[0]
+
+    status, message = wg_config.deletePeers([p["id"] for p in peers[:250]], MagicMock(), MagicMock())
+    assert status, message
+    calls = fake_wg()["calls"][7:]
+    assert [c[:2] for c in calls] == [["wg", "showconf"], ["wg", "syncconf"], ["wg-quick", "save"]]
+    assert sorted(fake_wg()["peers"]) == [p["id"] for p in peers[250:]]
+    assert len(wg_config.Peers) == 50
+
+
+def test_failed_removal_leaves_peers(fake_wg, wg_config, monkeypatch):
+    """When wg rejects the batch, no peer is removed from the tables or the registry."""
+    wg_config.addPeers(_newPeers(5))
+    monkeypatch.setenv("WGD_FAKE_WG_FAIL", "syncconf")
+    status, message = wg_config.deletePeers(["peer00000=", "peer00001="], MagicMock(), MagicMock())
+    assert not status
+    assert "Failed to delete 2 peer(s)" in message
+    assert len(wg_config.Peers) == 5
+    assert len(fake_wg()["peers"]) == 5
+    with wg_config.engine.connect() as conn:
+        assert len(conn.execute(wg_config.peersTable.select()).fetchall()) == 5
+
+
+def test_allow_access_with_unknown_key_moves_nothing(fake_wg, wg_config):
+    """One key that is not restricted fails the call before any peer is moved."""
+    wg_config.addPeers(_newPeers(3))
+    wg_config.restrictPeers(["peer00000=", "peer00001="])
+    status, message = wg_config.allowAccessPeers(["peer00000=", "unknown=", "peer00001="])
+    assert not status
+    assert message == "Failed to allow access of peer unknown="
+    assert sorted(wg_config.RestrictedPeerIndex) == ["peer00000=", "peer00001="]
+    assert sorted(fake_wg()["peers"]) == ["peer00002="]
+    with wg_config.engine.connect() as conn:
+        assert len(conn.execute(wg_config.peersTable.select()).fetchall()) == 1
+        assert len(conn.execute(wg_config.peersRestrictedTable.select()).fetchall()) == 2
+
+
+def test_concurrent_add_is_not_dropped_by_removal(wg_config, monkeypatch):
+    """A wg addconf from another thread waits until showconf + syncconf of a removal is applied."""
+    import subprocess
+    import threading
+    import time
+    from modules.WireguardCLI import WireguardCLI
+
+    calls = []
+    inShowconf = threading.Event()
+
+    def check_output(cmd, stderr=None, timeout=None, input=None):
+        calls.append(cmd[1])
+        if cmd[1] == "showconf":
+            inShowconf.set()
+            time.sleep(0.2)
+            return b"[Interface]\nListenPort = 51820\n\n[Peer]\nPublicKey = old=\nAllowedIPs = 10.0.0.2/32\n"
+        return b""
+    monkeypatch.setattr(subprocess, "check_output", check_output)
+
+    removal = threading.Thread(target=wg_config._programPeers, kwargs={"removePublicKeys": ["old="]})
+    removal.start()
+    inShowconf.wait(5)
+    WireguardCLI.run(["wg", "addconf", wg_config.Name, "/dev/null"])
+    removal.join()
+    assert calls == ["showconf", "syncconf", "addconf"]
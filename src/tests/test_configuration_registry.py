@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.ConfigurationRegistry import ConfigurationRegistry
+
+
+class Loader:
+    def __init__(self, value, delay: float = 0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+        self.threads = set()
+
+    def __call__(self):
+        self.calls += 1
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        return self.value
+
+
+def test_constructed_on_first_lookup():
+    registry = ConfigurationRegistry()
+    loaders = {name: Loader(f"{name}-config") for name in ("wg0", "wg1", "wg2")}
+    for name, loader in loaders.items():
+        registry.setLoader(name, loader)
+
+    assert registry.keys() == ["wg0", "wg1", "wg2"]
+    assert "wg1" in registry and len(registry) == 3
+    assert all(l.calls == 0 for l in loaders.values())
+
+    assert registry["wg1"] == "wg1-config"
+    assert registry.get("wg1") == "wg1-config"
+    assert registry.isLoaded("wg1") and not registry.isLoaded("wg0")
+    assert [l.calls for l in loaders.values()] == [0, 1, 0]
+
+    assert sorted(registry.values()) == ["wg0-config", "wg1-config", "wg2-config"]
+    assert [l.calls for l in loaders.values()] == [1, 1, 1]
+
+
+def test_reload_and_invalid_configurations():
+    registry = ConfigurationRegistry()
+    registry["wg0"] = "old"
+    registry.setLoader("wg0", Loader("new"))
+    assert not registry.isLoaded("wg0")
+    assert registry["wg0"] == "new"
+
+    # A loader returning None drops the configuration
+    registry.setLoader("broken", Loader(None))
+    assert registry.get("broken") is None
+    assert "broken" not in registry
+
+    registry.setLoader("wg1", Loader("wg1-config"))
+    assert registry.pop("wg1") is None
+    assert registry.pop("wg0") == "new"
+    registry.setLoader("wg2", Loader("wg2-config"))
+    registry.clear()
+    assert registry.keys() == []
+
+
+def test_failed_load_is_not_registered_again_until_it_changes():
+    registry = ConfigurationRegistry()
+    broken = Loader(None)
+    assert registry.setLoader("broken", broken, 1.0)
+    assert registry.get("broken") is None
+    assert "broken" not in registry and registry.keys() == []
+
+    assert registry.setLoader("broken", Loader(None), 1.0) is False
+    assert "broken" not in registry
+    assert broken.calls == 1
+
+    assert registry.setLoader("broken", Loader("fixed"), 2.0)
+    assert registry["broken"] == "fixed"
+
+
+def test_load_in_thread_pool():
+    registry = ConfigurationRegistry()
+    loaders = [Loader(i, delay=0.1) for i in range(8)]
+    for i, loader in enumerate(loaders):
+        registry.setLoader(f"wg{i}", loader)
+
+    start = time.time()
+    registry.load(["wg0", "wg1", "wg2", "wg3", "missing"])
+    assert time.time() - start < 0.35
+    assert [l.calls for l in loaders] == [1, 1, 1, 1, 0, 0, 0, 0]
+    assert len(set.union(*(l.threads for l in loaders[:4]))) > 1
+
+
+def test_concurrent_lookups_construct_once():
+    registry = ConfigurationRegistry()
+    loader = Loader("wg0-config", delay=0.1)
+    registry.setLoader("wg0", loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry["wg0"])) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["wg0-config"] * 5
+    assert loader.calls == 1
@@ -0,0 +1,159 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from modules.WireguardCLI import WireguardCLI
+from modules.WireguardConfiguration import WireguardConfiguration
+
+
+@pytest.fixture
+def wg_config(wg_config, peer_row, monkeypatch):
+    monkeypatch.setattr(WireguardCLI, "run", MagicMock(return_value=b""))
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), [peer_row(i) for i in range(2, 5)])
+        conn.execute(wg_config.peersRestrictedTable.insert(), [peer_row(9)])
+    wg_config.getPeers()
+    wg_config.getRestrictedPeers()
+    return wg_config
+
+
+def test_reads_keep_the_version(wg_config):
+    version = wg_config.Version
+    wg_config.getPeersList()
+    wg_config.getRestrictedPeersList()
+    wg_config.queryPeers(search="peer")
+    restricted = wg_config.RestrictedPeerIndex["peer9="]
+    wg_config.getRestrictedPeersList()
+    assert wg_config.RestrictedPeerIndex["peer9="] is restricted
+    for peer in wg_config.Peers:
+        peer.getJobs()
+        peer.getShareLink()
+    assert wg_config.Version == version
+
+
+def test_restricted_list_is_served_from_the_index(wg_config, monkeypatch):
+    restricted = wg_config.RestrictedPeerIndex["peer9="]
+    refreshed = []
+    monkeypatch.setattr(restricted, "getJobs", lambda: refreshed.append("jobs"))
+    monkeypatch.setattr(restricted, "getShareLink", lambda: refreshed.append("links"))
+    monkeypatch.setattr(wg_config, "engine", None)
+    assert wg_config.getRestrictedPeersList() == [restricted]
+    assert refreshed == []
+
+
+def test_listing_peers_with_jobs_keeps_the_version(wg_config, peer_row):
+    wg_config.AllPeerJobs.searchJob.return_value = [MagicMock()]
+    wg_config.AllPeerShareLinks.getLink.return_value = [MagicMock()]
+    # A row the registry does not hold yet is loaded just for the page
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), [peer_row(7)])
+    version = wg_config.Version
+    assert "peer7=" in [p.id for p in wg_config.queryPeers(limit=10)["peers"]]
+    wg_config.queryPeers(limit=10)
+    assert wg_config.Version == version
+
+
+def test_handshake_ages_do_not_stay_cached(wg_config, monkeypatch):
+    import modules.WireguardConfiguration
+    now = [1_000_000.0]
+    monkeypatch.setattr(modules.WireguardConfiguration.time, "time", lambda: now[0])
+    assert wg_config.handshakeAgeBucket() is None
+
+    peer = wg_config.PeerIndex["peer2="]
+    peer.latest_handshake_at = int(now[0]) - 185
+    version, bucket = wg_config.Version, wg_config.handshakeAgeBucket()
+    # Nothing changed a minute later, but the age shown has
+    now[0] += 60
+    assert wg_config.Version == version
+    assert wg_config.handshakeAgeBucket() != bucket
+
+
+def test_mutations_bump_the_version(wg_config):
+    peer = wg_config.PeerIndex["peer2="]
+
+    version = wg_config.Version
+    wg_config.AllPeerJobs.searchJob.return_value = [MagicMock()]
+    peer.getJobs()
+    assert wg_config.Version > version
+
+    version = wg_config.Version
+    assert peer.resetDataUsage("total")
+    assert wg_config.Version > version
+
+    version = wg_config.Version
+    assert wg_config.restrictPeers(["peer3="])[0]
+    assert wg_config.Version > version
+
+    version = wg_config.Version
+    assert wg_config.deletePeers(["peer4="], MagicMock(), MagicMock())[0]
+    assert wg_config.Version > version
+
+
+def test_peer_changes_since_version(wg_config):
+    since = wg_config.Version
+    assert wg_config.getPeerChanges(since) == {"peers": [], "restrictedPeers": [], "removedPeers": []}
+
+    wg_config.PeerIndex["peer2="].resetDataUsage("total")
+    wg_config.restrictPeers(["peer3="])
+    changes = wg_config.getPeerChanges(since)
+    assert [p.id for p in changes["peers"]] == ["peer2="]
+    assert [p.id for p in changes["restrictedPeers"]] == ["peer3="]
+
+    middle = wg_config.Version
+    wg_config.deletePeers(["peer4="], MagicMock(), MagicMock())
+    assert wg_config.getPeerChanges(middle) == {"peers": [], "restrictedPeers": [], "removedPeers": ["peer4="]}
+    assert wg_config.getPeerChanges(since)["removedPeers"] == ["peer4="]
+    # Reloading unchanged rows is not a change
+    version = wg_config.Version
+    wg_config.getRestrictedPeers()
+    assert wg_config.Version == version
+    # Versions from the future, e.g. after a restart, need a full sync
+    assert wg_config.getPeerChanges(wg_config.Version + 1) is None
+
+
+def test_trimmed_removals_need_full_sync(wg_config, monkeypatch):
+    monkeypatch.setattr(WireguardConfiguration, "REMOVED_PEERS_KEPT", 1)
+    since = wg_config.Version
+    wg_config.bumpVersion(removedPeers=["a="])
+    wg_config.bumpVersion(removedPeers=["b="])
+    assert wg_config.getPeerChanges(since) is None
+    assert wg_config.getPeerChanges(wg_config.Version - 1)["removedPeers"] == ["b="]
+
+
+def test_removing_the_last_peer_from_the_file(wg_config, tmp_path):
+    from flask import Flask
+    wg_config.configPath = str(tmp_path / "test_wg.conf")
+    with open(wg_config.configPath, "w") as f:
+        f.write("[Interface]\nPrivateKey = key\n")
+    wg_config._WireguardConfiguration__configFileModifiedTime = None
+    since = wg_config.Version
+    with Flask(__name__).app_context():
+        WireguardConfiguration.getPeers(wg_config)
+    assert wg_config.Peers == []
+    assert wg_config.PeerIndex == {}
+    assert sorted(wg_config.getPeerChanges(since)["removedPeers"]) == ["peer2=", "peer3=", "peer4="]
+
+
+def test_saving_keeps_the_file_in_sync(wg_config, monkeypatch):
+    wg_config.configurationFileChanged()
+
+    def run(cmd, timeout=10, input=None):
+        if "save" in cmd:
+            # wg-quick save rewrites the file
+            mtime = os.path.getmtime(wg_config.configPath) + 5
+            os.utime(wg_config.configPath, (mtime, mtime))
+        return b""
+    monkeypatch.setattr(WireguardCLI, "run", run)
+    assert wg_config.restrictPeers(["peer2="])[0]
+    assert wg_config.deletePeers(["peer3="], MagicMock(), MagicMock())[0]
+    assert not wg_config.configurationFileChanged(update=False)
+
+
+def test_rebuilt_configuration_gets_a_new_epoch(wg_config):
+    epoch = wg_config.Epoch
+    assert wg_config.Epoch == epoch
+    rebuilt = type(wg_config)()
+    # Versions restart with the new instance, the epoch tells them apart
+    assert rebuilt.Version <= wg_config.Version
+    assert rebuilt.Epoch != epoch
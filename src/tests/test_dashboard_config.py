@@ -0,0 +1,108 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from hashlib import sha256
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.DashboardConfig
+from modules.DashboardConfig import DashboardConfig
+
+
+@pytest.fixture
+def dashboard_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(DashboardConfig, "ConfigurationFilePath", str(tmp_path / "wg-dashboard.ini"))
+    monkeypatch.setattr(modules.DashboardConfig, "GetRemoteEndpoint", lambda: "192.0.2.1")
+    monkeypatch.setattr(modules.DashboardConfig, "ConnectionString", lambda database: "sqlite://")
+    monkeypatch.setattr(modules.DashboardConfig, "CreateEngine", lambda cn: create_engine(cn, poolclass=StaticPool))
+    return DashboardConfig()
+
+
+def test_snapshot_values(dashboard_config):
+    config = dashboard_config.Snapshot
+    assert config.AuthRequired is True
+    assert config.APIKeyEnabled is False
+    assert config.PeerMTU == "1328"
+    assert config.PeerRemoteEndpoint == "192.0.2.1"
+    assert dashboard_config.GetConfig("Peers", "peer_MTU") == (True, "1328")
+    assert dashboard_config.GetConfig("Peers", "missing") == (False, None)
+    assert dashboard_config.GetConfig("Missing", "key") == (False, None)
+    with pytest.raises(AttributeError):
+        config.AuthRequired = False
+    with pytest.raises(TypeError):
+        config.Values["Server"]["auth_req"] = "false"
+
+
+def test_set_config_swaps_snapshot(dashboard_config):
+    config = dashboard_config.Snapshot
+    assert dashboard_config.SetConfig("Server", "dashboard_api_key", True) == (True, "")
+    assert config.APIKeyEnabled is False
+    assert dashboard_config.Snapshot.APIKeyEnabled is True
+    assert dashboard_config.GetConfig("Server", "dashboard_api_key") == (True, True)
+    assert dashboard_config.toJson()["Server"]["dashboard_api_key"] is True
+    assert "totp_key" not in dashboard_config.toJson()["Account"]
+
+    # Callers change the returned list before saving it back
+    _, autostart = dashboard_config.GetConfig("WireGuardConfiguration", "autostart")
+    autostart.append("wg0")
+    assert dashboard_config.GetConfig("WireGuardConfiguration", "autostart") == (True, [])
+    dashboard_config.SetConfig("WireGuardConfiguration", "autostart", autostart)
+    assert dashboard_config.GetConfig("WireGuardConfiguration", "autostart") == (True, ["wg0"])
+
+    # The file on disk matches the new snapshot
+    assert DashboardConfig().Snapshot.APIKeyEnabled is True
+
+
+def test_reads_during_writes(dashboard_config):
+    stop = threading.Event()
+    seen = set()
+
+    def read():
+        while not stop.is_set():
+            seen.add(dashboard_config.GetConfig("Peers", "peer_keep_alive")[1])
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(20):
+        dashboard_config.SetConfig("Peers", "peer_keep_alive", str(30 + i % 2))
+    stop.set()
+    reader.join()
+    assert seen <= {"21", "30", "31"}
+
+
+def test_api_keys(dashboard_config, monkeypatch):
+    monkeypatch.setattr(DashboardConfig, "API_KEY_CACHE_SECONDS", 0)
+    dashboard_config.createAPIKeys()
+    dashboard_config.createAPIKeys(datetime.now() + timedelta(seconds=0.5))
+    neverExpires, expires = sorted(dashboard_config.DashboardAPIKeys, key=lambda k: k.ExpiredAt is not None)
+    assert dashboard_config.verifyAPIKey(neverExpires.Key)
+    assert dashboard_config.verifyAPIKey(expires.Key)
+    assert not dashboard_config.verifyAPIKey("unknown")
+
+    time.sleep(0.6)
+    assert not dashboard_config.verifyAPIKey(expires.Key)
+    dashboard_config.deleteAPIKey(neverExpires.Key)
+    assert not dashboard_config.verifyAPIKey(neverExpires.Key)
+    assert dashboard_config.DashboardAPIKeys == []
+
+
+def test_api_key_cache(dashboard_config, monkeypatch):
+    monkeypatch.setattr(DashboardConfig, "API_KEY_CACHE_SIZE", 2)
+    dashboard_config.createAPIKeys()
+    key = dashboard_config.DashboardAPIKeys[0].Key
+    assert dashboard_config.verifyAPIKey(key)
+
+    # A cached key is accepted without the index, until the keys change
+    hashes = []
+    monkeypatch.setattr(hashlib, "sha256", lambda data: hashes.append(data) or sha256(data))
+    assert dashboard_config.verifyAPIKey(key)
+    assert hashes == []
+    dashboard_config.deleteAPIKey(key)
+    assert not dashboard_config.verifyAPIKey(key)
@@ -0,0 +1,82 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from modules.DashboardEvents import DashboardEvents
+from modules.WireguardCLI import WireguardCLI
+
+
+def _drain(subscription):
+    messages = []
+    while not subscription.Queue.empty():
+        messages.append(subscription.Queue.get_nowait())
+    return messages
+
+
+def test_configuration_filter():
+    events = DashboardEvents()
+    everything = events.subscribe()
+    wg0 = events.subscribe({"wg0"})
+    events.publish("peerStatus", {"configuration": "wg0"}, configuration="wg0")
+    events.publish("peerStatus", {"configuration": "wg1"}, configuration="wg1")
+    events.publish("systemStatus", {"CPU": 1})
+    assert len(_drain(everything)) == 3
+    assert _drain(wg0) == [
+        'event: peerStatus\ndata: {"configuration": "wg0"}\n\n',
+        'event: systemStatus\ndata: {"CPU": 1}\n\n'
+    ]
+
+
+def test_stalled_client_drops_oldest(monkeypatch):
+    monkeypatch.setattr(DashboardEvents, "MAX_QUEUED", 2)
+    events = DashboardEvents()
+    subscription = events.subscribe()
+    for i in range(5):
+        events.publish("tick", i)
+    assert _drain(subscription) == ["event: tick\ndata: 3\n\n", "event: tick\ndata: 4\n\n"]
+
+
+def test_subscriber_limit():
+    events = DashboardEvents(maxSubscribers=1)
+    subscription = events.subscribe()
+    assert events.subscribe() is None
+    events.unsubscribe(subscription)
+    assert events.subscribe() is not None
+
+
+def test_stream_keepalive_and_unsubscribe(monkeypatch):
+    monkeypatch.setattr(DashboardEvents, "KEEPALIVE_SECONDS", 0.01)
+    events = DashboardEvents()
+    subscription = events.subscribe()
+    stop = threading.Event()
+    stream = events.stream(subscription, stop)
+    assert next(stream).startswith("retry:")
+    assert next(stream) == ": keepalive\n\n"
+    events.publish("tick", 1)
+    assert next(stream) == "event: tick\ndata: 1\n\n"
+    # The client going away closes the generator
+    stream.close()
+    assert not events.hasSubscribers()
+
+    subscription = events.subscribe()
+    stop.set()
+    assert list(events.stream(subscription, stop)) == ["retry: 5000\n\n"]
+    assert not events.hasSubscribers()
+
+
+def test_update_peers_data_reports_transitions(wg_config, peer_row, monkeypatch):
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), [peer_row(i) for i in range(2, 4)])
+    wg_config.getPeers()
+
+    now = int(time.time())
+    monkeypatch.setattr(WireguardCLI, "peerStats", MagicMock(return_value=[
+        ("peer2=", "1.2.3.4:51820", now, 10, 10),
+        ("peer3=", "(none)", 0, 0, 0),
+    ]))
+    transitions = wg_config.updatePeersData()
+    assert [(t["id"], t["status"], t["endpoint"]) for t in transitions] == [("peer2=", "running", "1.2.3.4:51820")]
+    assert wg_config.PeerIndex["peer2="].status == "running"
+    # Only traffic moved, no status changed
+    WireguardCLI.peerStats.return_value = [("peer2=", "1.2.3.4:51820", now, 20, 20)]
+    assert wg_config.updatePeersData() == []
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, event, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from modules.DatabaseMigrations import DatabaseMigrations
+
+GB = 1024 ** 3
+COUNTERS = ["total_receive", "total_sent", "total_data", "cumu_receive", "cumu_sent", "cumu_data"]
+
+
+@pytest.fixture
+def engine():
+    return create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+
+def _legacyDatabase(engine, migrated=False):
+    legacy = MetaData()
+    Table("test_wg", legacy, Column("id", String(255), primary_key=True), *[Column(c, Float) for c in COUNTERS])
+    legacy.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO test_wg VALUES ('a=', 1.5, 0.5, 2, 0, 0, 0), ('b=', :corrupted, 0, 0, 0, 0, 0)"),
+                     {"corrupted": 3 * 1024 ** 6})
+        if migrated:
+            conn.execute(text("CREATE TABLE wgd_migrations (id VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP)"))
+            conn.execute(text("INSERT INTO wgd_migrations (id) VALUES ('float_to_bigint_v1_test_wg')"))
+
+
+def _statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_migrations_run_once(engine, MockWGConfig):
+    _legacyDatabase(engine)
+    MockWGConfig()
+    with engine.connect() as conn:
+        rows = {r.id: r for r in conn.execute(text("SELECT * FROM test_wg"))}
+        assert conn.execute(text("SELECT version FROM wgd_schema_versions WHERE name = 'test_wg'")).scalar() == DatabaseMigrations.VERSION
+    assert (rows["a="].total_receive, rows["a="].total_sent, rows["a="].total_data) == (int(1.5 * GB), GB // 2, 2 * GB)
+    assert rows["b="].total_receive == 3 * 1024 ** 3
+
+    statements = _statements(engine)
+    wg = MockWGConfig()
+    assert statements == []
+    assert wg.peersTable.name == "test_wg"
+
+
+def test_version_loaded_from_database(engine, MockWGConfig):
+    MockWGConfig()
+    runner = DatabaseMigrations(engine)
+    statements = _statements(engine)
+    assert runner.version("test_wg") == DatabaseMigrations.VERSION
+    assert runner.version("other") == 0
+    assert len(statements) == 1
+
+
+def test_upgraded_database_is_not_scanned_again(engine, MockWGConfig):
+    _legacyDatabase(engine, migrated=True)
+    statements = _statements(engine)
+    MockWGConfig()
+    assert not any('SELECT * FROM "test_wg"' in s for s in statements)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT total_receive FROM test_wg WHERE id = 'b='")).scalar() == 3 * 1024 ** 6
+
+
+def test_dropped_database_is_migrated_again(engine, MockWGConfig):
+    wg = MockWGConfig()
+    assert wg._WireguardConfiguration__dropDatabase()
+    assert DatabaseMigrations.forEngine(engine).version("test_wg") == 0
+    assert not inspect(engine).has_table("test_wg")
+
+    MockWGConfig()
+    inspector = inspect(engine)
+    assert inspector.has_table("test_wg")
+    assert "ix_test_wg_transfer_id_time" in {i["name"] for i in inspector.get_indexes("test_wg_transfer")}
+    assert DatabaseMigrations.forEngine(engine).version("test_wg") == DatabaseMigrations.VERSION
@@ -0,0 +1,76 @@
+import ipaddress
+from unittest.mock import MagicMock
+
+import pytest
+
+from modules.IPAllocator import IPAllocator, SubnetAllocator
+from modules.WireguardCLI import WireguardCLI
+
+
+def test_matches_hosts_order():
+    allocator = IPAllocator("10.0.0.1/29")
+    allocator.use("10.0.0.3/32, fd00::2/128")
+    assert allocator.available(10) == {"10.0.0.1/29": ["10.0.0.2/32", "10.0.0.4/32", "10.0.0.5/32", "10.0.0.6/32"]}
+    # num_addresses minus the interface and the peer, like the previous implementation
+    assert allocator.freeCounts() == {"10.0.0.1/29": 6}
+
+
+def test_shared_addresses_are_reference_counted():
+    allocator = IPAllocator("10.0.0.1/24")
+    allocator.use("10.0.0.2/32")
+    allocator.use("10.0.0.2/32")
+    allocator.release("10.0.0.2/32")
+    assert allocator.available(1) == {"10.0.0.1/24": ["10.0.0.3/32"]}
+    allocator.release("10.0.0.2/32")
+    assert allocator.available(1) == {"10.0.0.1/24": ["10.0.0.2/32"]}
+    assert allocator.freeCounts() == {"10.0.0.1/24": 255}
+
+
+def test_ipv6_is_sparse():
+    allocator = IPAllocator("fd00::1/64")
+    subnet = allocator.Subnets["fd00::1/64"]
+    assert subnet.freeCount() == 2 ** 64 - 1
+    allocator.use("fd00::2/128, fd00::4/128")
+    assert allocator.available(3) == {"fd00::1/64": ["fd00::3/128", "fd00::5/128", "fd00::6/128"]}
+    assert allocator.freeCounts() == {"fd00::1/64": 2 ** 64 - 3}
+
+
+@pytest.mark.parametrize("network", ["10.0.0.0/30", "10.0.0.0/31", "10.0.0.5/32", "fd00::/126", "fd00::/127"])
+def test_small_subnets_follow_hosts(network):
+    subnet = SubnetAllocator(ipaddress.ip_network(network))
+    hosts = [f"{h}/{h.max_prefixlen}" for h in ipaddress.ip_network(network).hosts()]
+    assert subnet.nextFree(10) == hosts
+
+
+def test_configuration_tracks_peer_changes(wg_config, peer_row, monkeypatch):
+    table = wg_config.peersTable
+    with wg_config.engine.begin() as conn:
+        conn.execute(table.insert(), [peer_row(i) for i in range(2, 6)])
+    wg_config.getPeers()
+    assert wg_config.getAvailableIP(2)[1]["10.0.0.1/24"] == ["10.0.0.6/32", "10.0.0.7/32"]
+    assert wg_config.getAvailableIP(1)[1]["fd00::1/64"] == ["fd00::2/128"]
+    assert wg_config.getNumberOfAvailableIP()[1]["10.0.0.1/24"] == 256 - 5
+
+    # Editing a peer's address frees the old one, and a removed peer frees its address too
+    with wg_config.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.id == "peer3=").values(allowed_ip="10.0.0.9/32"))
+        conn.execute(table.delete().where(table.c.id == "peer4="))
+    wg_config.getPeers()
+    assert wg_config.getAvailableIP(3)[1]["10.0.0.1/24"] == ["10.0.0.3/32", "10.0.0.4/32", "10.0.0.6/32"]
+
+    # Restricted peers keep their address reserved
+    wg_config.RestrictedPeerIndex["peer5="] = wg_config.PeerIndex.pop("peer5=")
+    with wg_config.engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.id == "peer5="))
+    wg_config.getPeers()
+    assert wg_config.getNumberOfAvailableIP()[1]["10.0.0.1/24"] == 256 - 4
+
+    monkeypatch.setattr(WireguardCLI, "run", MagicMock(return_value=b""))
+    status, message = wg_config.deletePeers(["peer2="], MagicMock(), MagicMock())
+    assert status, message
+    assert wg_config.getAvailableIP(1)[1]["10.0.0.1/24"] == ["10.0.0.2/32"]
+    assert wg_config.getNumberOfAvailableIP()[1]["10.0.0.1/24"] == 256 - 3
+
+    # A different interface address rebuilds the allocator
+    wg_config.Address = "10.1.0.1/30"
+    assert wg_config.getAvailableIP(-1) == (True, {"10.1.0.1/30": ["10.1.0.2/32"]})
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+import sqlalchemy as db
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.PeerJobLogger
+from modules.LogQueue import LogQueue
+from modules.PeerJobLogger import PeerJobLogger
+
+
+@pytest.fixture
+def log_table(tmp_path):
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'log.db'}")
+    metadata = db.MetaData()
+    table = db.Table('Log', metadata,
+                     db.Column('LogID', db.String(255), nullable=False, primary_key=True),
+                     db.Column('Message', db.Text))
+    metadata.create_all(engine)
+    return engine, table
+
+
+def _count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(db.select(db.func.count()).select_from(table)).scalar()
+
+
+def _row(i):
+    return {"LogID": str(uuid.uuid4()), "Message": f"log {i}"}
+
+
+def test_flush_in_batches(log_table, monkeypatch):
+    engine, table = log_table
+    monkeypatch.setattr(LogQueue, "BATCH_SIZE", 10)
+    monkeypatch.setattr(LogQueue, "FLUSH_SECONDS", 60)
+    logs = LogQueue(engine, table)
+    for i in range(5):
+        assert logs.put(_row(i))
+    assert _count(engine, table) == 0
+    logs.flush()
+    assert _count(engine, table) == 5
+
+    # A full batch wakes the thread before the flush interval
+    for i in range(10):
+        logs.put(_row(i))
+    deadline = time.time() + 5
+    while _count(engine, table) < 15 and time.time() < deadline:
+        time.sleep(0.05)
+    assert _count(engine, table) == 15
+
+    logs.put(_row(0))
+    logs.stop()
+    assert _count(engine, table) == 16
+
+
+def test_bounded(log_table, monkeypatch):
+    engine, table = log_table
+    monkeypatch.setattr(LogQueue, "MAX_QUEUED", 3)
+    monkeypatch.setattr(LogQueue, "FLUSH_SECONDS", 60)
+    logs = LogQueue(engine, table)
+    assert [logs.put(_row(i)) for i in range(4)] == [True, True, True, False]
+    assert logs.Dropped == 1
+    logs.stop()
+    assert _count(engine, table) == 3
+
+
+def test_cleanup_schedule(log_table, monkeypatch):
+    engine, table = log_table
+    monkeypatch.setattr(LogQueue, "FLUSH_SECONDS", 0.05)
+    cleanups = []
+    logs = LogQueue(engine, table, lambda: cleanups.append(time.time()), cleanupSeconds=0.2)
+    logs.put(_row(0))
+    time.sleep(0.5)
+    logs.stop()
+    assert 1 <= len(cleanups) <= 3
+
+
+def test_put_after_stop_is_written(log_table, monkeypatch):
+    engine, table = log_table
+    monkeypatch.setattr(LogQueue, "FLUSH_SECONDS", 60)
+    logs = LogQueue(engine, table)
+    logs.put(_row(0))
+    logs.stop()
+    assert logs.put(_row(1))
+    assert _count(engine, table) == 2
+
+
+def test_job_log_cleanup_outside_the_app(monkeypatch, caplog):
+    mock_db_config = MagicMock()
+    mock_db_config.GetConfig.side_effect = lambda section, key: (True, "sqlite")
+    monkeypatch.setattr(modules.PeerJobLogger, "ConnectionString", lambda database: "sqlite://")
+    monkeypatch.setattr(modules.PeerJobLogger, "CreateEngine", lambda cn: db.create_engine(cn))
+    jobLogger = PeerJobLogger(MagicMock(), mock_db_config)
+    jobLogger.engine = MagicMock()
+    jobLogger.engine.begin.side_effect = RuntimeError("database is locked")
+    jobLogger.cleanupLogs()
+    assert "Failed to cleanup job logs: database is locked" in caplog.text
+    jobLogger.stop()
@@ -0,0 +1,207 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+import modules.PeerJobLogger
+import modules.PeerJobs
+from modules.PeerJob import PeerJob
+from modules.PeerJobs import PeerJobs
+from modules.WireguardCLI import WireguardCLI
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def jobs(wg_config, peer_row, monkeypatch):
+    monkeypatch.setattr(WireguardCLI, "run", MagicMock(return_value=b""))
+    for module in (modules.PeerJobs, modules.PeerJobLogger):
+        monkeypatch.setattr(module, "ConnectionString", lambda database: "sqlite://")
+        monkeypatch.setattr(module, "CreateEngine", lambda cn: create_engine(
+            cn, poolclass=StaticPool, connect_args={"check_same_thread": False}))
+
+    allPeerJobs = PeerJobs(wg_config.DashboardConfig, {wg_config.Name: wg_config}, MagicMock())
+    wg_config.AllPeerJobs = allPeerJobs
+    rows = [peer_row(i, total_sent=2 * GB if i < 4 else 0, total_data=2 * GB if i < 4 else 0) for i in range(2, 7)]
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), rows)
+    wg_config.getPeers()
+    return allPeerJobs, wg_config
+
+
+def _job(jobId, peer, field, operator, value, action, configuration="test_wg"):
+    return PeerJob(jobId, configuration, peer, field, operator, value, datetime.now(), None, action)
+
+
+def test_triggered_jobs_run_in_batches(jobs, monkeypatch):
+    allPeerJobs, wg = jobs
+    past = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    future = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    for job in [
+        _job("restrict-2", "peer2=", "total_data", "lgt", "1", "restrict"),
+        _job("restrict-3", "peer3=", "total_sent", "lgt", "1", "restrict"),
+        _job("restrict-4", "peer4=", "total_data", "lgt", "1", "restrict"),
+        _job("delete-5", "peer5=", "date", "lgt", past, "delete"),
+        _job("delete-6", "peer6=", "date", "lgt", future, "delete"),
+        _job("missing", "peer9=", "total_data", "lgt", "1", "restrict", configuration="wg9"),
+    ]:
+        assert allPeerJobs.saveJob(job)[0]
+
+    restrictCalls = []
+    restrictPeers = wg.restrictPeers
+    monkeypatch.setattr(wg, "restrictPeers", lambda ids: restrictCalls.append(ids) or restrictPeers(ids))
+    allPeerJobs.runJob()
+
+    assert restrictCalls == [["peer2=", "peer3="]]
+    assert sorted(wg.RestrictedPeerIndex.keys()) == ["peer2=", "peer3="]
+    assert sorted(wg.PeerIndex.keys()) == ["peer4=", "peer6="]
+    assert sorted(j.JobID for j in allPeerJobs.Jobs) == ["delete-6", "missing", "restrict-4"]
+    assert [j.JobID for j in wg.PeerIndex["peer6="].jobs] == ["delete-6"]
+
+
+def test_jobs_of_a_deleted_peer_follow_the_delete(jobs, monkeypatch):
+    allPeerJobs, wg = jobs
+    past = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    logs = []
+    log = allPeerJobs.JobLogger.log
+    monkeypatch.setattr(allPeerJobs.JobLogger, "log",
+                        lambda JobID, Status=True, Message="": logs.append((JobID, Status, Message)) or log(JobID, Status, Message))
+
+    def removed():
+        return sorted(jobId for jobId, _, message in logs if message.startswith("Job is removed"))
+
+    allPeerJobs.saveJob(_job("restrict-peer2=", "peer2=", "total_data", "lgt", "1", "restrict"))
+    allPeerJobs.saveJob(_job("delete-peer2=", "peer2=", "date", "lgt", past, "delete"))
+    logs.clear()
+    programPeers = wg._programPeers
+    monkeypatch.setattr(wg, "_programPeers", MagicMock(side_effect=RuntimeError("wg failed")))
+    allPeerJobs.runJob()
+    assert ("restrict-peer2=", False, "Peer peer2= from test_wg failed restricted.") in logs
+    assert "peer2=" in wg.PeerIndex and wg.RestrictedPeerIndex == {}
+
+    # Each job is removed once, by the delete
+    logs.clear()
+    monkeypatch.setattr(wg, "_programPeers", programPeers)
+    allPeerJobs.saveJob(_job("restrict-2", "peer2=", "total_data", "lgt", "1", "restrict"))
+    allPeerJobs.saveJob(_job("delete-2", "peer2=", "date", "lgt", past, "delete"))
+    allPeerJobs.runJob()
+    assert ("restrict-2", True, "Peer peer2= from test_wg is successfully restricted.") in logs
+    assert removed() == ["delete-2", "restrict-2"]
+    assert "peer2=" not in wg.PeerIndex and wg.RestrictedPeerIndex == {}
+    assert allPeerJobs.Jobs == []
+
+
+def test_saving_a_job_refreshes_a_restricted_peer(jobs):
+    allPeerJobs, wg = jobs
+    wg.restrictPeers(["peer5="])
+    allPeerJobs.saveJob(_job("delete-5", "peer5=", "date", "lgt", "2999-01-01 00:00:00", "delete"))
+    assert [j.JobID for j in wg.RestrictedPeerIndex["peer5="].jobs] == ["delete-5"]
+    allPeerJobs.deleteJob(allPeerJobs.searchJobById("delete-5")[0])
+    assert wg.RestrictedPeerIndex["peer5="].jobs == []
+
+
+def test_delete_jobs(jobs):
+    allPeerJobs, wg = jobs
+    for i in range(2, 5):
+        allPeerJobs.saveJob(_job(f"job-{i}", f"peer{i}=", "total_data", "lgt", "100", "restrict"))
+    assert len(wg.PeerIndex["peer2="].jobs) == 1
+    assert allPeerJobs.deleteJobs(allPeerJobs.Jobs[:2]) == (True, None)
+    assert [j.JobID for j in allPeerJobs.Jobs] == ["job-4"]
+    assert wg.PeerIndex["peer2="].jobs == []
+    assert allPeerJobs.deleteJob(_job("job-2", "peer2=", "total_data", "lgt", "100", "restrict"))[0] is False
+
+
+def test_date_jobs_run_when_due(jobs):
+    allPeerJobs, wg = jobs
+    due = datetime.now() + timedelta(seconds=0.3)
+    allPeerJobs.saveJob(_job("delete-5", "peer5=", "date", "lgt", due.isoformat(" "), "delete"))
+    allPeerJobs.saveJob(_job("delete-6", "peer6=", "date", "lgt", "2999-01-01 00:00:00", "delete"))
+    assert 0 < allPeerJobs.secondsUntilNextJob() <= 0.3
+    allPeerJobs.runDueJobs()
+    assert "peer5=" in wg.PeerIndex
+
+    # The first wait returns right away for the wake up left by saving the jobs
+    allPeerJobs.waitForNextJob(5)
+    allPeerJobs.waitForNextJob(5)
+    assert datetime.now() >= due
+    allPeerJobs.runDueJobs()
+    assert "peer5=" not in wg.PeerIndex
+    assert "peer6=" in wg.PeerIndex
+    assert allPeerJobs.secondsUntilNextJob() > 3600
+
+
+def test_data_jobs_run_for_changed_peers(jobs):
+    allPeerJobs, wg = jobs
+    allPeerJobs.saveJob(_job("restrict-4", "peer4=", "total_data", "lgt", "1", "restrict"))
+    allPeerJobs.saveJob(_job("restrict-5", "peer5=", "total_data", "lgt", "1", "restrict"))
+    # New jobs are checked once right away
+    assert allPeerJobs.secondsUntilNextJob() == 0
+    allPeerJobs.runDueJobs()
+    assert allPeerJobs.secondsUntilNextJob() is None
+    assert wg.RestrictedPeerIndex == {}
+
+    with wg.engine.begin() as conn:
+        conn.execute(wg.peersTable.update().values(total_data=2 * GB, total_sent=2 * GB))
+    allPeerJobs.runPeerJobs("test_wg", ["peer4="])
+    assert list(wg.RestrictedPeerIndex.keys()) == ["peer4="]
+    assert [j.JobID for j in allPeerJobs.Jobs] == ["restrict-5"]
+
+
+def test_sooner_job_wakes_the_scheduler(jobs):
+    allPeerJobs, wg = jobs
+    allPeerJobs.saveJob(_job("delete-6", "peer6=", "date", "lgt", "2999-01-01 00:00:00", "delete"))
+    allPeerJobs.runDueJobs()
+    allPeerJobs.waitForNextJob(0)
+    timer = threading.Timer(0.1, lambda: allPeerJobs.saveJob(_job("restrict-4", "peer4=", "total_data", "lgt", "1", "restrict")))
+    timer.start()
+    start = time.time()
+    allPeerJobs.waitForNextJob(5)
+    assert 0.05 < time.time() - start < 2
+    timer.join()
+
+
+def test_stop_wakes_the_scheduler(jobs):
+    allPeerJobs, wg = jobs
+    allPeerJobs.waitForNextJob(0)
+    timer = threading.Timer(0.1, allPeerJobs.stop)
+    timer.start()
+    start = time.time()
+    allPeerJobs.waitForNextJob(60)
+    assert time.time() - start < 2
+    timer.join()
+    start = time.time()
+    allPeerJobs.waitForNextJob(60)
+    assert time.time() - start < 0.5
+
+
+def test_date_jobs_are_checked_again_once_the_date_passes(jobs):
+    allPeerJobs, wg = jobs
+    date = datetime.now() + timedelta(hours=2)
+    allPeerJobs.saveJob(_job("delete-5", "peer5=", "date", "eq", date.isoformat(" "), "delete"))
+    allPeerJobs.runDueJobs()
+    assert "peer5=" in wg.PeerIndex
+    assert 7200 < allPeerJobs.secondsUntilNextJob() <= 7201
+
+
+def test_job_index(jobs):
+    allPeerJobs, wg = jobs
+    allPeerJobs.saveJob(_job("job-2", "peer2=", "total_data", "lgt", "100", "restrict"))
+    allPeerJobs.saveJob(_job("job-3", "peer2=", "date", "lgt", "2999-01-01 00:00:00", "delete"))
+    assert sorted(j.JobID for j in allPeerJobs.searchJob("test_wg", "peer2=")) == ["job-2", "job-3"]
+
+    # Updating keeps the peer and creation date of the saved job
+    created = allPeerJobs.searchJobById("job-2")[0].CreationDate
+    allPeerJobs.saveJob(_job("job-2", "peer5=", "total_data", "lgt", "200", "restrict"))
+    updated = allPeerJobs.searchJobById("job-2")[0]
+    assert (updated.Peer, updated.Value, updated.CreationDate) == ("peer2=", "200", created)
+    assert len(allPeerJobs.searchJob("test_wg", "peer2=")) == 2
+    assert allPeerJobs.searchJob("test_wg", "peer5=") == []
+
+    allPeerJobs.deleteJob(updated)
+    assert [j.JobID for j in allPeerJobs.searchJob("test_wg", "peer2=")] == ["job-3"]
+    assert [j.JobID for j in wg.PeerIndex["peer2="].jobs] == ["job-3"]
+    assert allPeerJobs.searchJobById("job-2") == []
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def wg_config(wg_config, peer_row):
+    rows = [peer_row(i, id=f"peer{i:03d}=", name=f"Peer {i % 7}", total_data=i * 10,
+                     status="running" if i % 3 == 0 else "stopped") for i in range(40)]
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), rows[:30])
+        conn.execute(wg_config.peersRestrictedTable.insert(), rows[30:])
+    wg_config.getPeers()
+    return wg_config
+
+
+def _walk(wg, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = wg.queryPeers(limit=7, cursor=cursor, **kwargs)
+        pages.append([p.id for p in page["peers"] + page["restrictedPeers"]])
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return pages, page
+
+
+def test_keyset_pages_cover_every_peer_once(wg_config):
+    pages, page = _walk(wg_config, sort="total_data", descending=True)
+    assert [sorted(p, reverse=True) for p in pages] == [
+        [f"peer{i:03d}=" for i in reversed(range(max(0, 33 - 7 * n), 40 - 7 * n))] for n in range(6)
+    ]
+    assert page["totalPeers"] == 30
+    assert page["totalRestrictedPeers"] == 10
+
+    # Ties on the sort key are broken by public key
+    pages, _ = _walk(wg_config, sort="name")
+    ids = [i for p in pages for i in p]
+    assert len(ids) == len(set(ids)) == 40
+    assert sorted(pages[0]) == sorted([f"peer{i:03d}=" for i in range(0, 40, 7)] + ["peer001="])
+
+
+def test_search_and_status_filters(wg_config):
+    page = wg_config.queryPeers(search="10.0.0.2", status="stopped")
+    assert [p.id for p in page["peers"]] == [f"peer{i:03d}=" for i in (28, 22, 29, 2, 23, 25, 26, 20)]
+    assert page["totalPeers"] == 8
+    running = wg_config.queryPeers(status="running", limit=100)
+    assert {p.status for p in running["peers"]} == {"running"}
+    assert running["restrictedPeers"] == []
+    assert running["totalPeers"] == 10
+    restricted = wg_config.queryPeers(status="restricted", search="Peer 1")
+    assert [p.id for p in restricted["restrictedPeers"]] == ["peer036="]
+    assert restricted["totalPeers"] == 0
+    assert restricted["totalRestrictedPeers"] == 1
+    # LIKE wildcards in the search string are matched literally
+    assert wg_config.queryPeers(search="%")["totalPeers"] == 0
+
+
+def test_registry_peers_are_reused(wg_config):
+    page = wg_config.queryPeers(sort="status", limit=5)
+    assert all(p is wg_config.PeerIndex[p.id] for p in page["peers"])
+
+
+def test_latest_handshake_orders_by_age(wg_config):
+    now = int(time.time())
+    ages = {"peer001=": 5, "peer002=": 600, "peer003=": 36000, "peer004=": 93600}
+    with wg_config.engine.begin() as conn:
+        for peerId, age in ages.items():
+            conn.execute(wg_config.peersTable.update().where(wg_config.peersTable.c.id == peerId).values(latest_handshake_at=now - age))
+    page = wg_config.queryPeers(sort="latest_handshake", limit=4)
+    assert [p.id for p in page["peers"]] == list(ages.keys())
+
+
+def test_invalid_arguments(wg_config):
+    with pytest.raises(ValueError):
+        wg_config.queryPeers(sort="endpoint")
+    with pytest.raises(ValueError):
+        wg_config.queryPeers(status="sleeping")
+    with pytest.raises(ValueError):
+        wg_config.queryPeers(cursor="not a cursor")
@@ -0,0 +1,61 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import modules.PeerShareLinks
+from modules.PeerShareLinks import PeerShareLinks
+
+
+@pytest.fixture
+def links(monkeypatch):
+    mock_db_config = MagicMock()
+    mock_db_config.GetConfig.side_effect = lambda section, key: (True, "sqlite") if section == "Database" else (True, "")
+    monkeypatch.setattr(modules.PeerShareLinks, "ConnectionString", lambda database: "sqlite://")
+    monkeypatch.setattr(modules.PeerShareLinks, "CreateEngine", lambda cn: create_engine(cn, poolclass=StaticPool))
+    peer = MagicMock()
+    configuration = MagicMock()
+    configuration.searchAnyPeer.return_value = (True, peer)
+    return PeerShareLinks(mock_db_config, {"wg0": configuration}), peer
+
+
+def test_add_link_replaces_active_link(links):
+    allLinks, peer = links
+    status, first = allLinks.addLink("wg0", "peer1=")
+    assert status
+    assert [l.ShareID for l in allLinks.getLink("wg0", "peer1=")] == [first]
+    assert allLinks.getLinkByID(first)[0].ExpireDate == datetime(2199, 12, 31)
+
+    status, second = allLinks.addLink("wg0", "peer1=", datetime.now() + timedelta(days=1))
+    assert [l.ShareID for l in allLinks.getLink("wg0", "peer1=")] == [second]
+    assert allLinks.getLinkByID(first) == []
+    assert allLinks.getLink("wg0", "peer2=") == []
+    assert peer.getShareLink.call_count == 2
+
+
+def test_update_expire_date(links):
+    allLinks, _ = links
+    _, shareId = allLinks.addLink("wg0", "peer1=")
+    expireDate = (datetime.now() + timedelta(days=1)).replace(microsecond=0)
+    assert allLinks.updateLinkExpireDate(shareId, expireDate) == (True, "")
+    assert allLinks.getLinkByID(shareId)[0].ExpireDate == expireDate
+    assert len(allLinks.Links) == 1
+
+    allLinks.updateLinkExpireDate(shareId, datetime.now() - timedelta(seconds=1))
+    assert allLinks.getLink("wg0", "peer1=") == []
+    assert allLinks.getLinkByID(shareId) == []
+    assert allLinks.Links == []
+
+
+def test_expired_link_is_not_indexed(links):
+    allLinks, _ = links
+    status, shareId = allLinks.addLink("wg0", "peer1=", datetime.now() - timedelta(days=1))
+    assert status
+    assert allLinks.Links == []
+    assert allLinks.getLinkByID(shareId) == []
@@ -0,0 +1,67 @@
+import gzip
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from flask import Flask, Response
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.DashboardJSONProvider import DashboardJSONProvider, JSONBackend
+from modules.ResponseCompression import ResponseCompression
+
+
+class Row:
+    def __init__(self, i):
+        self.id = f"peer{i}="
+        self.total_data = i / 3
+        self.date = datetime(2024, 5, 6, 7, 8, 9, 123456)
+
+    def toJson(self):
+        return self.__dict__
+
+
+@pytest.fixture
+def app():
+    app = Flask("test")
+    app.json = DashboardJSONProvider(app)
+    ResponseCompression(app)
+
+    @app.get("/peers/<int:count>")
+    def peers(count):
+        return app.json.response({"status": True, "data": [Row(i) for i in range(count)]})
+
+    @app.get("/stream")
+    def stream():
+        return Response((str(i) * 2048 for i in range(3)), mimetype="text/event-stream")
+
+    return app
+
+
+@pytest.mark.parametrize("backend", ["json", JSONBackend])
+def test_matches_the_previous_encoder(app, backend):
+    app.json.Backend = backend
+    payload = {"b": [Row(1)], "a": datetime(2024, 1, 2, 3, 4, 5), "c": {7: 2 ** 80}}
+    assert json.loads(app.json.dumps(payload)) == {
+        "a": "2024-01-02 03:04:05", "c": {"7": 2 ** 80},
+        "b": [{"id": "peer1=", "total_data": 1 / 3, "date": "2024-05-06 07:08:09"}]
+    }
+    assert app.json.loads(b'{"a": [1, 2]}') == {"a": [1, 2]}
+    with pytest.raises(TypeError):
+        app.json.dumps({"a": object()})
+
+
+def test_negotiates_compression(app):
+    client = app.test_client()
+    response = client.get("/peers/200", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(json.loads(gzip.decompress(response.data))["data"]) == 200
+
+    assert "Content-Encoding" not in client.get("/peers/200").headers
+    assert "Content-Encoding" not in client.get("/peers/200", headers={"Accept-Encoding": "gzip;q=0"}).headers
+    # Small and streamed responses are left alone
+    assert "Content-Encoding" not in client.get("/peers/1", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/stream", headers={"Accept-Encoding": "gzip"}).headers
@@ -0,0 +1,55 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from modules.TrackingTableExport import TrackingTableExport
+from modules.WireguardConfiguration import WireguardConfiguration
+
+
+@pytest.fixture
+def wg_config(wg_config):
+    start = datetime(2024, 1, 1)
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTransferTable.insert(), [{
+            "id": f"peer{i % 3}=", "total_receive": i, "total_sent": i, "total_data": 2 * i,
+            "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0, "time": start + timedelta(hours=12 * i)
+        } for i in range(10)])
+    return wg_config
+
+
+def test_filters(wg_config, monkeypatch):
+    monkeypatch.setattr(WireguardConfiguration, "STREAM_BATCH_SIZE", 2)
+    assert len(list(wg_config.streamTransferTable())) == 10
+    rows = list(wg_config.streamTransferTable(["peer1=", "peer2="], datetime(2024, 1, 2), datetime(2024, 1, 4)))
+    assert sorted((r["total_receive"], r["id"]) for r in rows) == [(2, "peer2="), (4, "peer1="), (5, "peer2=")]
+
+
+def test_formats(wg_config):
+    columns = wg_config.peersTransferTable.columns.keys()
+    export = TrackingTableExport(columns, wg_config.streamTransferTable(["peer0="]), "csv")
+    lines = list(csv.reader(io.StringIO(b"".join(export).decode())))
+    assert lines[0] == columns
+    assert lines[1] == ["peer0=", "0", "0", "0", "0", "0", "0", "2024-01-01 00:00:00"]
+    assert len(lines) == 5
+
+    export = TrackingTableExport(columns, wg_config.streamTransferTable(["peer0="]), "ndjson", compress=True)
+    assert export.mimetype == "application/gzip"
+    assert export.filename("test_wg_TrafficTrackingTable") == "test_wg_TrafficTrackingTable.ndjson.gz"
+    lines = gzip.decompress(b"".join(export)).decode().splitlines()
+    assert [json.loads(line)["total_data"] for line in lines] == [0, 6, 12, 18]
+    assert json.loads(lines[1])["time"] == "2024-01-02 12:00:00"
+
+    with pytest.raises(ValueError):
+        TrackingTableExport(columns, [], "xml")
+
+
+def test_chunks(monkeypatch):
+    monkeypatch.setattr(TrackingTableExport, "CHUNK_SIZE", 100)
+    rows = ({"id": f"peer{i}=", "value": i} for i in range(100))
+    chunks = list(TrackingTableExport(["id", "value"], rows, "csv"))
+    assert len(chunks) > 10
+    assert b"".join(chunks).decode().splitlines()[-1] == "peer99=,99"
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import MetaData, select, func
+
+
+@pytest.fixture
+def dashboard_settings(dashboard_settings):
+    return {**dashboard_settings, ("Peers", "peer_traffic_raw_retention_days"): "2"}
+
+
+def _logSamples(wg, start, minutes, peers=("peerA=", "peerB=")):
+    rows = []
+    for m in range(minutes):
+        for n, peer in enumerate(peers):
+            total = (m + 1) * (n + 1) * 10
+            rows.append({
+                "id": peer, "time": start + timedelta(minutes=m),
+                "total_receive": total, "total_sent": total, "total_data": total * 2,
+                "cumu_receive": 0, "cumu_sent": 0, "cumu_data": 0
+            })
+    with wg.engine.begin() as conn:
+        conn.execute(wg.peersTransferTable.insert(), rows)
+
+
+def _count(wg, table, peer="peerA="):
+    with wg.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table).where(table.c.id == peer)).scalar()
+
+
+def test_rollup_buckets_and_retention(wg_config):
+    now = datetime.now()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=5)
+    _logSamples(wg_config, start, 5 * 24 * 60)
+
+    wg_config.rollupPeersTraffic()
+    wg_config.rollupPeersTraffic()
+
+    fine = wg_config.peersTransferRollupTables["5m"]
+    hourly = wg_config.peersTransferRollupTables["1h"]
+    daily = wg_config.peersTransferRollupTables["1d"]
+    assert _count(wg_config, fine) == 5 * 24 * 12
+    assert _count(wg_config, hourly) == 5 * 24
+    assert _count(wg_config, daily) == 5
+
+    with wg_config.engine.connect() as conn:
+        first = conn.execute(select(fine).where(fine.c.id == "peerB=").order_by(fine.c.time)).mappings().first()
+        firstDay = conn.execute(select(daily).where(daily.c.id == "peerA=").order_by(daily.c.time)).mappings().first()
+        oldestRaw = conn.execute(select(func.min(wg_config.peersTransferTable.c.time))).scalar()
+    # Each bucket keeps the last sample taken inside it
+    assert first["time"] == start
+    assert first["total_receive"] == 5 * 2 * 10
+    assert firstDay["time"] == start
+    assert firstDay["total_data"] == 24 * 60 * 10 * 2
+    # Raw rows older than the retention are gone, newer ones are kept
+    assert oldestRaw >= now - timedelta(days=2, minutes=1)
+
+
+def test_traffics_pick_coarsest_resolution(wg_config):
+    now = datetime.now()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=5)
+    _logSamples(wg_config, start, 5 * 24 * 60 + int((now - start - timedelta(days=5)).total_seconds() // 60))
+    wg_config.rollupPeersTraffic()
+
+    recent = wg_config.getPeerTransferHistory("peerA=", now - timedelta(minutes=30), now)
+    assert 29 <= len(recent) <= 31
+
+    day = wg_config.getPeerTransferHistory("peerA=", start + timedelta(days=1), start + timedelta(days=2))
+    assert len(day) == 24 * 12 + 1
+    assert all(r["time"].minute % 5 == 0 for r in day)
+
+    week = wg_config.getPeerTransferHistory("peerA=", start, now)
+    times = [r["time"] for r in week]
+    assert times == sorted(times)
+    # Hourly buckets up to the last complete hour, then the finer levels for the rest
+    hourly = [t for t in times if t.minute == 0 and t < now.replace(minute=0, second=0, microsecond=0)]
+    assert len(hourly) >= 5 * 24
+    assert len(week) < 5 * 24 + 12 + 60
+    assert week[-1]["total_receive"] == recent[-1]["total_receive"]
+
+
+def test_old_short_range_uses_a_level_that_still_holds_it(wg_config):
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=40)
+    _logSamples(wg_config, start, 3 * 60)
+    wg_config.rollupPeersTraffic()
+    assert _count(wg_config, wg_config.peersTransferRollupTables["5m"]) == 0
+
+    history = wg_config.getPeerTransferHistory("peerA=", start, start + timedelta(hours=2))
+    assert [r["time"] for r in history] == [start + timedelta(hours=h) for h in range(3)]
+
+
+def test_sessions_fall_back_to_rollup(wg_config):
+    now = datetime.now()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=5)
+    _logSamples(wg_config, start, 60)
+    wg_config.rollupPeersTraffic()
+
+    assert _count(wg_config, wg_config.peersTransferTable) == 0
+    times = wg_config.getPeerSessionTimes("peerA=", start, start + timedelta(days=1))
+    assert times == [start + timedelta(minutes=5 * i) for i in range(12)]
+
+
+def test_tracking_indexes_migration(engine, MockWGConfig):
+    """Existing databases without indexes get them once, and lookups by peer use them."""
+    from sqlalchemy import Table, Column, String, DateTime, BigInteger, inspect, text
+    legacy = MetaData()
+    Table("test_wg_transfer", legacy, Column("id", String(255), nullable=False), Column("total_receive", BigInteger),
+          Column("total_sent", BigInteger), Column("total_data", BigInteger), Column("cumu_receive", BigInteger),
+          Column("cumu_sent", BigInteger), Column("cumu_data", BigInteger), Column("time", DateTime))
+    Table("test_wg_history_endpoint", legacy, Column("id", String(255), nullable=False),
+          Column("endpoint", String(255), nullable=False), Column("time", DateTime))
+    legacy.create_all(engine)
+
+    MockWGConfig()
+    MockWGConfig()
+
+    inspector = inspect(engine)
+    assert {i["name"] for i in inspector.get_indexes("test_wg_transfer")} == {"ix_test_wg_transfer_id_time", "ix_test_wg_transfer_time"}
+    assert [i["name"] for i in inspector.get_indexes("test_wg_history_endpoint")] == ["ix_test_wg_history_endpoint_id_endpoint"]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM wgd_migrations WHERE id = 'tracking_indexes_v1_test_wg'")).scalar() == 1
+        plan = conn.execute(text("EXPLAIN QUERY PLAN SELECT time FROM test_wg_transfer WHERE id = 'a' AND time >= '2024-01-01'")).fetchall()
+    assert "ix_test_wg_transfer_id_time" in " ".join(str(r) for r in plan)
+
+
+def test_history_endpoints_logged_once(wg_config):
+    """Only new (peer, endpoint) pairs are written, in one executemany, across repeated polls."""
+    from types import SimpleNamespace
+    from sqlalchemy import event
+    table = wg_config.peersHistoryEndpointTable
+    with wg_config.engine.begin() as conn:
+        conn.execute(table.insert().values(id="peerA=", endpoint="1.1.1.1", time=datetime.now()))
+    wg_config.Peers = [
+        SimpleNamespace(id="peerA=", status="running", endpoint="1.1.1.1:51820"),
+        SimpleNamespace(id="peerB=", status="running", endpoint="2.2.2.2:51820"),
+        SimpleNamespace(id="peerC=", status="running", endpoint="[2001:db8::1]:51820"),
+        SimpleNamespace(id="peerD=", status="stopped", endpoint="4.4.4.4:51820"),
+        SimpleNamespace(id="peerE=", status="running", endpoint="(none)"),
+    ]
+    statements = []
+    event.listen(wg_config.engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement))
+
+    wg_config.logPeersHistoryEndpoint()
+    wg_config.logPeersHistoryEndpoint()
+    wg_config.Peers[0].endpoint = "5.5.5.5:1234"
+    wg_config.logPeersHistoryEndpoint()
+
+    inserts = [s for s in statements if s.startswith("INSERT")]
+    assert len(inserts) == 2
+    assert len([s for s in statements if s.startswith("SELECT")]) == 1
+    with wg_config.engine.connect() as conn:
+        rows = sorted(conn.execute(select(table.c.id, table.c.endpoint)).tuples())
+    assert rows == [("peerA=", "1.1.1.1"), ("peerA=", "5.5.5.5"), ("peerB=", "2.2.2.2"), ("peerC=", "[2001:db8::1]")]
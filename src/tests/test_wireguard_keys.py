@@ -0,0 +1,100 @@
+import base64
+import binascii
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules import WireguardKeys
+from modules.WireguardCLI import WireguardCLI
+from modules.Utilities import GenerateWireguardPrivateKey, GenerateWireguardPublicKey, GenerateWireguardKeyPairs
+
+
+def test_x25519_rfc7748_vectors():
+    """Verify the pure-Python ladder against the RFC 7748 section 5.2 and 6.1 vectors."""
+    scalar = binascii.unhexlify("a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4")
+    u = binascii.unhexlify("e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c")
+    assert WireguardKeys.X25519(scalar, u).hex() == "c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552"
+
+    alice = binascii.unhexlify("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+    bob = binascii.unhexlify("5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb")
+    alicePublic = base64.b64decode(WireguardKeys.GeneratePublicKey(base64.b64encode(alice).decode()))
+    bobPublic = base64.b64decode(WireguardKeys.GeneratePublicKey(base64.b64encode(bob).decode()))
+    assert alicePublic.hex() == "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a"
+    assert bobPublic.hex() == "de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f"
+    assert WireguardKeys.X25519(alice, bobPublic) == WireguardKeys.X25519(bob, alicePublic)
+
+
+def test_cswap_selects_without_branching():
+    a, b = 2 ** 254 + 3, 7
+    assert WireguardKeys._cswap(0, a, b) == (a, b)
+    assert WireguardKeys._cswap(1, a, b) == (b, a)
+
+
+def test_keys_match_wg_format(monkeypatch):
+    """Generated keys are clamped 32 byte base64 strings, the same as `wg genkey` / `wg pubkey`."""
+    def fail(*args, **kwargs):
+        raise AssertionError("wg should not be called when the native backend works")
+    monkeypatch.setattr(WireguardCLI, "run", fail)
+
+    status, privateKey = GenerateWireguardPrivateKey()
+    assert status
+    raw = base64.b64decode(privateKey)
+    assert len(privateKey) == 44 and len(raw) == 32
+    assert raw[0] & 7 == 0 and raw[31] & 128 == 0 and raw[31] & 64 == 64
+
+    status, publicKey = GenerateWireguardPublicKey(privateKey)
+    assert status and len(base64.b64decode(publicKey)) == 32
+    assert GenerateWireguardPublicKey("not a key") == (False, None)
+
+    status, pairs = GenerateWireguardKeyPairs(5)
+    assert status and len(pairs) == 5
+    assert len({p[0] for p in pairs}) == 5
+    for privateKey, publicKey in pairs:
+        assert WireguardKeys.GeneratePublicKey(privateKey) == publicKey
+
+
+def test_falls_back_to_wg(monkeypatch):
+    """When the native backend is unusable the `wg` subprocess is used instead."""
+    def broken(*args, **kwargs):
+        raise RuntimeError("backend unavailable")
+    monkeypatch.setattr(WireguardKeys, "GeneratePrivateKey", broken)
+    monkeypatch.setattr(WireguardKeys, "GeneratePublicKey", broken)
+    monkeypatch.setattr(WireguardKeys, "GenerateKeyPairs", broken)
+
+    commands = []
+    def mock_run(cmd, timeout=10, input=None):
+        commands.append(cmd)
+        return b"private\n" if "genkey" in cmd else b"public\n"
+    monkeypatch.setattr(WireguardCLI, "run", mock_run)
+
+    assert GenerateWireguardPrivateKey() == (True, "private")
+    assert GenerateWireguardPublicKey("private") == (True, "public")
+    assert GenerateWireguardKeyPairs(2) == (True, [("private", "public"), ("private", "public")])
+    assert ["wg", "genkey"] in commands and ["wg", "pubkey"] in commands
+
+
+def test_pure_python_ladder_is_the_last_resort(monkeypatch):
+    """Without cryptography, wg derives public keys and the ladder only runs when wg is missing."""
+    alice = "dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo="
+    alicePublic = "hSDwCYkwp1R0i33ctD73Wg2/Og0mOBr066SpjqqbTmo="
+    monkeypatch.setattr(WireguardKeys, "KeyBackend", "python")
+    monkeypatch.setattr(WireguardKeys, "X25519PrivateKey", None)
+    monkeypatch.setattr(WireguardCLI, "run", lambda cmd, timeout=10, input=None: b"public\n")
+    assert GenerateWireguardPublicKey(alice) == (True, "public")
+
+    def missing(*args, **kwargs):
+        raise FileNotFoundError("wg")
+    monkeypatch.setattr(WireguardCLI, "run", missing)
+    assert GenerateWireguardPublicKey(alice) == (True, alicePublic)
+    assert GenerateWireguardPublicKey("not a key") == (False, None)
+
+
+def test_fallback_is_logged(monkeypatch, caplog):
+    import importlib.util
+    monkeypatch.setitem(sys.modules, "cryptography.hazmat.primitives.asymmetric.x25519", None)
+    spec = importlib.util.spec_from_file_location("WireguardKeysFallback", WireguardKeys.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.KeyBackend == "python"
+    assert "cryptography is not installed" in caplog.text
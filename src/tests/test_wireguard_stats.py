@@ -0,0 +1,145 @@
+import time
+
+import pytest
+from sqlalchemy import event, select
+
+from modules.WireguardCLI import WireguardCLI, NetlinkStatsBackend, DumpStatsBackend
+
+
+class FakeNla(dict):
+    """Mimics the get_attr() interface of pyroute2 netlink messages"""
+    def get_attr(self, name):
+        return self.get(name)
+
+
+def fakePeer(publicKey, addr=None, port=51820, handshake=None, rx=0, tx=0):
+    peer = FakeNla({
+        "WGPEER_A_PUBLIC_KEY": publicKey.encode(),
+        "WGPEER_A_RX_BYTES": rx,
+        "WGPEER_A_TX_BYTES": tx
+    })
+    if addr is not None:
+        peer["WGPEER_A_ENDPOINT"] = {"addr": addr, "port": port}
+    if handshake is not None:
+        peer["WGPEER_A_LAST_HANDSHAKE_TIME"] = {"tv_sec": handshake, "tv_nsec": 0}
+    return peer
+
+
+class FakeNetlinkSocket:
+    def __init__(self, messages):
+        self.messages = messages
+        self.requests = []
+
+    def info(self, interface):
+        self.requests.append(interface)
+        if interface not in self.messages:
+            raise OSError(19, "No such device")
+        return self.messages[interface]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_netlink(monkeypatch):
+    """Install a netlink backend whose socket serves canned WG_CMD_GET_DEVICE replies."""
+    now = int(time.time())
+    # Large devices are split across several dump messages
+    messages = {"test_wg": [
+        FakeNla({"WGDEVICE_A_PEERS": [
+            fakePeer("peerA=", "1.2.3.4", 1234, now, 100, 200),
+            fakePeer("peerB=", "2001:db8::1", 51820, now - 600, 5, 6),
+        ]}),
+        FakeNla({"WGDEVICE_A_PEERS": [fakePeer("peerC=")]})
+    ]}
+    sock = FakeNetlinkSocket(messages)
+    backend = NetlinkStatsBackend(socketFactory=lambda: sock)
+    monkeypatch.setattr(WireguardCLI, "StatsBackend", backend)
+
+    def fail_run(*args, **kwargs):
+        raise AssertionError("wg should not be spawned when netlink answers")
+    monkeypatch.setattr(WireguardCLI, "run", fail_run)
+    return sock, now
+
+
+def test_netlink_parse_matches_dump(fake_netlink):
+    sock, now = fake_netlink
+    stats = WireguardCLI.peerStats("wg", "test_wg")
+    assert stats == [
+        ("peerA=", "1.2.3.4:1234", now, 100, 200),
+        ("peerB=", "[2001:db8::1]:51820", now - 600, 5, 6),
+        ("peerC=", "(none)", 0, 0, 0),
+    ]
+    dump = "\n".join([
+        "privkey=\tpubkey=\t51820\toff",
+        f"peerA=\t(none)\t1.2.3.4:1234\t10.0.0.2/32\t{now}\t100\t200\toff",
+        f"peerB=\t(none)\t[2001:db8::1]:51820\t10.0.0.3/32\t{now - 600}\t5\t6\t25",
+        "peerC=\t(none)\t(none)\t10.0.0.4/32\t0\t0\t0\toff",
+    ]).encode()
+    assert DumpStatsBackend.parse(dump) == stats
+
+
+def test_falls_back_to_dump(monkeypatch):
+    attempts = []
+
+    def broken_factory():
+        attempts.append(1)
+        raise OSError(2, "Generic netlink protocol wireguard not found")
+    monkeypatch.setattr(WireguardCLI, "StatsBackend", NetlinkStatsBackend(socketFactory=broken_factory))
+    commands = []
+
+    def mock_run(cmd, timeout=10, input=None):
+        commands.append(cmd)
+        return b"privkey=\tpubkey=\t51820\toff\npeerA=\t(none)\t(none)\t10.0.0.2/32\t0\t7\t8\toff\n"
+    monkeypatch.setattr(WireguardCLI, "run", mock_run)
+
+    assert WireguardCLI.peerStats("wg", "wg0") == [("peerA=", "(none)", 0, 7, 8)]
+    assert WireguardCLI.peerStats("wg", "wg0") == [("peerA=", "(none)", 0, 7, 8)]
+    # A missing family disables netlink instead of retrying every poll
+    assert len(attempts) == 1
+    assert WireguardCLI.peerStats("awg", "awg0") == [("peerA=", "(none)", 0, 7, 8)]
+    assert commands == [["wg", "show", "wg0", "dump"]] * 2 + [["awg", "show", "awg0", "dump"]]
+
+
+@pytest.fixture
+def wg_config(wg_config, peer_row):
+    with wg_config.engine.begin() as conn:
+        conn.execute(wg_config.peersTable.insert(), [peer_row(key, endpoint="(none)", allowed_ip="10.0.0.2/32") for key in "ABC"])
+    wg_config.getPeers()
+    return wg_config
+
+
+def test_update_peers_data_from_netlink(fake_netlink, wg_config):
+    sock, now = fake_netlink
+
+    wg_config.updatePeersData()
+
+    assert sock.requests == ["test_wg"]
+    assert wg_config.PeerIndex["peerA="].status == "running"
+    assert wg_config.PeerIndex["peerA="].total_data == 300
+    assert wg_config.PeerIndex["peerA="].endpoint == "1.2.3.4:1234"
+    assert wg_config.PeerIndex["peerB="].status == "stopped"
+    assert wg_config.PeerIndex["peerC="].latest_handshake == "No Handshake"
+    with wg_config.engine.connect() as conn:
+        row = conn.execute(wg_config.peersTable.select().where(wg_config.peersTable.c.id == "peerB=")).mappings().fetchone()
+    assert row["endpoint"] == "[2001:db8::1]:51820"
+    assert row["total_data"] == 11
+
+
+def test_idle_peers_are_not_rewritten(fake_netlink, wg_config):
+    sock, now = fake_netlink
+    wg_config.updatePeersData()
+    version = wg_config.Version
+    age = wg_config.PeerIndex["peerB="].latest_handshake
+    assert age.startswith("0:10:")
+
+    statements = []
+    event.listen(wg_config.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    time.sleep(1.1)
+    assert wg_config.updatePeersData() == []
+    assert statements == []
+    assert wg_config.Version == version
+    # The age is derived from the handshake time, not stored on every poll
+    assert wg_config.PeerIndex["peerB="].latest_handshake > age
+    with wg_config.engine.connect() as conn:
+        assert conn.execute(select(wg_config.peersTable.c.latest_handshake_at).where(wg_config.peersTable.c.id == "peerB=")).scalar() == now - 600